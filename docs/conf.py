@@ -28,6 +28,7 @@ author = 'Hong Xu'
 
 rst_epilog = """
 .. _pytest: https://www.pytest.org
+.. _pytest-xdist: https://pypi.org/project/pytest-xdist/
 .. _CPython: https://github.com/python/cpython
 """
 
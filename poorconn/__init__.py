@@ -15,7 +15,43 @@
 
 "The main package of Poorconn. It contains functions that simulate Poor Network Conditions."
 
-from ._accept import close_upon_acceptance
+from ._accept import (close_upon_acceptance,
+                      CloseUponAcceptanceController,
+                      delay_acceptance,
+                      DelayAcceptanceController,
+                      limit_acceptance_rate,
+                      limit_backlog,
+                      LimitAcceptanceRateController,
+                      LimitBacklogController)
+from ._bottleneck import (BottleneckController,
+                          send_through_bottleneck,
+                          send_through_bottleneck_upon_acceptance)
+from ._clock import (Clock,
+                     get_clock,
+                     Pacer,
+                     set_clock,
+                     SpinClock,
+                     TimerfdClock,
+                     use_clock,
+                     VirtualClock)
+from ._controller import Controller
+from ._datagram import (delay_datagrams,
+                        DelayDatagramsController,
+                        drop_datagrams,
+                        DropDatagramsController,
+                        duplicate_datagrams,
+                        DuplicateDatagramsController,
+                        reorder_datagrams,
+                        ReorderDatagramsController)
+from ._http import FileCache, HTTPRequestHandler, slow_down_http_responses, SlowDownHTTPResponsesController
+from ._install import install, InstallController
+from ._link import simulated_socketpair, SimulatedSocket
+from ._profile import get_profile, Profile, ProfileController, profiles
+from ._proxy import (ProxyController,
+                     simulate_upon_acceptance,
+                     SimulateUponAcceptanceController,
+                     Simulation,
+                     start_proxy)
 from ._send import (DelayBeforeSendingController,
                     DelayBeforeSendingOnceController,
                     DelayBeforeSendingUponAcceptanceController,
@@ -23,7 +59,22 @@ from ._send import (DelayBeforeSendingController,
                     delay_before_sending,
                     delay_before_sending_once,
                     delay_before_sending_upon_acceptance,
-                    delay_before_sending_upon_acceptance_once)
+                    delay_before_sending_upon_acceptance_once,
+                    limit_link_rate,
+                    limit_link_rate_upon_acceptance,
+                    LimitLinkRateController,
+                    LimitLinkRateUponAcceptanceController)
+from ._slow_start import (emulate_slow_start,
+                          emulate_slow_start_upon_acceptance,
+                          EmulateSlowStartController,
+                          EmulateSlowStartUponAcceptanceController)
 from ._socket import make_socket_patchable, PatchableSocket
+from ._stats import percentile, summarize
+from ._tls import delay_tls_handshake, DelayTLSHandshakeController
+from ._transit import (delay_in_transit,
+                       delay_in_transit_upon_acceptance,
+                       DelayInTransitController,
+                       DelayInTransitUponAcceptanceController,
+                       DelayLineController)
 
 from ._version import version as __version__
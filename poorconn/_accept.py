@@ -15,24 +15,251 @@
 
 from __future__ import annotations
 
+import select
+import socket as _socket_module
 from socket import socket, SHUT_RDWR
-from typing import Any, Sequence
+import struct
+import threading
+from typing import Any, Optional, Sequence
 
-from ._wrappers import wrap_accept
+from ._controller import Controller
+from ._wrappers import wrap, wrap_accept
 
 
-def close_upon_acceptance(s: socket) -> None:
+class CloseUponAcceptanceController(Controller):
+    """Controller for :func:`.close_upon_acceptance`. Objects are always created and returned by
+    :func:`.close_upon_acceptance` and should not be created outside the :mod:`poorconn` package.
+
+    .. versionadded:: 0.3
+    """
+
+    __slots__ = ()
+
+
+def close_upon_acceptance(s: socket) -> CloseUponAcceptanceController:
     """Shutdown and close the connection socket upon accepting.
 
     :param s: The :class:`socket.socket` object whose ``accept()`` function is to be wrapped.
 
+    :return: A :class:`CloseUponAcceptanceController` object that controls the patched socket object.
+
     .. versionchanged:: 0.2
        Renamed from ``close_upon_accepting``.
+
+    .. versionchanged:: 0.3
+       Return a controller.
     """
 
+    controller = CloseUponAcceptanceController()
+
     def after(s: socket, *, original: Sequence, before: Any) -> Any:
         original[0].shutdown(SHUT_RDWR)
         original[0].close()
         return original
 
-    wrap_accept(s, after=after)
+    controller._wrappings.append(wrap_accept(s, after=after))
+
+    return controller
+
+
+class DelayAcceptanceController(Controller):
+    """Controller for :func:`.delay_acceptance`. Objects are always created and returned by :func:`.delay_acceptance`
+    and should not be created outside the :mod:`poorconn` package.
+
+    :param t: Same as ``t`` in :func:`delay_acceptance`.
+    """
+
+    __slots__ = (
+        't',
+    )
+
+    def __init__(self, t: float):
+        super().__init__()
+        self.t: float = t
+        """Same as ``t`` in :func:`delay_acceptance`. Updating it in the controller affects ``s`` in
+        :func:`delay_acceptance`."""
+
+
+def delay_acceptance(s: socket, t: float) -> DelayAcceptanceController:
+    """Delay ``t`` seconds before handing every newly accepted connection to the caller of ``s.accept()``, as if the
+    server were too busy to pick it up. Once a connection is pending, ``s.accept()`` waits ``t`` seconds before
+    accepting it, so that the connection, as well as those that arrive in the meantime, waits in the backlog of ``s``
+    and a saturated backlog is reproduced. Therefore, a connection is held for at least ``t`` seconds after it arrives,
+    and longer if other connections are queued before it. Waiting for a pending connection is subject to the timeout of
+    ``s``.
+
+    :param s: The :class:`socket.socket` object whose ``accept()`` function is to be wrapped.
+    :param t: Number of seconds to delay.
+
+    :return: A :class:`DelayAcceptanceController` object that controls the patched socket object.
+
+    .. versionadded:: 0.3
+    """
+
+    controller = DelayAcceptanceController(t=t)
+
+    def before(s: socket) -> None:
+        timeout = s.gettimeout()
+        if select.select((s,), (), (), timeout)[0]:  # A connection is pending in the backlog
+            controller._clock.sleep(controller.t)
+        elif timeout:  # accept() would not wait again
+            raise _socket_module.timeout('timed out')
+        # Non-blocking: accept() raises BlockingIOError
+
+    controller._wrappings.append(wrap_accept(s, before=before))
+
+    return controller
+
+
+class LimitAcceptanceRateController(Controller):
+    """Controller for :func:`.limit_acceptance_rate`. Objects are always created and returned by
+    :func:`.limit_acceptance_rate` and should not be created outside the :mod:`poorconn` package.
+
+    :param rate: Same as ``rate`` in :func:`limit_acceptance_rate`.
+    :param burst: Same as ``burst`` in :func:`limit_acceptance_rate`.
+    """
+
+    __slots__ = (
+        'rate',
+        'burst',
+        '_tokens',
+        '_last_time',
+        '_lock',
+    )
+
+    def __init__(self, rate: float, burst: int):
+        super().__init__()
+        self.rate: float = rate
+        """Same as ``rate`` in :func:`limit_acceptance_rate`. Updating it in the controller affects ``s`` in
+        :func:`limit_acceptance_rate`."""
+        self.burst: int = burst
+        """Same as ``burst`` in :func:`limit_acceptance_rate`. Updating it in the controller affects ``s`` in
+        :func:`limit_acceptance_rate`."""
+        self._tokens: float = burst
+        self._last_time: float = self._clock.monotonic()
+        self._lock = threading.Lock()
+
+    def _take(self) -> float:
+        """Used internally to take a token from the bucket.
+
+        :return: Number of seconds to wait before the token becomes available.
+        """
+        with self._lock:
+            now = self._clock.monotonic()
+            self._tokens = min(float(self.burst), self._tokens + (now - self._last_time) * self.rate)
+            self._last_time = now
+            self._tokens -= 1
+            # A negative balance is a debt that is paid off by waiting, so that concurrent callers queue up fairly.
+            return 0 if self._tokens >= 0 else -self._tokens / self.rate
+
+
+def limit_acceptance_rate(s: socket, rate: float, burst: int = 1) -> LimitAcceptanceRateController:
+    """Limit the rate at which ``s.accept()`` hands out connections to ``rate`` connections per second using a token
+    bucket that holds at most ``burst`` tokens. ``s.accept()`` waits for a token before accepting a connection, so that
+    connections that arrive faster than that are held in the backlog of ``s`` until a token becomes available.
+
+    :param s: The :class:`socket.socket` object whose ``accept()`` function is to be wrapped.
+    :param rate: Number of connections accepted per second in the long run.
+    :param burst: Maximum number of connections that can be accepted back to back after the server has been idle.
+
+    :return: A :class:`LimitAcceptanceRateController` object that controls the patched socket object.
+
+    .. versionadded:: 0.3
+    """
+
+    controller = LimitAcceptanceRateController(rate=rate, burst=burst)
+
+    def before(s: socket) -> None:
+        controller._clock.sleep(controller._take())
+
+    controller._wrappings.append(wrap_accept(s, before=before))
+
+    return controller
+
+
+class LimitBacklogController(Controller):
+    """Controller for :func:`.limit_backlog`. Objects are always created and returned by :func:`.limit_backlog` and
+    should not be created outside the :mod:`poorconn` package.
+
+    :param s: Same as ``s`` in :func:`limit_backlog`.
+    :param backlog: Same as ``backlog`` in :func:`limit_backlog`.
+    """
+
+    __slots__ = (
+        '_socket',
+        '_backlog',
+        '_listening',
+    )
+
+    def __init__(self, s: socket, backlog: int):
+        super().__init__()
+        self._socket = s
+        self._backlog = backlog
+        self._listening = False
+
+    @property
+    def backlog(self) -> int:
+        """Same as ``backlog`` in :func:`limit_backlog`. Updating it in the controller affects ``s`` in
+        :func:`limit_backlog`."""
+        return self._backlog
+
+    @backlog.setter
+    def backlog(self, backlog: int) -> None:
+        self._backlog = backlog
+        if self._listening:
+            self._socket.listen(backlog)
+
+    @property
+    def queue_depth(self) -> Optional[int]:
+        """Number of connections that have been established but are still waiting to be accepted, or ``None`` if the
+        platform does not report it. Only Linux reports it at the moment."""
+        return _accept_queue_depth(self._socket) if self._listening else None
+
+
+def _accept_queue_depth(s: socket) -> Optional[int]:
+    """Get the number of established connections waiting in the accept queue of the listening socket ``s``.
+
+    :return: The queue depth, or ``None`` if the platform does not support querying it.
+    """
+
+    if not hasattr(_socket_module, 'TCP_INFO'):  # pragma: no cover, Linux-only
+        return None
+    # For listening sockets, Linux reports the current accept queue length in tcpi_unacked, which follows 8 bytes of
+    # 8-bit fields and 4 32-bit fields (rto, ato, snd_mss, rcv_mss) in struct tcp_info.
+    info = s.getsockopt(_socket_module.IPPROTO_TCP, _socket_module.TCP_INFO, 32)
+    return int(struct.unpack_from('I', info, 24)[0])
+
+
+def limit_backlog(s: socket, backlog: int) -> LimitBacklogController:
+    """Limit the listen backlog of ``s`` to ``backlog``, so that connections beyond that are not completed by the
+    operating system while the server is busy. This emulates an overloaded server: Depending on the operating system,
+    clients that do not fit in the backlog see their connection attempts time out and retried (e.g., Linux and macOS) or
+    refused (e.g., Windows). It is most useful when stacked with :func:`delay_acceptance` or
+    :func:`limit_acceptance_rate`, which slow down the server from draining the backlog.
+
+    This function achieves the results by patching ``s``'s member method :meth:`~socket.socket.listen` so that the
+    backlog passed in by the caller is ignored. If ``s`` is already listening, it is put into listening again with the
+    new backlog. :meth:`LimitBacklogController.remove` does not restore the backlog of a socket that is listening.
+
+    :param s: The :class:`socket.socket` object whose backlog is to be limited.
+    :param backlog: The backlog to use in :meth:`~socket.socket.listen`.
+
+    :return: A :class:`LimitBacklogController` object that controls the patched socket object.
+
+    .. versionadded:: 0.3
+    """
+
+    controller = LimitBacklogController(s, backlog=backlog)
+
+    def before(sock: socket, *args: Any, **kwargs: Any) -> Any:
+        controller._listening = True
+        return (controller.backlog,), {}
+
+    controller._wrappings.append(wrap(s, meth='listen', before=before, before_pass=True))
+
+    # SO_ACCEPTCONN tells whether the socket is already listening
+    if (hasattr(_socket_module, 'SO_ACCEPTCONN') and
+            s.getsockopt(_socket_module.SOL_SOCKET, _socket_module.SO_ACCEPTCONN)):
+        s.listen()
+
+    return controller
@@ -0,0 +1,223 @@
+# Copyright (C) 2021  Hong Xu <hong@topbug.net>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from __future__ import annotations
+
+import math
+from socket import socket
+import threading
+from typing import Any, Optional, Sequence, Tuple
+
+from ._controller import Controller
+from ._socket import make_socket_patchable
+from ._transit import DelayLineController, patch_delay_line
+from ._wrappers import wrap_accept
+
+PACKET_SIZE = 1500
+"Number of bytes of a packet that enters the queue of a bottleneck at a time."
+
+CODEL_TARGET = 0.005
+"Acceptable number of seconds for which packets stay in the queue of a bottleneck with CoDel."
+
+CODEL_INTERVAL = 0.1
+"Number of seconds for which the queueing delay may exceed :data:`CODEL_TARGET` before CoDel starts dropping."
+
+DISCIPLINES = ('drop-tail', 'codel')
+"Queue disciplines supported by bottlenecks."
+
+
+class BottleneckController(Controller):
+    """Controller for :func:`.send_through_bottleneck` and :func:`.send_through_bottleneck_upon_acceptance`, which
+    represents a bottleneck link. Objects are always created and returned by these functions and should not be created
+    outside the :mod:`poorconn` package.
+
+    :param rate: Same as ``rate`` in :func:`send_through_bottleneck`.
+    :param queue_size: Same as ``queue_size`` in :func:`send_through_bottleneck`.
+    :param discipline: Same as ``discipline`` in :func:`send_through_bottleneck`.
+    :param drop_penalty: Same as ``drop_penalty`` in :func:`send_through_bottleneck`.
+    :raises ValueError: ``discipline`` is not supported.
+
+    .. versionadded:: 0.3
+    """
+
+    __slots__ = (
+        'rate',
+        'queue_size',
+        'discipline',
+        'drop_penalty',
+        'drops',
+        '_lock',
+        '_busy_until',
+        '_above_target_until',
+        '_next_drop',
+        '_drop_count',
+    )
+
+    def __init__(self, rate: float, queue_size: int, discipline: str, drop_penalty: float):
+        super().__init__()
+        if discipline not in DISCIPLINES:
+            raise ValueError(f'Unknown queue discipline {discipline!r}. '
+                             f'Available disciplines: {", ".join(DISCIPLINES)}')
+        self.rate: float = rate
+        "Same as ``rate`` in :func:`send_through_bottleneck`. Updating it in the controller affects the bottleneck."
+        self.queue_size: int = queue_size
+        """Same as ``queue_size`` in :func:`send_through_bottleneck`. Updating it in the controller affects the
+        bottleneck."""
+        self.discipline: str = discipline
+        """Same as ``discipline`` in :func:`send_through_bottleneck`. Updating it in the controller affects the
+        bottleneck."""
+        self.drop_penalty: float = drop_penalty
+        """Same as ``drop_penalty`` in :func:`send_through_bottleneck`. Updating it in the controller affects the
+        bottleneck."""
+        self.drops: int = 0
+        "Number of packets that have been dropped by the bottleneck."
+        self._lock = threading.Lock()
+        # The time at which the link finishes transmitting the bytes in the queue
+        self._busy_until = 0.0
+        # CoDel states: The time at which the queueing delay will have exceeded the target for an interval, the time of
+        # the next drop, and the number of drops since the queueing delay exceeded the target
+        self._above_target_until: Optional[float] = None
+        self._next_drop = 0.0
+        self._drop_count = 0
+
+    @property
+    def queue_delay(self) -> float:
+        "Number of seconds for which the bytes that enter the queue now will wait before leaving the bottleneck."
+        return max(0.0, self._busy_until - self._clock.monotonic())
+
+    @property
+    def queued_bytes(self) -> int:
+        "Number of bytes in the queue of the bottleneck."
+        return int(self.queue_delay * self.rate)
+
+    def attach(self, s: socket) -> None:
+        """Send data sent by ``s`` through the bottleneck as well. ``s`` must be patchable (see
+        :func:`poorconn.make_socket_patchable`). The patched methods of ``s`` are restored when the controller is
+        removed.
+
+        :param s: The stream :class:`socket.socket` object to be shaped.
+        :raises ValueError: ``s`` is not a stream socket or is an :class:`ssl.SSLSocket` object.
+        """
+
+        line = _BottleneckLineController(s, self)
+        patch_delay_line(s, line)
+        self._children.add(line)  # The patched methods of s keep the line alive
+
+    def _admit(self, size: int, now: float) -> Tuple[int, Optional[float]]:
+        """Decide whether the next packet of ``size`` bytes enters the queue at time ``now``. See
+        :meth:`.DelayLineController._admit` for the return value."""
+
+        with self._lock:
+            size = max(1, min(size, PACKET_SIZE, self.queue_size))
+            start = max(now, self._busy_until)
+            delay = start - now
+            if self.discipline == 'codel':
+                if delay < CODEL_TARGET:
+                    self._above_target_until = None
+                    self._drop_count = 0
+                elif self._above_target_until is None:
+                    self._above_target_until = now + CODEL_INTERVAL
+                elif now >= self._above_target_until and now >= self._next_drop:
+                    # The control law of CoDel: Drop more frequently while the queueing delay stays above the target
+                    self._drop_count += 1
+                    self._next_drop = now + CODEL_INTERVAL / math.sqrt(self._drop_count)
+                    self.drops += 1
+                    return 0, self.drop_penalty
+            if delay * self.rate + size > self.queue_size:  # The queue is full
+                self.drops += 1
+                until_room = delay - (self.queue_size - size) / self.rate  # Until the queue has room for the packet
+                return 0, until_room if self.discipline == 'drop-tail' else max(self.drop_penalty, until_room)
+            self._busy_until = start + size / self.rate
+            return size, self._busy_until
+
+
+class _BottleneckLineController(DelayLineController):
+    "The delay line of a socket whose data is sent through a bottleneck."
+
+    __slots__ = (
+        'bottleneck',
+    )
+
+    def __init__(self, s: socket, bottleneck: BottleneckController):
+        # All lines share the queue of the bottleneck, and hence its timeline
+        super().__init__(s, bottleneck._clock)
+        self.bottleneck = bottleneck
+
+    def _admit(self, size: int, now: float) -> Tuple[int, Optional[float]]:
+        return self.bottleneck._admit(size, now)
+
+
+def send_through_bottleneck(s: socket, rate: float, queue_size: int = 65536, discipline: str = 'drop-tail',
+                            drop_penalty: float = 0.1) -> BottleneckController:
+    """Send data sent by ``s`` through a bottleneck link, which transmits ``rate`` bytes per second and queues up to
+    ``queue_size`` bytes. Data sent by the caller enters the queue packet by packet, and is released to the operating
+    system when the link finishes transmitting it. Therefore, latency grows with the number of queued bytes, which
+    simulates bufferbloat when the queue is large. The sender is blocked only when the queue does not admit its data.
+    More sockets can send through the same bottleneck with :meth:`BottleneckController.attach`.
+
+    The queue discipline ``discipline`` decides which packets are dropped:
+
+    - ``'drop-tail'``: Packets are dropped when the queue is full. The sender is blocked until the queue has room for
+      them, which keeps the queue full under load.
+    - ``'codel'``: In addition, packets are dropped when the queueing delay has exceeded :data:`CODEL_TARGET` for
+      :data:`CODEL_INTERVAL`, more frequently the longer it stays above, as CoDel does. The queueing delay is measured
+      when packets enter the queue instead of when they leave it, since queued data can no longer be withdrawn.
+
+    Since data sent over a stream socket cannot be lost, the sender of a dropped packet is blocked for
+    ``drop_penalty`` seconds, which simulates the time that TCP takes to recover from the loss.
+
+    This function achieves the results by patching ``s``'s member methods in the same way as :func:`delay_in_transit`.
+
+    :param s: The stream :class:`socket.socket` object whose data is to be sent through the bottleneck.
+    :param rate: Number of bytes that the bottleneck transmits per second.
+    :param queue_size: Maximum number of bytes in the queue.
+    :param discipline: The queue discipline, which is one of :data:`DISCIPLINES`.
+    :param drop_penalty: Number of seconds for which the sender of a dropped packet is blocked.
+
+    :return: A :class:`BottleneckController` object that controls the bottleneck.
+    :raises ValueError: ``discipline`` is not supported, or ``s`` is not a stream socket or is an
+        :class:`ssl.SSLSocket` object.
+
+    .. versionadded:: 0.3
+    """
+
+    controller = BottleneckController(rate=rate, queue_size=queue_size, discipline=discipline,
+                                      drop_penalty=drop_penalty)
+    controller.attach(s)
+    return controller
+
+
+def send_through_bottleneck_upon_acceptance(s: socket, rate: float, queue_size: int = 65536,
+                                            discipline: str = 'drop-tail',
+                                            drop_penalty: float = 0.1) -> BottleneckController:
+    """Send data sent by all socket objects returned by ``s.accept()`` through the same bottleneck link, so that the
+    connections compete for it. Parameters mean the same as :func:`.send_through_bottleneck`.
+
+    :return: A :class:`BottleneckController` object that controls the bottleneck.
+    :raises ValueError: ``discipline`` is not supported.
+
+    .. versionadded:: 0.3
+    """
+
+    controller = BottleneckController(rate=rate, queue_size=queue_size, discipline=discipline,
+                                      drop_penalty=drop_penalty)
+
+    def after(s: socket, *, original: Sequence, before: Any) -> Tuple[Any, Any]:
+        conn_sock = make_socket_patchable(original[0], (':sending',))
+        controller.attach(conn_sock)
+        return conn_sock, original[1]
+
+    controller._wrappings.append(wrap_accept(s, after=after))
+    return controller
@@ -16,15 +16,25 @@
 "The command line interface of Poorconn."
 
 
-from argparse import ArgumentDefaultsHelpFormatter, ArgumentParser, RawDescriptionHelpFormatter
-from http.server import HTTPServer, SimpleHTTPRequestHandler
+from argparse import ArgumentDefaultsHelpFormatter, ArgumentParser, Namespace, RawDescriptionHelpFormatter, REMAINDER
+import functools
+import json
+from http.server import ThreadingHTTPServer
+import os
 import shlex
+import signal
+import socket
 import sys
 import textwrap
-from typing import Callable, Dict, List, NamedTuple, Sequence
+import threading
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence
 
 import poorconn
-from poorconn import make_socket_patchable
+from poorconn import Controller, FileCache, HTTPRequestHandler, make_socket_patchable, slow_down_http_responses
+from poorconn._config import load_config, serve_config
+from poorconn._loadgen import loadgen
+from poorconn._run import run
+from poorconn._workers import ControlServer, Counters, run_workers, SharedParameters, synchronize_controllers
 
 shell_join = shlex.join if sys.version_info >= (3, 8) else ' '.join
 
@@ -39,10 +49,13 @@ SimulationCommand = NamedTuple('SimulationCommand', [('name', str),
 
 simulation_commands: List[SimulationCommand] = [
     SimulationCommand('close_upon_acceptance', {}),
+    SimulationCommand('delay_acceptance', {'t': float}),
     SimulationCommand('delay_before_sending', {'t': float, 'length': int}),
     SimulationCommand('delay_before_sending_once', {'t': float}),
     SimulationCommand('delay_before_sending_upon_acceptance', {'t': float, 'length': int}),
-    SimulationCommand('delay_before_sending_upon_acceptance_once', {'t': float})]
+    SimulationCommand('delay_before_sending_upon_acceptance_once', {'t': float}),
+    SimulationCommand('limit_acceptance_rate', {'rate': float, 'burst': int}),
+    SimulationCommand('limit_backlog', {'backlog': int})]
 """Each simulation command corresponds to the function with the same name under :mod:`poorconn`. The dictionary lists
 the type conversion function for each parameter from the command line arguments. This does not necessarily overlap with
 the type annotation of the underlying simulation function, because they may accept multiple types but we can only
@@ -75,6 +88,80 @@ def update_arg_parser_from_simulation_function(s: SimulationCommand, arg_parser:
                                 type=s.params[param])
 
 
+def add_http_arguments(arg_parser: ArgumentParser) -> None:
+    """Add arguments that slow down the HTTP server at the HTTP level (see :func:`poorconn.slow_down_http_responses`)
+    to an :class:`argparser.ArgumentParser` object.
+
+    :param arg_parser: The :class:`argparser.ArgumentParser` object of the main command.
+    """
+
+    group = arg_parser.add_argument_group('HTTP slowness', 'Slow down responses at the HTTP level, which can be '
+                                          'combined with a simulation command. See poorconn.slow_down_http_responses')
+    group.add_argument('--ttfb', help='Number of seconds to delay the status line of each response', type=float,
+                       default=0.0)
+    group.add_argument('--header-delay', help='Number of seconds to delay each header line', type=float, default=0.0)
+    group.add_argument('--chunk-size', help='Send bodies in chunks of this number of bytes, with the chunked transfer '
+                       'encoding for HTTP/1.1 requests', type=int, default=None)
+    group.add_argument('--chunk-delay', help='Number of seconds between chunks of bodies', type=float, default=0.0)
+    group.add_argument('--stall-after', help='Stall after sending this number of bytes of each body', type=int,
+                       default=None)
+    group.add_argument('--stall', help='Number of seconds to stall for', type=float, default=0.0)
+
+
+def add_run_arguments(arg_parser: ArgumentParser) -> None:
+    """Add arguments of the ``run`` command to an :class:`argparser.ArgumentParser` object.
+
+    :param arg_parser: The :class:`argparser.ArgumentParser` object of the ``run`` command.
+    """
+
+    environ = os.environ
+    arg_parser.add_argument('--profile', help='Name of the profile',
+                            choices=tuple(poorconn.profiles), default=environ.get('POORCONN_PROFILE'))
+    arg_parser.add_argument('--rate', help='Number of bytes sent per second, overriding the profile', type=float,
+                            default=environ.get('POORCONN_RATE'))
+    arg_parser.add_argument('--latency', type=float, default=environ.get('POORCONN_LATENCY'),
+                            help='Number of seconds by which sent data is delayed, overriding the profile')
+    arg_parser.add_argument('--match', help='Destination pattern of connections to shape, such as "10.0.0.0/8", '
+                            '"localhost:8000" or ":6379". Can be specified more than once. Shape all connections if '
+                            'not specified', action='append',
+                            default=environ['POORCONN_MATCH'].split(',') if environ.get('POORCONN_MATCH') else [])
+    arg_parser.add_argument('--metrics-file', help='File that each Python process appends its metrics to as a JSON '
+                            'line', default=environ.get('POORCONN_METRICS_FILE'))
+    arg_parser.add_argument('command', help='The command to run, preferably preceded by "--"', nargs=REMAINDER)
+
+
+def add_loadgen_arguments(arg_parser: ArgumentParser) -> None:
+    """Add arguments of the ``loadgen`` command to an :class:`argparser.ArgumentParser` object.
+
+    :param arg_parser: The :class:`argparser.ArgumentParser` object of the ``loadgen`` command.
+    """
+
+    arg_parser.add_argument('url', help='URL of the target, such as http://localhost:8000/bytes/1024')
+    arg_parser.add_argument('-c', '--connections', help='Number of concurrent client connections', type=int, default=1)
+    arg_parser.add_argument('-n', '--requests', help='Number of requests that each connection makes', type=int,
+                            default=1)
+    arg_parser.add_argument('-X', '--method', help='The request method', default='GET')
+    arg_parser.add_argument('--path', help='Path to request instead of the path of the URL, such as "/a?b=c". Can be '
+                            'specified more than once to request the paths in turn', dest='paths', action='append',
+                            default=[])
+    arg_parser.add_argument('--header', help='Extra header line, such as "Accept: */*". Can be specified more than '
+                            'once', dest='headers', action='append', default=[])
+    arg_parser.add_argument('--body-size', help='Number of bytes of the body of each request', type=int, default=0)
+    arg_parser.add_argument('--think-time', help='Number of seconds between the requests of each connection',
+                            type=float, default=0.0)
+    arg_parser.add_argument('--profile', help='Name of the profile that shapes the sending of each connection',
+                            choices=tuple(poorconn.profiles), default=None)
+    arg_parser.add_argument('--rate', help='Number of bytes sent per second, overriding the profile', type=float,
+                            default=None)
+    arg_parser.add_argument('--latency', help='Number of seconds by which each request is delayed, overriding the '
+                            'profile', type=float, default=None)
+    arg_parser.add_argument('--read-rate', help='Number of bytes each connection reads per second', type=float,
+                            default=None)
+    arg_parser.add_argument('--timeout', help='Number of seconds after which a request fails', type=float,
+                            default=60.0)
+    arg_parser.add_argument('--json', help='Print the report as JSON', action='store_true')
+
+
 def main(argv: Sequence) -> None:
     """Command line entrypoint.
 
@@ -96,9 +183,39 @@ def main(argv: Sequence) -> None:
         the speed to roughly 1 KiB per second:
 
             %(prog)s -m poorconn delay_before_sending_upon_acceptance --t=1 --length=1024
+
+        Start a HTTP server at localhost port 8000 that delays the first byte of each response by 2 seconds, and sends
+        bodies in chunks of 1 KiB every 0.1 seconds:
+
+            %(prog)s --ttfb=2 --chunk-size=1024 --chunk-delay=0.1
+
+        Serve the listeners described in a configuration file, such as a slow HTTP server, a flaky proxy and a dead TCP
+        service, from one process:
+
+            %(prog)s --config=listeners.toml
+
+        Run the tests of a Python project, in which connections to localhost port 8000 are shaped like a 3G network:
+
+            %(prog)s run --profile=3g --match=localhost:8000 -- python -m pytest
+
+        Make 10 requests from each of 1000 concurrent clients, which send like a 3G network and read 10 KB per second:
+
+            %(prog)s loadgen -c 1000 -n 10 --profile=3g --read-rate=10000 http://localhost:8000/bytes/1048576
         '''))
     arg_parser.add_argument('-H', '--host', help='Host name to bind to', type=str, default='localhost')
     arg_parser.add_argument('-p', '--port', help='Port to bind to', type=int, default=8000)
+    arg_parser.add_argument('--processes', help='Number of worker processes, which share the port with SO_REUSEPORT',
+                            type=int, default=1)
+    arg_parser.add_argument('--control-port', help='Port of a control server on the host, to which the lines "get", '
+                            '"set NAME=VALUE ..." and "stats" get and update the parameters of the simulations of all '
+                            'worker processes, and get their counters', type=int, default=None)
+    arg_parser.add_argument('--config', help='JSON or TOML (if the file name ends with .toml) file that describes '
+                            'multiple listeners (HTTP servers, proxies and TCP servers), each with its own '
+                            'simulations, which are all served by this process. The other options are ignored',
+                            default=None)
+    arg_parser.add_argument('--cache-size', help='Cache up to this number of bytes of the served files in memory, '
+                            'which are read again once they are modified. Disabled if 0', type=int, default=0)
+    add_http_arguments(arg_parser)
 
     subparsers = arg_parser.add_subparsers(title='Simulation commands', metavar='simulation_command',
                                            dest='simulation_command')
@@ -107,17 +224,179 @@ def main(argv: Sequence) -> None:
                                           formatter_class=ArgumentDefaultsHelpFormatter)
         update_arg_parser_from_simulation_function(simulation_command, subparser)
 
+    run_parser = subparsers.add_parser('run', help='Run a command with poorconn preloaded in its Python processes',
+                                       formatter_class=ArgumentFormatter,
+                                       description=textwrap.dedent('''
+        Run a command, in whose Python processes TCP connections are shaped by poorconn.install(). Options default to
+        the environment variables POORCONN_PROFILE, POORCONN_RATE, POORCONN_LATENCY, POORCONN_MATCH (comma-separated)
+        and POORCONN_METRICS_FILE, respectively.
+
+        Example: %(prog)s --profile=3g --match=localhost:8000 -- python -m pytest
+        '''))
+    add_run_arguments(run_parser)
+
+    loadgen_parser = subparsers.add_parser('loadgen', help='Make requests from many concurrent slow clients',
+                                           formatter_class=ArgumentFormatter,
+                                           description=textwrap.dedent('''
+        Make HTTP requests to a URL from many concurrent client connections, which are shaped like slow uploaders and
+        slow readers, and report the throughput, latency percentiles and error rates.
+
+        Example: %(prog)s -c 1000 -n 10 --profile=3g --read-rate=10000 http://localhost:8000/bytes/1048576
+        '''))
+    add_loadgen_arguments(loadgen_parser)
+
     if len(argv) == 0:
         arg_parser.print_help(sys.stderr)
         sys.exit(1)
 
     args = arg_parser.parse_args(argv)
 
-    with HTTPServer((args.host, args.port), SimpleHTTPRequestHandler) as httpd:
+    if args.simulation_command == 'run':
+        command = args.command[1:] if args.command[:1] == ['--'] else args.command
+        if not command:
+            run_parser.error('the command to run is missing')
+        sys.exit(run(command, profile=args.profile, rate=args.rate, latency=args.latency, match=args.match,
+                     metrics_file=args.metrics_file))
+
+    if args.simulation_command == 'loadgen':
+        try:
+            report = loadgen(args.url, connections=args.connections, requests=args.requests, method=args.method,
+                             paths=args.paths, headers=args.headers, body_size=args.body_size,
+                             think_time=args.think_time, profile=args.profile, rate=args.rate, latency=args.latency,
+                             read_rate=args.read_rate, timeout=args.timeout)
+        except ValueError as e:
+            loadgen_parser.error(str(e))
+        if args.json:
+            print(json.dumps(report.to_dict()))
+            return
+        print(f'{report.requests} request(s) from {report.connections} connection(s) in {report.duration:.3f}s')
+        print(f'Throughput: {report.throughput:.0f} B/s ({report.bytes_sent} B sent, {report.bytes_received} B '
+              f'received)')
+        if report.latency:
+            print('Latency: ' + ', '.join(f'{name} {value:.3f}s' for name, value in report.latency.items()))
+        print(f'Errors: {report.error_rate:.2%}' + ''.join(f', {count} {reason}'
+                                                           for reason, count in sorted(report.errors.items())))
+        return
+
+    if args.config is not None:
+        if args.simulation_command is not None:
+            arg_parser.error('a simulation command cannot be used with --config')
+        try:
+            configs = load_config(args.config, {c.name: c.params for c in simulation_commands})
+        except ValueError as e:
+            arg_parser.error(str(e))
+        serve_config(configs)
+        return
+
+    if args.processes < 1:
+        arg_parser.error('the number of processes must be positive')
+    if args.processes > 1 and not hasattr(socket, 'SO_REUSEPORT'):
+        arg_parser.error('multiple processes require SO_REUSEPORT, which is not available on this platform')
+    serve(args)
+
+
+def _simulation_params(args: Namespace) -> Dict[str, Any]:
+    "Get the parameters of the simulation command in ``args``."
+
+    prefix = f'{args.simulation_command}_param_'
+    return {arg_name[len(prefix):]: arg_val for arg_name, arg_val in vars(args).items() if arg_name.startswith(prefix)}
+
+
+def _shared_parameters(args: Namespace) -> SharedParameters:
+    "Create the parameters in ``args`` that are shared by worker processes."
+
+    types: Dict[str, Callable] = {'ttfb': float, 'header_delay': float, 'chunk_size': int, 'chunk_delay': float,
+                                  'stall_after': int, 'stall': float}
+    values = {name: getattr(args, name) for name in types}
+    if args.simulation_command is not None:
+        types.update(next(c for c in simulation_commands if c.name == args.simulation_command).params)
+        values.update(_simulation_params(args))
+    return SharedParameters(values, types)
+
+
+def serve(args: Namespace) -> None:
+    """Serve HTTP with the options in ``args``, in one or more worker processes. If there are more than one worker
+    process or a control port, the parameters of the simulations are shared by all worker processes, and can be updated
+    through the control port (see :class:`poorconn._workers.ControlServer`). Upon :class:`KeyboardInterrupt`, the
+    merged counters of the worker processes are printed to stderr.
+
+    :param args: Parsed command line arguments.
+    """
+
+    if args.processes == 1 and args.control_port is None:
+        serve_worker(args, None, None, 0)
+    else:
+        serve_shared(args)
+
+
+def serve_shared(args: Namespace) -> None:
+    """Serve HTTP with the options in ``args`` in worker processes that share the parameters of their simulations, or
+    in the current process if there is only one. See :func:`serve`.
+
+    :param args: Parsed command line arguments.
+    """
+
+    parameters = _shared_parameters(args)
+    counters = Counters(('responses',), args.processes)
+    control_server = None
+    if args.control_port is not None:
+        control_server = ControlServer((args.host, args.control_port), parameters, counters)
+        threading.Thread(target=control_server.serve_forever, name='Poorconn control server', daemon=True).start()
+    try:
+        if args.processes == 1:
+            try:
+                serve_worker(args, parameters, counters, 0)
+            except KeyboardInterrupt:
+                pass
+        else:
+            run_workers(args.processes, functools.partial(serve_worker, args, parameters, counters))
+    finally:
+        if control_server is not None:
+            control_server.shutdown()
+            control_server.server_close()
+        print(f'poorconn: {counters.merged()["responses"]} response(s) served by {args.processes} worker process(es)',
+              file=sys.stderr)
+
+
+def serve_worker(args: Namespace, parameters: Optional[SharedParameters], counters: Optional[Counters],
+                 worker: int) -> None:
+    """Serve HTTP with the options in ``args`` in the current process, which is worker process ``worker``.
+
+    :param args: Parsed command line arguments.
+    :param parameters: The parameters shared by worker processes, if any.
+    :param counters: The counters of worker processes, if any.
+    :param worker: Index of the current process in ``counters``.
+    """
+
+    with ThreadingHTTPServer((args.host, args.port), HTTPRequestHandler, bind_and_activate=False) as httpd:
+        if args.processes > 1:  # Every worker process listens on the same port
+            httpd.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)  # type: ignore[attr-defined]
+        httpd.server_bind()
+        httpd.server_activate()
         httpd.socket = make_socket_patchable(httpd.socket)
-        simulation_func = getattr(poorconn, args.simulation_command)
-        simulation_func(httpd.socket,
-                        **{arg_name[len(f'{args.simulation_command}_param_'):]: arg_val
-                           for arg_name, arg_val in vars(args).items()
-                           if arg_name.startswith(f'{args.simulation_command}_param_')})
-        httpd.serve_forever()
+        if args.cache_size > 0:
+            httpd.file_cache = FileCache(args.cache_size)  # type: ignore[attr-defined]
+        controllers: List[Controller] = []
+        if args.simulation_command is not None:
+            simulation_func = getattr(poorconn, args.simulation_command)
+            controllers.append(simulation_func(httpd.socket, **_simulation_params(args)))
+        http_controller = slow_down_http_responses(httpd, ttfb=args.ttfb, header_delay=args.header_delay,
+                                                   chunk_size=args.chunk_size, chunk_delay=args.chunk_delay,
+                                                   stall_after=args.stall_after, stall=args.stall)
+        controllers.append(http_controller)
+
+        if parameters is None or counters is None:
+            httpd.serve_forever()
+        else:
+            stopped = threading.Event()
+            thread = synchronize_controllers(parameters, controllers, counters, worker,
+                                             lambda: {'responses': http_controller.responses}, stopped)
+            try:
+                httpd.serve_forever()
+            except KeyboardInterrupt:
+                if args.processes == 1:
+                    raise
+                signal.signal(signal.SIGINT, signal.SIG_IGN)  # Interrupted by both the terminal and the parent process
+            finally:
+                stopped.set()
+                thread.join()
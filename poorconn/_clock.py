@@ -0,0 +1,364 @@
+# Copyright (C) 2021  Hong Xu <hong@topbug.net>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from __future__ import annotations
+
+import contextlib
+import os
+import threading
+import time
+from typing import Iterator, List, Optional
+
+
+class Clock:
+    """The clock that simulation functions tell time and sleep with. This class sleeps with :func:`time.sleep`, which
+    may overshoot by tens to hundreds of microseconds. Subclasses trade CPU time for precision.
+
+    .. versionadded:: 0.3
+    """
+
+    __slots__ = ()
+
+    def monotonic(self) -> float:
+        "Get the current time in seconds, which never goes backwards. Same as :func:`time.monotonic` by default."
+        return time.monotonic()
+
+    def sleep_until(self, deadline: float) -> None:
+        "Sleep until :meth:`monotonic` reaches ``deadline``. Return immediately if ``deadline`` has passed."
+
+        delay = deadline - self.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def sleep(self, t: float) -> None:
+        "Sleep ``t`` seconds."
+        if t > 0:
+            time.sleep(t)
+
+    def wait(self, condition: threading.Condition, t: float) -> None:
+        """Wait ``t`` seconds on ``condition``, which is held by the caller and released while waiting, so that other
+        threads can change the state that the caller waits for in the meantime. It may return early when the condition
+        is notified."""
+        condition.wait(max(0.0, t))
+
+    def timeline(self) -> Clock:
+        """Get the clock that a new simulation tells time and sleeps with. Clocks that follow real time return
+        themselves, while :class:`VirtualClock` returns a new timeline (see :meth:`VirtualClock.timeline`)."""
+        return self
+
+
+class SpinClock(Clock):
+    """A clock that sleeps with :func:`time.sleep` until ``spin`` seconds before the deadline, and then busy-waits for
+    the rest, which is precise to about a microsecond at the cost of CPU time.
+
+    :param spin: Number of seconds to busy-wait before each deadline.
+
+    .. versionadded:: 0.3
+    """
+
+    __slots__ = (
+        'spin',
+    )
+
+    def __init__(self, spin: float = 0.002):
+        super().__init__()
+        self.spin: float = spin
+        "Same as ``spin`` in :class:`SpinClock`."
+
+    def sleep_until(self, deadline: float) -> None:
+        delay = deadline - self.monotonic() - self.spin
+        if delay > 0:
+            time.sleep(delay)
+        while self.monotonic() < deadline:
+            pass
+
+    def sleep(self, t: float) -> None:
+        self.sleep_until(self.monotonic() + t)
+
+
+class TimerfdClock(Clock):
+    """A clock that sleeps with a timer file descriptor (:func:`os.timerfd_create`) armed with an absolute deadline,
+    which the kernel wakes up more precisely than :func:`time.sleep` does without busy-waiting. It requires Linux and
+    Python 3.13 or later. Each thread uses its own timer file descriptor.
+
+    :raises RuntimeError: Timer file descriptors are not available.
+
+    .. versionadded:: 0.3
+    """
+
+    __slots__ = (
+        '_local',
+        '_fds',
+        '_lock',
+    )
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._local = threading.local()
+        # The timer file descriptors of all threads, which are closed with the clock
+        self._fds: List[int] = []
+        self._lock = threading.Lock()
+        if not hasattr(os, 'timerfd_create'):
+            raise RuntimeError('Timer file descriptors are not available on this platform')
+
+    def sleep_until(self, deadline: float) -> None:  # pragma: no cover, Python 3.13 or later
+        if deadline <= self.monotonic():
+            return
+        fd = getattr(self._local, 'fd', None)
+        if fd is None:
+            # time.monotonic() reads CLOCK_MONOTONIC on Linux, so deadlines can be passed to the timer as they are
+            fd = self._local.fd = os.timerfd_create(time.CLOCK_MONOTONIC)  # type: ignore[attr-defined]
+            with self._lock:
+                self._fds.append(fd)
+        os.timerfd_settime(fd, flags=os.TFD_TIMER_ABSTIME, initial=deadline)  # type: ignore[attr-defined]
+        os.read(fd, 8)
+
+    def sleep(self, t: float) -> None:  # pragma: no cover, Python 3.13 or later
+        self.sleep_until(self.monotonic() + t)
+
+    def __del__(self) -> None:  # pragma: no cover, Python 3.13 or later
+        with self._lock:
+            fds, self._fds = self._fds, []
+        for fd in fds:
+            os.close(fd)
+
+
+class VirtualClock(Clock):
+    """A clock that does not sleep: Sleeping and waiting advance the time of the clock instantly instead. With this
+    clock, simulations of minutes of poor network conditions finish in milliseconds, and their controllers report the
+    simulated time that has passed (see :attr:`.Controller.elapsed`).
+
+    Every simulation advances its own timeline (see :meth:`timeline`), so that simulations running in parallel, such as
+    thousands of simulated connections on as many threads, do not advance the time of each other. Simulations that block
+    the caller, such as :func:`.delay_before_sending` and :func:`.limit_link_rate`, are therefore deterministic, while
+    the timing of simulations that release data from background threads, such as :func:`.delay_in_transit` and
+    :func:`.delay_datagrams`, depends on the order in which the threads run. The time of this clock is the latest time
+    that any of its timelines has reached.
+
+    :param start: The initial time of the clock.
+
+    .. versionadded:: 0.3
+    """
+
+    __slots__ = (
+        '_now',
+        '_start',
+        '_lock',
+        '_parent',
+    )
+
+    def __init__(self, start: float = 0.0):
+        super().__init__()
+        self._now = self._start = start
+        self._lock = threading.Lock()
+        self._parent: Optional[VirtualClock] = None
+
+    @property
+    def elapsed(self) -> float:
+        "Number of seconds by which the clock has advanced since it was created."
+        return self._now - self._start
+
+    def monotonic(self) -> float:
+        return self._now
+
+    def _move_to(self, now: float) -> None:
+        "Move the time of the clock forward to ``now``, and that of the clock that it is a timeline of."
+
+        with self._lock:
+            self._now = now = max(self._now, now)
+        if self._parent is not None:
+            self._parent._move_to(now)
+
+    def advance(self, t: float) -> None:
+        "Advance the time of the clock by ``t`` seconds."
+        with self._lock:
+            self._now = now = self._now + max(0.0, t)
+        if self._parent is not None:
+            self._parent._move_to(now)
+
+    def sleep_until(self, deadline: float) -> None:
+        self._move_to(deadline)
+
+    def sleep(self, t: float) -> None:
+        self.advance(t)
+
+    def wait(self, condition: threading.Condition, t: float) -> None:
+        self.advance(t)
+
+    def timeline(self) -> VirtualClock:
+        """Create a timeline of this clock: A virtual clock that starts at the current time of this clock and is only
+        advanced by its own sleeping and waiting, which also moves the time of this clock forward if it gets ahead."""
+
+        timeline = VirtualClock(self._now)
+        timeline._parent = self
+        return timeline
+
+
+_clock: Clock = Clock()
+
+# The timeline of the connection whose simulations are being applied in the current thread, if any
+_local = threading.local()
+
+
+def get_clock() -> Clock:
+    """Get the clock that simulation functions currently tell time and sleep with.
+
+    .. versionadded:: 0.3
+    """
+    return _clock
+
+
+def _timeline() -> Clock:
+    """Get the timeline that a new simulation tells time and sleeps with: That of the connection whose simulations are
+    being applied in the current thread (see :func:`_use_timeline`), or else a new timeline of the current clock."""
+    return getattr(_local, 'timeline', None) or _clock.timeline()
+
+
+@contextlib.contextmanager
+def _use_timeline(timeline: Clock) -> Iterator[None]:
+    """Apply simulations in the current thread on ``timeline``, so that the simulations of a connection, such as
+    those that a profile or an upon-acceptance simulation applies to it, share the time that they spend."""
+
+    previous = getattr(_local, 'timeline', None)
+    _local.timeline = timeline
+    try:
+        yield
+    finally:
+        _local.timeline = previous
+
+
+def set_clock(clock: Clock) -> Clock:
+    """Set the clock that simulation functions tell time and sleep with, which affects all simulations from now on.
+    Since simulations keep times of the clock in their states, the clock should be set before applying simulations.
+
+    :param clock: The new clock.
+    :return: The previous clock.
+
+    .. versionadded:: 0.3
+    """
+
+    global _clock
+    previous, _clock = _clock, clock
+    return previous
+
+
+@contextlib.contextmanager
+def use_clock(clock: Clock) -> Iterator[Clock]:
+    """A context manager that sets the clock (see :func:`set_clock`) and restores the previous clock on exit::
+
+        with use_clock(VirtualClock()) as clock:
+            controller = delay_before_sending(s, t=10, length=1024)
+            s.sendall(b'a' * 1024 * 60)  # Returns immediately
+            assert controller.elapsed == clock.elapsed == 600
+
+    :param clock: The clock to use.
+    :return: ``clock``.
+
+    .. versionadded:: 0.3
+    """
+
+    previous = set_clock(clock)
+    try:
+        yield clock
+    finally:
+        set_clock(previous)
+
+
+class Pacer:
+    """Sleeps on a schedule of deadlines with ``clock``, and keeps track of how much it oversleeps. Each delay is
+    scheduled from the previous deadline instead of from the time of waking up, so that time spent oversleeping and
+    sending is compensated in subsequent delays rather than accumulated, until :meth:`reset` is called. Objects are
+    created by simulation functions and can be found in the ``pacer`` attributes of their controllers.
+
+    :param max_lag: See :attr:`max_lag`.
+    :param clock: The clock to sleep with, which is that of the controller for simulation functions, or ``None`` for the
+        clock that is in effect at the time of sleeping (see :func:`get_clock`).
+
+    .. versionadded:: 0.3
+    """
+
+    __slots__ = (
+        'max_lag',
+        'waits',
+        'total_overshoot',
+        'max_overshoot',
+        '_deadline',
+        '_lock',
+        '_clock',
+    )
+
+    def __init__(self, max_lag: float = 0.01, clock: Optional[Clock] = None):
+        super().__init__()
+        self.max_lag: float = max_lag
+        """Maximum number of seconds by which a delay may start later than the previous deadline to be scheduled from
+        it. A caller that starts later, e.g., because it has been idle, is scheduled from the current time instead, so
+        that it does not send in a burst to catch up."""
+        self.waits: int = 0
+        "Number of delays."
+        self.total_overshoot: float = 0.0
+        "Total number of seconds by which deadlines have been overslept."
+        self.max_overshoot: float = 0.0
+        "Maximum number of seconds by which a deadline has been overslept."
+        self._deadline: Optional[float] = None
+        self._lock = threading.Lock()
+        self._clock = clock
+
+    @property
+    def mean_overshoot(self) -> float:
+        "Average number of seconds by which deadlines have been overslept."
+        return self.total_overshoot / self.waits if self.waits else 0.0
+
+    def reset(self) -> None:
+        "Schedule the next delay from the time at which it starts rather than from the previous deadline."
+
+        with self._lock:
+            self._deadline = None
+
+    def wait(self, t: float) -> None:
+        "Sleep ``t`` seconds after the previous deadline, or after the current time if it is too far behind."
+
+        clock = self._clock or get_clock()
+        self.sleep_until(self._schedule(t, clock.monotonic()))
+
+    def _schedule(self, t: float, now: float) -> float:
+        """Schedule a delay of ``t`` seconds that starts at ``now``, without sleeping.
+
+        :return: The deadline of the delay, which is ``t`` seconds after the previous deadline, or after ``now`` if it
+            is too far behind.
+        """
+
+        with self._lock:
+            base = self._deadline if self._deadline is not None and now - self._deadline <= self.max_lag else now
+            self._deadline = base + t
+            return self._deadline
+
+    def _add(self, other: Pacer) -> None:
+        "Add the statistics of ``other`` to those of this pacer."
+
+        with self._lock:
+            self.waits += other.waits
+            self.total_overshoot += other.total_overshoot
+            self.max_overshoot = max(self.max_overshoot, other.max_overshoot)
+
+    def sleep_until(self, deadline: float) -> None:
+        "Sleep until ``deadline``, which is given by the caller's own schedule, and record the overshoot."
+
+        clock = self._clock or get_clock()
+        clock.sleep_until(deadline)
+        overshoot = max(0.0, clock.monotonic() - deadline)
+        with self._lock:
+            self.waits += 1
+            self.total_overshoot += overshoot
+            self.max_overshoot = max(self.max_overshoot, overshoot)
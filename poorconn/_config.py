@@ -0,0 +1,315 @@
+# Copyright (C) 2021  Hong Xu <hong@topbug.net>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Configuration files that describe multiple listeners, such as a slow static HTTP server, a flaky proxy in front of an
+API and a dead TCP service, which are all served by one process."""
+
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+import inspect
+import json
+import pathlib
+from socketserver import BaseRequestHandler, BaseServer
+import sys
+import threading
+from typing import Any, Callable, Dict, List, Mapping, Optional, Tuple
+
+import poorconn
+from ._controller import Controller
+from ._http import FileCache, slow_down_http_responses
+from ._profile import get_profile
+from ._proxy import simulate_upon_acceptance, start_proxy
+from ._servers import _HTTPServer, _TCPServer
+from ._socket import make_socket_patchable
+
+_COMMON_KEYS = frozenset(('type', 'name', 'host', 'port'))
+"Keys that all listeners accept."
+
+_KEYS: Dict[str, frozenset] = {
+    'http': _COMMON_KEYS | {'directory', 'cache_size', 'http', 'simulations', 'profile'},
+    'proxy': _COMMON_KEYS | {'target', 'profile', 'upstream_profile'},
+    'tcp': _COMMON_KEYS | {'mode', 'simulations', 'profile'},
+}
+"Keys that each type of listeners accepts."
+
+_HTTP_KEYS: Dict[str, Callable[[Any], Any]] = {'ttfb': float, 'header_delay': float, 'chunk_size': int,
+                                               'chunk_delay': float, 'stall_after': int, 'stall': float}
+"Keys of the ``http`` table of HTTP listeners, which are passed to :func:`poorconn.slow_down_http_responses`."
+
+_HTTP_NULLABLE_KEYS: Tuple[str, ...] = ('chunk_size', 'stall_after')
+"Keys of :data:`_HTTP_KEYS` whose values may be ``null``, i.e., ``None``."
+
+
+@dataclass(frozen=True)
+class ListenerConfig:
+    "Configuration of a listener, which is loaded by :func:`load_config`."
+
+    type: str
+    "Type of the listener: ``http`` for a static HTTP server, ``proxy`` for a TCP proxy, or ``tcp`` for a TCP server."
+    port: int
+    "Port to listen on."
+    host: str = 'localhost'
+    "Host name to listen on."
+    name: str = ''
+    "Name of the listener, which is only used in messages."
+    profile: Optional[str] = None
+    "Name of the profile to apply to every accepted connection, or ``None`` for none."
+    simulations: Tuple[Tuple[str, Dict[str, Any]], ...] = ()
+    "Simulation commands to apply to the listening socket, and their parameters, for HTTP and TCP listeners."
+    directory: str = '.'
+    "Directory to serve, for HTTP listeners."
+    cache_size: int = 0
+    "Number of bytes of the served files to cache in memory, for HTTP listeners (see :class:`poorconn.FileCache`)."
+    http: Dict[str, Any] = field(default_factory=dict)
+    "Arguments to pass to :func:`poorconn.slow_down_http_responses`, for HTTP listeners."
+    target: Optional[Tuple[str, int]] = None
+    "Address to forward connections to, for proxies."
+    upstream_profile: Optional[str] = None
+    "Name of the profile to apply to connections to :attr:`target`, for proxies."
+    mode: str = 'echo'
+    "``echo`` to send received data back, or ``discard`` to discard it, for TCP listeners."
+
+
+def _parse_file(path: pathlib.Path) -> Any:
+    "Parse a JSON or, if its suffix is ``.toml``, a TOML file."
+
+    if path.suffix != '.toml':
+        return json.loads(path.read_text())
+    if sys.version_info >= (3, 11):
+        import tomllib
+    else:  # pragma: no cover
+        try:
+            import tomli as tomllib
+        except ImportError:
+            raise ValueError('Reading TOML files requires Python 3.11 or the "tomli" package') from None
+    return tomllib.loads(path.read_text())
+
+
+def _parse_listener(table: Any, simulation_commands: Mapping[str, Mapping[str, Callable[[Any], Any]]]) \
+        -> ListenerConfig:
+    "Parse and validate the table of a listener."
+
+    if not isinstance(table, dict):
+        raise ValueError('must be a table')
+    listener_type = table.get('type')
+    if listener_type not in _KEYS:
+        raise ValueError(f'unknown type {listener_type!r}. Available types: {", ".join(_KEYS)}')
+    unknown = set(table) - _KEYS[listener_type]
+    if unknown:
+        raise ValueError(f'unknown keys for type {listener_type!r}: {", ".join(sorted(unknown))}')
+    if not isinstance(table.get('port'), int):
+        raise ValueError('"port" must be an integer')
+
+    kwargs = dict(table)
+    for key in ('profile', 'upstream_profile'):
+        if kwargs.get(key) is not None:
+            get_profile(kwargs[key])
+    if 'target' in kwargs:
+        target = kwargs['target']
+        host, _, port = target.rpartition(':') if isinstance(target, str) else ('', '', '')
+        if not host or not port.isdigit():
+            raise ValueError(f'"target" must be in the form "host:port", not {target!r}')
+        kwargs['target'] = (host, int(port))
+    elif listener_type == 'proxy':
+        raise ValueError('"target" is missing')
+    if kwargs.get('mode', 'echo') not in ('echo', 'discard'):
+        raise ValueError(f'unknown mode {kwargs["mode"]!r}. Available modes: echo, discard')
+    if 'http' in kwargs:
+        unknown = set(kwargs['http']) - set(_HTTP_KEYS)
+        if unknown:
+            raise ValueError(f'unknown keys in "http": {", ".join(sorted(unknown))}')
+        nulls = sorted(key for key, value in kwargs['http'].items() if value is None and key not in _HTTP_NULLABLE_KEYS)
+        if nulls:
+            raise ValueError(f'keys in "http" must not be null: {", ".join(nulls)}')
+        kwargs['http'] = {key: None if value is None else _HTTP_KEYS[key](value)
+                          for key, value in kwargs['http'].items()}
+
+    simulations = []
+    for simulation in kwargs.get('simulations', ()):
+        params = dict(simulation)
+        name = params.pop('name', None)
+        if name not in simulation_commands:
+            raise ValueError(f'unknown simulation {name!r}. Available simulations: {", ".join(simulation_commands)}')
+        try:
+            inspect.signature(getattr(poorconn, name)).bind(None, **params)
+        except TypeError as e:
+            raise ValueError(f'simulation {name!r}: {e}') from None
+        simulations.append((name, {param: simulation_commands[name][param](value) for param, value in params.items()}))
+    kwargs['simulations'] = tuple(simulations)
+    kwargs.setdefault('name', f'{listener_type}:{kwargs["port"]}')
+    return ListenerConfig(**kwargs)
+
+
+def load_config(path: str, simulation_commands: Mapping[str, Mapping[str, Callable[[Any], Any]]]) \
+        -> List[ListenerConfig]:
+    """Load the listeners described in a JSON or TOML configuration file, whose top level has an array of tables named
+    ``listeners``. Each table corresponds to a :class:`ListenerConfig` object, such as:
+
+    .. code-block:: toml
+
+       [[listeners]]
+       type = "http"
+       port = 9001
+       profile = "3g"
+       http = {ttfb = 0.5}
+
+       [[listeners]]
+       type = "proxy"
+       port = 9002
+       target = "localhost:8080"
+       upstream_profile = "edge"
+
+       [[listeners]]
+       type = "tcp"
+       port = 9003
+       simulations = [{name = "close_upon_acceptance"}]
+
+    :param path: Path to the configuration file. It is parsed as TOML if its suffix is ``.toml``, and as JSON otherwise.
+    :param simulation_commands: Simulation commands that ``simulations`` may use, and the type conversion function for
+        each of their parameters.
+    :raises ValueError: The configuration file is invalid.
+    """
+
+    try:
+        config = _parse_file(pathlib.Path(path))
+    except (OSError, ValueError) as e:  # JSON and TOML decoding errors are subclasses of ValueError
+        raise ValueError(f'Failed to read {path}: {e}') from None
+    listeners = config.get('listeners') if isinstance(config, dict) else None
+    if not isinstance(listeners, list) or not listeners:
+        raise ValueError(f'{path}: "listeners" must be a non-empty array of tables')
+    result = []
+    for i, listener in enumerate(listeners):
+        try:
+            result.append(_parse_listener(listener, simulation_commands))
+        except (TypeError, ValueError) as e:
+            raise ValueError(f'{path}: listener {i}: {e}') from None
+    return result
+
+
+class _EchoRequestHandler(BaseRequestHandler):
+    "Sends received data back."
+
+    def handle(self) -> None:
+        while True:
+            data = self.request.recv(65536)
+            if not data:
+                return
+            self.request.sendall(data)
+
+
+class _DiscardRequestHandler(BaseRequestHandler):
+    "Discards received data."
+
+    def handle(self) -> None:
+        while self.request.recv(65536):
+            pass
+
+
+class Listener:
+    """A running listener, which is created by :func:`start_listener`.
+
+    :param config: The configuration of the listener.
+    :param server: The server of an HTTP or TCP listener.
+    :param controllers: Controllers of the simulations applied to the listener.
+    """
+
+    __slots__ = (
+        'config',
+        'controllers',
+        '_server',
+        '_thread',
+    )
+
+    def __init__(self, config: ListenerConfig, server: Optional[BaseServer], controllers: List[Controller]):
+        super().__init__()
+        self.config: ListenerConfig = config
+        "Same as ``config`` in :class:`Listener`."
+        self.controllers: List[Controller] = controllers
+        "Same as ``controllers`` in :class:`Listener`. For proxies, the first one is the :class:`ProxyController`."
+        self._server = server
+        self._thread: Optional[threading.Thread] = None
+        if server is not None:
+            self._thread = threading.Thread(target=server.serve_forever, name=f'Poorconn listener {config.name}',
+                                            daemon=True)
+            self._thread.start()
+
+    @property
+    def address(self) -> Tuple[str, int]:
+        "The address that the listener listens on, whose port is the actual port if port 0 was requested."
+        if self._server is None:
+            return self.controllers[0].address  # type: ignore[attr-defined, no-any-return]
+        return self._server.socket.getsockname()[:2]  # type: ignore[attr-defined, no-any-return]
+
+    def close(self) -> None:
+        "Stop the listener and remove its simulations."
+
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+        for controller in reversed(self.controllers):
+            controller.remove()
+
+
+def start_listener(config: ListenerConfig) -> Listener:
+    """Start a listener on background threads.
+
+    :param config: The configuration of the listener.
+    :return: The started listener.
+    :raises ValueError: ``config`` is a proxy without :attr:`~ListenerConfig.target`.
+    """
+
+    address = (config.host, config.port)
+    if config.type == 'proxy':
+        if config.target is None:
+            raise ValueError(f'{config.name}: "target" is missing')
+        return Listener(config, None, [start_proxy(config.target, simulation=config.profile,
+                                                   upstream_simulation=config.upstream_profile, address=address)])
+
+    server: BaseServer
+    if config.type == 'http':
+        server = _HTTPServer(address, pathlib.Path(config.directory))
+        if config.cache_size > 0:
+            server.file_cache = FileCache(config.cache_size)
+    else:
+        server = _TCPServer(address, _EchoRequestHandler if config.mode == 'echo' else _DiscardRequestHandler)
+    server.socket = make_socket_patchable(server.socket)  # type: ignore[attr-defined]
+    controllers: List[Controller] = [getattr(poorconn, name)(server.socket, **params)  # type: ignore[attr-defined]
+                                     for name, params in config.simulations]
+    if config.profile is not None:
+        controllers.append(simulate_upon_acceptance(server.socket, config.profile))  # type: ignore[attr-defined]
+    if config.http:
+        controllers.append(slow_down_http_responses(server, **config.http))  # type: ignore[arg-type]
+    return Listener(config, server, controllers)
+
+
+def serve_config(configs: List[ListenerConfig]) -> None:
+    """Start all listeners in ``configs`` in the current process, and serve until :class:`KeyboardInterrupt`.
+
+    :param configs: The configurations of the listeners.
+    """
+
+    listeners: List[Listener] = []
+    try:
+        for config in configs:
+            listeners.append(start_listener(config))
+            host, port = listeners[-1].address
+            print(f'poorconn: {config.name} listening on {host}:{port}', file=sys.stderr)
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for listener in listeners:
+            listener.close()
@@ -0,0 +1,75 @@
+# Copyright (C) 2021  Hong Xu <hong@topbug.net>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from __future__ import annotations
+
+from typing import List, Optional
+import weakref
+
+from ._clock import _timeline, Clock
+from ._wrappers import Wrapping
+
+
+class Controller:
+    """Base class of all controllers, which are returned by simulation functions to control patched socket objects.
+    Objects are always created by simulation functions and should not be created outside the :mod:`poorconn` package.
+
+    :param clock: The clock that the simulation tells time and sleeps with, or ``None`` for a new timeline (see
+        :meth:`.Clock.timeline`) of the clock that is in effect (see :func:`.get_clock`).
+
+    .. versionadded:: 0.3
+    """
+
+    __slots__ = (
+        '_wrappings',
+        '_children',
+        '_clock',
+        '_starting_time',
+        '__weakref__',
+    )
+
+    def __init__(self, clock: Optional[Clock] = None) -> None:
+        super().__init__()
+        self._wrappings: List[Wrapping] = []
+        # Controllers of connection sockets created by upon-acceptance simulations
+        self._children: weakref.WeakSet[Controller] = weakref.WeakSet()
+        self._clock: Clock = _timeline() if clock is None else clock
+        self._starting_time = self._clock.monotonic()
+
+    @property
+    def elapsed(self) -> float:
+        """Number of seconds since the simulation was applied, measured by the clock that was in effect then (see
+        :func:`.get_clock`), which the simulation keeps sleeping with afterwards. With a :class:`.VirtualClock`, it is
+        the simulated time that the simulation has spent on its own timeline (see :meth:`.VirtualClock.timeline`),
+        including that of simulations applied to accepted connection sockets, regardless of other simulations that
+        run in parallel."""
+        return self._clock.monotonic() - self._starting_time
+
+    def remove(self) -> None:
+        """Remove the simulation: Restore all patched methods of the socket object, so that it no longer pays for the
+        simulation. If another simulation has been stacked on top of this one, the patched methods turn into
+        pass-throughs and are restored once the simulations on top of them are also removed. For upon-acceptance
+        simulations, connection sockets that have been accepted are restored as well, and sockets accepted afterwards
+        are not affected.
+
+        Calling this function more than once has no further effect.
+        """
+
+        for wrapping in reversed(self._wrappings):
+            wrapping.remove()
+        self._wrappings.clear()
+        for child in tuple(self._children):
+            child.remove()
+        self._children.clear()
@@ -0,0 +1,356 @@
+# Copyright (C) 2021  Hong Xu <hong@topbug.net>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from __future__ import annotations
+
+import heapq
+import itertools
+import random
+from socket import socket, SOCK_DGRAM
+import threading
+from typing import Any, Callable, List, Optional, Tuple
+
+from ._clock import Clock
+from ._controller import Controller
+from ._wrappers import replace
+
+_Transmit = Callable[[], Any]
+"A function that sends a datagram with the original sending method when called."
+
+
+class _Scheduler:
+    """Call functions at given times on a single daemon thread, which is shared by all datagram simulations, so that
+    high packet rates do not require one sleeping thread per datagram. The thread is started upon the first call to
+    :meth:`schedule`."""
+
+    __slots__ = (
+        '_condition',
+        '_queue',
+        '_counter',
+        '_thread',
+    )
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._condition = threading.Condition()
+        # Entries are (deadline, sequence number, function, clock of the deadline). The sequence number keeps the order
+        # of functions that are scheduled at the same time and prevents functions from being compared.
+        self._queue: List[Tuple[float, int, _Transmit, Clock]] = []
+        self._counter = itertools.count()
+        self._thread: Optional[threading.Thread] = None
+
+    def schedule(self, t: float, function: _Transmit, clock: Clock) -> None:
+        "Call ``function`` on the scheduler thread ``t`` seconds later, as told by ``clock``."
+
+        with self._condition:
+            heapq.heappush(self._queue, (clock.monotonic() + t, next(self._counter), function, clock))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='Poorconn datagram scheduler', daemon=True)
+                self._thread.start()
+            self._condition.notify()
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while not self._queue or self._queue[0][0] > self._queue[0][3].monotonic():
+                    if self._queue:
+                        deadline, _, _, clock = self._queue[0]
+                        clock.wait(self._condition, deadline - clock.monotonic())
+                    else:
+                        self._condition.wait()
+                function = heapq.heappop(self._queue)[2]
+            _transmit(function)
+
+
+_scheduler = _Scheduler()
+
+
+def _transmit(function: _Transmit) -> None:
+    "Send a datagram. Errors are ignored, since the sender no longer waits for the result, as if it was lost."
+
+    try:
+        function()
+    except OSError:
+        pass
+
+
+def _replace_datagram_sending(s: socket, controller: Controller, handle: Callable[[_Transmit], None]) -> None:
+    """Replace :meth:`~socket.socket.send`, :meth:`~socket.socket.sendto` and :meth:`~socket.socket.sendmsg` of ``s``,
+    so that each datagram is passed to ``handle`` as a function that sends it, and the replaced methods return the size
+    of the datagram immediately.
+
+    :param s: The datagram :class:`socket.socket` object.
+    :param controller: The controller of ``s``, which keeps track of the replacements.
+    :param handle: The function that decides when, and how many times, to call the function that sends a datagram.
+    :raises ValueError: ``s`` is not a datagram socket.
+    """
+
+    if s.type != SOCK_DGRAM:
+        raise ValueError(f'Datagram simulations require a datagram socket, but the type of the socket is {s.type!r}')
+
+    for meth in ('send', 'sendto', 'sendmsg') if hasattr(s, 'sendmsg') else ('send', 'sendto'):
+        def wrapping_function(self: socket, data: Any, *args: Any, _original: Callable[..., Any] = getattr(s, meth),
+                              _vectored: bool = meth == 'sendmsg', **kwargs: Any) -> int:
+            # The caller may reuse the buffers before the datagram is sent
+            if _vectored:  # sendmsg sends a sequence of buffers as one datagram
+                data = [bytes(buffer) for buffer in data]
+                size = sum(len(buffer) for buffer in data)
+            else:
+                data = bytes(data)
+                size = len(data)
+            handle(lambda: _original(data, *args, **kwargs))
+            return size
+
+        controller._wrappings.append(replace(s, meth=meth, function=wrapping_function))
+
+
+class DelayDatagramsController(Controller):
+    """Controller for :func:`.delay_datagrams`. Objects are always created and returned by :func:`.delay_datagrams` and
+    should not be created outside the :mod:`poorconn` package.
+
+    :param t: Same as ``t`` in :func:`delay_datagrams`.
+    :param jitter: Same as ``jitter`` in :func:`delay_datagrams`.
+
+    .. versionadded:: 0.3
+    """
+
+    __slots__ = (
+        't',
+        'jitter',
+    )
+
+    def __init__(self, t: float, jitter: float):
+        super().__init__()
+        self.t: float = t
+        """Same as ``t`` in :func:`delay_datagrams`. Updating it in the controller affects ``s`` in
+        :func:`delay_datagrams`."""
+        self.jitter: float = jitter
+        """Same as ``jitter`` in :func:`delay_datagrams`. Updating it in the controller affects ``s`` in
+        :func:`delay_datagrams`."""
+
+
+def delay_datagrams(s: socket, t: float, jitter: float = 0.0) -> DelayDatagramsController:
+    """Delay every datagram sent by ``s`` by ``t`` seconds plus a random amount of time of up to ``jitter`` seconds.
+    Datagrams whose delays differ by more than the interval between them arrive out of order.
+
+    This function achieves the results by patching ``s``'s member methods :meth:`~socket.socket.send`,
+    :meth:`~socket.socket.sendto` and :meth:`~socket.socket.sendmsg`, which return immediately. Delayed datagrams are
+    sent by a single scheduler thread that is shared by all datagram simulations.
+
+    :param s: The datagram :class:`socket.socket` object whose datagrams are to be delayed.
+    :param t: Number of seconds to delay.
+    :param jitter: Maximum number of extra seconds to delay.
+
+    :return: A :class:`DelayDatagramsController` object that controls the patched socket object.
+    :raises ValueError: ``s`` is not a datagram socket.
+
+    .. versionadded:: 0.3
+    """
+
+    controller = DelayDatagramsController(t=t, jitter=jitter)
+
+    def handle(transmit: _Transmit) -> None:
+        _scheduler.schedule(controller.t + random.uniform(0, controller.jitter), transmit, controller._clock)
+
+    _replace_datagram_sending(s, controller, handle)
+
+    return controller
+
+
+class DropDatagramsController(Controller):
+    """Controller for :func:`.drop_datagrams`. Objects are always created and returned by :func:`.drop_datagrams` and
+    should not be created outside the :mod:`poorconn` package.
+
+    :param probability: Same as ``probability`` in :func:`drop_datagrams`.
+
+    .. versionadded:: 0.3
+    """
+
+    __slots__ = (
+        'probability',
+        'dropped',
+    )
+
+    def __init__(self, probability: float):
+        super().__init__()
+        self.probability: float = probability
+        """Same as ``probability`` in :func:`drop_datagrams`. Updating it in the controller affects ``s`` in
+        :func:`drop_datagrams`."""
+        self.dropped: int = 0
+        "Number of datagrams that have been dropped."
+
+
+def drop_datagrams(s: socket, probability: float) -> DropDatagramsController:
+    """Drop every datagram sent by ``s`` with probability ``probability``.
+
+    This function achieves the results by patching ``s``'s member methods :meth:`~socket.socket.send`,
+    :meth:`~socket.socket.sendto` and :meth:`~socket.socket.sendmsg`, which report dropped datagrams as sent.
+
+    :param s: The datagram :class:`socket.socket` object whose datagrams are to be dropped.
+    :param probability: Probability of dropping each datagram, between 0 and 1.
+
+    :return: A :class:`DropDatagramsController` object that controls the patched socket object.
+    :raises ValueError: ``s`` is not a datagram socket.
+
+    .. versionadded:: 0.3
+    """
+
+    controller = DropDatagramsController(probability=probability)
+
+    def handle(transmit: _Transmit) -> None:
+        if random.random() < controller.probability:
+            controller.dropped += 1
+        else:
+            transmit()
+
+    _replace_datagram_sending(s, controller, handle)
+
+    return controller
+
+
+class DuplicateDatagramsController(Controller):
+    """Controller for :func:`.duplicate_datagrams`. Objects are always created and returned by
+    :func:`.duplicate_datagrams` and should not be created outside the :mod:`poorconn` package.
+
+    :param probability: Same as ``probability`` in :func:`duplicate_datagrams`.
+
+    .. versionadded:: 0.3
+    """
+
+    __slots__ = (
+        'probability',
+        'duplicated',
+    )
+
+    def __init__(self, probability: float):
+        super().__init__()
+        self.probability: float = probability
+        """Same as ``probability`` in :func:`duplicate_datagrams`. Updating it in the controller affects ``s`` in
+        :func:`duplicate_datagrams`."""
+        self.duplicated: int = 0
+        "Number of datagrams that have been sent twice."
+
+
+def duplicate_datagrams(s: socket, probability: float) -> DuplicateDatagramsController:
+    """Send every datagram sent by ``s`` twice with probability ``probability``.
+
+    This function achieves the results by patching ``s``'s member methods :meth:`~socket.socket.send`,
+    :meth:`~socket.socket.sendto` and :meth:`~socket.socket.sendmsg`.
+
+    :param s: The datagram :class:`socket.socket` object whose datagrams are to be duplicated.
+    :param probability: Probability of duplicating each datagram, between 0 and 1.
+
+    :return: A :class:`DuplicateDatagramsController` object that controls the patched socket object.
+    :raises ValueError: ``s`` is not a datagram socket.
+
+    .. versionadded:: 0.3
+    """
+
+    controller = DuplicateDatagramsController(probability=probability)
+
+    def handle(transmit: _Transmit) -> None:
+        transmit()
+        if random.random() < controller.probability:
+            controller.duplicated += 1
+            transmit()
+
+    _replace_datagram_sending(s, controller, handle)
+
+    return controller
+
+
+class ReorderDatagramsController(Controller):
+    """Controller for :func:`.reorder_datagrams`. Objects are always created and returned by :func:`.reorder_datagrams`
+    and should not be created outside the :mod:`poorconn` package.
+
+    :param buffer_size: Same as ``buffer_size`` in :func:`reorder_datagrams`.
+    :param max_hold: Same as ``max_hold`` in :func:`reorder_datagrams`.
+
+    .. versionadded:: 0.3
+    """
+
+    __slots__ = (
+        'buffer_size',
+        'max_hold',
+        '_buffer',
+        '_lock',
+    )
+
+    def __init__(self, buffer_size: int, max_hold: float):
+        super().__init__()
+        self.buffer_size: int = buffer_size
+        """Same as ``buffer_size`` in :func:`reorder_datagrams`. Updating it in the controller affects ``s`` in
+        :func:`reorder_datagrams`."""
+        self.max_hold: float = max_hold
+        """Same as ``max_hold`` in :func:`reorder_datagrams`. Updating it in the controller affects datagrams that are
+        sent afterwards."""
+        self._buffer: List[_Transmit] = []
+        self._lock = threading.Lock()
+
+    def _hold(self, transmit: _Transmit) -> None:
+        "Put a datagram into the buffer, and send a random one from the buffer if it is full."
+
+        with self._lock:
+            self._buffer.append(transmit)
+            released = self._buffer.pop(random.randrange(len(self._buffer))) \
+                if len(self._buffer) > self.buffer_size else None
+        if released is not None:
+            _transmit(released)
+        _scheduler.schedule(self.max_hold, lambda: self._release(transmit), self._clock)
+
+    def _release(self, transmit: _Transmit) -> None:
+        "Send a datagram if it is still in the buffer."
+
+        with self._lock:
+            try:
+                self._buffer.remove(transmit)
+            except ValueError:  # It has been sent
+                return
+        transmit()
+
+    def remove(self) -> None:
+        "Same as :meth:`.Controller.remove`, and additionally sends all datagrams in the buffer in order."
+
+        super().remove()
+        with self._lock:
+            buffer, self._buffer = self._buffer, []
+        for transmit in buffer:
+            _transmit(transmit)
+
+
+def reorder_datagrams(s: socket, buffer_size: int, max_hold: float = 0.1) -> ReorderDatagramsController:
+    """Reorder datagrams sent by ``s`` with a bounded reorder buffer: Every datagram is held in the buffer, and whenever
+    the buffer holds more than ``buffer_size`` datagrams, a random one is sent. A datagram is never held for more than
+    ``max_hold`` seconds, so that the last few datagrams of a burst are not held indefinitely.
+
+    This function achieves the results by patching ``s``'s member methods :meth:`~socket.socket.send`,
+    :meth:`~socket.socket.sendto` and :meth:`~socket.socket.sendmsg`, which return immediately. Held datagrams are
+    released by a single scheduler thread that is shared by all datagram simulations.
+
+    :param s: The datagram :class:`socket.socket` object whose datagrams are to be reordered.
+    :param buffer_size: Maximum number of datagrams held in the buffer. A datagram can be overtaken by up to
+        ``buffer_size`` datagrams sent after it.
+    :param max_hold: Maximum number of seconds for which a datagram is held.
+
+    :return: A :class:`ReorderDatagramsController` object that controls the patched socket object. Removing it sends
+        all held datagrams immediately.
+    :raises ValueError: ``s`` is not a datagram socket.
+
+    .. versionadded:: 0.3
+    """
+
+    controller = ReorderDatagramsController(buffer_size=buffer_size, max_hold=max_hold)
+    _replace_datagram_sending(s, controller, controller._hold)
+    return controller
@@ -0,0 +1,647 @@
+# Copyright (C) 2021  Hong Xu <hong@topbug.net>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from __future__ import annotations
+
+import collections
+import datetime
+import email.utils
+from http import HTTPStatus
+from http.server import SimpleHTTPRequestHandler
+import os
+import re
+from socketserver import BaseServer
+import threading
+from typing import Any, BinaryIO, Callable, Dict, Optional, Tuple, Type
+import urllib.parse
+
+from ._clock import Clock, get_clock, Pacer
+from ._controller import Controller
+
+
+_RANGE_PATTERN = re.compile(r'\s*bytes\s*=\s*(\d*)\s*-\s*(\d*)\s*', re.IGNORECASE)
+
+
+def _parse_range(value: str, size: int) -> Optional[Tuple[int, int]]:
+    """Parse the value of a ``Range`` header for a resource of ``size`` bytes into the positions of the first and the
+    last bytes. Return ``None`` if the value is not a single byte range, which RFC 7233 allows servers to ignore.
+
+    :raises ValueError: The range is not satisfiable.
+    """
+
+    match = _RANGE_PATTERN.fullmatch(value)
+    if match is None or match.group(1) == match.group(2) == '':
+        return None
+    first, last = match.groups()
+    if not first:  # The last bytes
+        length = int(last)
+        if length == 0 or size == 0:
+            raise ValueError(f'Range {value!r} is not satisfiable')
+        return max(0, size - length), size - 1
+    start = int(first)
+    if last and start > int(last):
+        return None
+    if start >= size:
+        raise ValueError(f'Range {value!r} is not satisfiable')
+    return start, min(int(last), size - 1) if last else size - 1
+
+
+class _MemoryReader:
+    "Reads bytes in :class:`memoryview` slices without copying them."
+
+    __slots__ = (
+        '_view',
+        '_position',
+    )
+
+    def __init__(self, content: bytes):
+        super().__init__()
+        self._view = memoryview(content)
+        self._position = 0
+
+    def read(self, size: int = -1) -> memoryview:
+        end = len(self._view) if size < 0 else min(self._position + size, len(self._view))
+        data = self._view[self._position:end]
+        self._position = max(self._position, end)
+        return data
+
+    def seek(self, position: int) -> None:
+        self._position = position
+
+    def close(self) -> None:
+        pass
+
+
+class FileCache:
+    """A bounded cache of the contents of files for :class:`HTTPRequestHandler`, which evicts the least recently used
+    files once their total size exceeds ``max_size``. A file is read again once its modification time or size changes.
+    Files larger than ``max_size`` are not cached. A server serves files from the cache if it is the ``file_cache``
+    attribute of the server, so that many clients downloading the same files measure the simulation rather than disk
+    I/O::
+
+        with ThreadingHTTPServer(('localhost', 8000), HTTPRequestHandler) as httpd:
+            httpd.file_cache = FileCache(64 * 1024 * 1024)
+            httpd.serve_forever()
+
+    The cache is safe to be shared by threads.
+
+    :param max_size: Maximum number of bytes of the contents of the cached files.
+
+    .. versionadded:: 0.3
+    """
+
+    __slots__ = (
+        'max_size',
+        'size',
+        'hits',
+        'misses',
+        '_entries',
+        '_lock',
+    )
+
+    def __init__(self, max_size: int):
+        super().__init__()
+        self.max_size: int = max_size
+        "Same as ``max_size`` in :class:`FileCache`. Decreasing it takes effect when the next file is cached."
+        self.size: int = 0
+        "Number of bytes of the contents of the cached files."
+        self.hits: int = 0
+        "Number of times that a file has been found in the cache."
+        self.misses: int = 0
+        "Number of times that a file has been read from the disk."
+        self._entries: collections.OrderedDict[str, Tuple[bytes, os.stat_result]] = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        "Number of cached files."
+        return len(self._entries)
+
+    def get(self, path: str) -> Optional[Tuple[bytes, os.stat_result]]:
+        """Get the content of the file at ``path`` and its status (see :func:`os.stat`), reading the file if it is not
+        cached or has changed.
+
+        :param path: The path to the file.
+        :return: The content and the status of the file, or ``None`` if the file is too large to be cached.
+        :raises OSError: The file cannot be read.
+        """
+
+        fs = os.stat(path)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and (entry[1].st_mtime_ns, entry[1].st_size) == (fs.st_mtime_ns, fs.st_size):
+                self._entries.move_to_end(path)
+                self.hits += 1
+                return entry
+            self.misses += 1
+        if fs.st_size > self.max_size:
+            return None
+
+        with open(path, 'rb') as f:
+            fs = os.fstat(f.fileno())
+            content = f.read()
+        if len(content) != fs.st_size:  # Being modified
+            return None
+        with self._lock:
+            previous = self._entries.pop(path, None)
+            if previous is not None:
+                self.size -= len(previous[0])
+            self._entries[path] = entry = (content, fs)
+            self.size += len(content)
+            while self.size > self.max_size:
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+        return entry
+
+
+class _LimitedReader:
+    "Reads up to a number of bytes from a file object, which is closed along with it."
+
+    __slots__ = (
+        '_file',
+        '_remaining',
+    )
+
+    def __init__(self, file: BinaryIO, length: int):
+        super().__init__()
+        self._file = file
+        self._remaining = length
+
+    def read(self, size: int = -1) -> bytes:
+        size = self._remaining if size < 0 else min(size, self._remaining)
+        data = self._file.read(size)
+        self._remaining -= len(data)
+        return data
+
+    def close(self) -> None:
+        self._file.close()
+
+
+_PAYLOAD = bytes(range(256)) * 4096
+"""The content of bodies of synthetic endpoints, whose byte ``i`` is ``i % 256``. Bodies are sent in slices of it, so
+that serving them neither reads files nor allocates memory."""
+_PAYLOAD_VIEW = memoryview(_PAYLOAD)
+
+
+class _PayloadReader:
+    """Reads a number of bytes of the repeated :data:`_PAYLOAD` in :class:`memoryview` slices, each no longer than
+    ``piece`` bytes and returned ``interval`` seconds after the previous one (or the first read)."""
+
+    __slots__ = (
+        '_remaining',
+        '_position',
+        '_piece',
+        '_interval',
+        '_pacer',
+    )
+
+    def __init__(self, length: int, piece: Optional[int] = None, interval: float = 0.0):
+        super().__init__()
+        self._remaining = length
+        self._position = 0
+        self._piece = piece
+        self._interval = interval
+        self._pacer = Pacer() if interval > 0 else None
+
+    def read(self, size: int = -1) -> memoryview:
+        size = self._remaining if size < 0 else min(size, self._remaining)
+        if self._piece is not None:
+            size = min(size, self._piece)
+        # The payload repeats every 256 bytes, so that a slice can start at any position modulo 256
+        offset = self._position % 256
+        size = min(size, len(_PAYLOAD) - offset)
+        if size > 0 and self._pacer is not None:
+            self._pacer.wait(self._interval)
+        self._position += size
+        self._remaining -= size
+        return _PAYLOAD_VIEW[offset:offset + size]
+
+    def close(self) -> None:
+        pass
+
+
+def _non_negative(value: str, name: str) -> int:
+    "Convert ``value``, which is the parameter ``name`` of a synthetic endpoint, to a non-negative integer."
+
+    if not value.isdigit():
+        raise ValueError(f'{name} must be a non-negative integer')
+    return int(value)
+
+
+def _write_chunk(outputfile: Any, data: Any) -> None:
+    "Write ``data`` to ``outputfile`` as a chunk of the chunked transfer encoding without copying ``data``."
+    outputfile.write(b'%x\r\n' % len(data))
+    outputfile.write(data)
+    outputfile.write(b'\r\n')
+
+
+class HTTPRequestHandler(SimpleHTTPRequestHandler):
+    """A request handler that serves static files like :class:`http.server.SimpleHTTPRequestHandler`, but speaks
+    HTTP/1.1: Connections persist across requests unless the client closes them, pipelined requests are answered in
+    order, and single byte ranges of files (the ``Range`` and ``If-Range`` headers) are served as partial content, so
+    that connection reuse and resumed downloads can be tested. Since a connection is accepted only once, simulations
+    applied upon acceptance, such as :func:`.emulate_slow_start_upon_acceptance`, keep their states across the requests
+    of a connection. It is best used with :class:`http.server.ThreadingHTTPServer`, which serves persistent connections
+    in parallel::
+
+        with ThreadingHTTPServer(('localhost', 8000), HTTPRequestHandler) as httpd:
+            httpd.socket = make_socket_patchable(httpd.socket)
+            limit_link_rate_upon_acceptance(httpd.socket, rate=1024)
+            httpd.serve_forever()
+
+    It also serves the following synthetic endpoints for throughput tests. Their bodies are slices of one shared
+    buffer, in which byte ``i`` is ``i % 256``, so that neither disk I/O nor memory allocation affects the results.
+    Files with the same paths take precedence.
+
+    If the server has a ``file_cache`` attribute, which is a :class:`FileCache` object, files are served from it in
+    :class:`memoryview` slices instead of being read from the disk for every request.
+
+    - ``/bytes/<n>``: ``n`` bytes.
+    - ``/stream/<n>?chunk=<size>``: ``n`` bytes, each ``size`` bytes (1024 by default) of which are written separately
+      and, for HTTP/1.1 requests, sent as a chunk of the chunked transfer encoding.
+    - ``/drip?numbytes=<n>&duration=<seconds>&delay=<seconds>``: ``n`` bytes (10 by default) that are written one by
+      one over ``duration`` seconds (2 by default), after a delay of ``delay`` seconds (0 by default).
+
+    .. versionadded:: 0.3
+    """
+
+    protocol_version = 'HTTP/1.1'
+    # Whether the body of the current response is sent with the chunked transfer encoding
+    _poorconn_chunked: bool = False
+    # The timeline of the connection, which the responses to it are slowed down on
+    _poorconn_clock: Optional[Clock] = None
+
+    def handle_one_request(self) -> None:
+        self._poorconn_chunked = False
+        super().handle_one_request()
+
+    def copyfile(self, source: Any, outputfile: Any) -> None:
+        if not self._poorconn_chunked:
+            super().copyfile(source, outputfile)
+            return
+        while True:
+            data = source.read(65536)
+            if not data:
+                break
+            _write_chunk(outputfile, data)
+        outputfile.write(b'0\r\n\r\n')
+
+    def _send_payload_head(self, length: int, chunked: bool = False) -> None:
+        "Send the header of a response whose body is ``length`` bytes of the payload of synthetic endpoints."
+
+        self.send_response(HTTPStatus.OK)
+        self.send_header('Content-type', 'application/octet-stream')
+        if chunked and self.request_version >= 'HTTP/1.1':
+            self._poorconn_chunked = True
+            self.send_header('Transfer-Encoding', 'chunked')
+        else:
+            self.send_header('Content-Length', str(length))
+        self.end_headers()
+
+    def _send_bytes(self, path: str, query: Dict[str, str]) -> _PayloadReader:
+        "Endpoint ``/bytes/<n>``: ``n`` bytes."
+
+        length = _non_negative(path, 'length')
+        self._send_payload_head(length)
+        return _PayloadReader(length)
+
+    def _send_stream(self, path: str, query: Dict[str, str]) -> _PayloadReader:
+        "Endpoint ``/stream/<n>?chunk=<size>``: ``n`` bytes in chunks of ``size`` bytes."
+
+        length, chunk = _non_negative(path, 'length'), _non_negative(query.get('chunk', '1024'), 'chunk')
+        if chunk == 0:
+            raise ValueError('chunk must be positive')
+        self._send_payload_head(length, chunked=True)
+        return _PayloadReader(length, piece=chunk)
+
+    def _send_drip(self, path: str, query: Dict[str, str]) -> _PayloadReader:
+        "Endpoint ``/drip?numbytes=<n>&duration=<seconds>&delay=<seconds>``: ``n`` bytes one by one."
+
+        if path:
+            raise ValueError(f'Unexpected path {path!r}')
+        length = _non_negative(query.get('numbytes', '10'), 'numbytes')
+        duration, delay = float(query.get('duration', 2)), float(query.get('delay', 0))
+        if not (duration >= 0 and delay >= 0):
+            raise ValueError('duration and delay must not be negative')
+        get_clock().sleep(delay)
+        self._send_payload_head(length)
+        return _PayloadReader(length, piece=1, interval=duration / length if length > 0 else 0.0)
+
+    _synthetic_endpoints: Dict[str, Callable[[HTTPRequestHandler, str, Dict[str, str]], _PayloadReader]] = {
+        'bytes': _send_bytes,
+        'stream': _send_stream,
+        'drip': _send_drip,
+    }
+
+    def send_head(self) -> Any:
+        path = self.translate_path(self.path)
+        if not os.path.exists(path):  # Files take precedence over synthetic endpoints
+            url = urllib.parse.urlsplit(self.path)
+            name, _, endpoint_path = url.path.lstrip('/').partition('/')
+            endpoint = self._synthetic_endpoints.get(name)
+            if endpoint is not None:
+                try:
+                    return endpoint(self, endpoint_path, dict(urllib.parse.parse_qsl(url.query)))
+                except ValueError as e:  # Raised before the header is sent
+                    self.send_error(HTTPStatus.BAD_REQUEST, str(e))
+                    return None
+        if path.endswith('/') or not os.path.isfile(path):
+            return super().send_head()
+
+        cache: Optional[FileCache] = getattr(self.server, 'file_cache', None)
+        cached = None
+        if cache is not None:
+            try:
+                cached = cache.get(path)
+            except OSError:  # Read from the disk below, which reports the error
+                pass
+        body: Any
+        if cached is not None:
+            content, fs = cached
+            body = _MemoryReader(content)
+        else:
+            try:
+                body = open(path, 'rb')
+            except OSError:  # Reported by SimpleHTTPRequestHandler
+                return super().send_head()
+        try:
+            if cached is None:
+                fs = os.fstat(body.fileno())
+            return self._send_file_head(path, body, fs)
+        except BaseException:
+            body.close()
+            raise
+
+    def _not_modified(self, fs: os.stat_result) -> bool:
+        "Whether the file has not been modified since the time in the ``If-Modified-Since`` header."
+
+        if 'If-Modified-Since' not in self.headers or 'If-None-Match' in self.headers:
+            return False
+        try:
+            ims = email.utils.parsedate_to_datetime(self.headers['If-Modified-Since'])
+        except (TypeError, IndexError, OverflowError, ValueError):
+            return False
+        if ims.tzinfo is None:
+            ims = ims.replace(tzinfo=datetime.timezone.utc)
+        if ims.tzinfo is not datetime.timezone.utc:
+            return False
+        return datetime.datetime.fromtimestamp(fs.st_mtime, datetime.timezone.utc).replace(microsecond=0) <= ims
+
+    def _send_file_head(self, path: str, body: Any, fs: os.stat_result) -> Any:
+        """Send the header of a response with the content of a file, which can be read from ``body``, and return the
+        object to read the body of the response from, if any. This is what :class:`SimpleHTTPRequestHandler` does, plus
+        byte ranges."""
+
+        last_modified = self.date_time_string(fs.st_mtime)
+        if self._not_modified(fs):
+            body.close()
+            self.send_response(HTTPStatus.NOT_MODIFIED)
+            self.end_headers()
+            return None
+
+        byte_range = None
+        # A range is ignored if the file has changed since the client got the rest of it
+        if 'Range' in self.headers and self.headers.get('If-Range', last_modified) == last_modified:
+            try:
+                byte_range = _parse_range(self.headers['Range'], fs.st_size)
+            except ValueError:
+                body.close()
+                self.send_response(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+                self.send_header('Content-Range', f'bytes */{fs.st_size}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return None
+
+        if byte_range is None:
+            self.send_response(HTTPStatus.OK)
+            length = fs.st_size
+        else:
+            start, end = byte_range
+            length = end - start + 1
+            self.send_response(HTTPStatus.PARTIAL_CONTENT)
+            self.send_header('Content-Range', f'bytes {start}-{end}/{fs.st_size}')
+            body.seek(start)
+            body = _LimitedReader(body, length)
+        self.send_header('Content-type', self.guess_type(path))
+        self.send_header('Content-Length', str(length))
+        self.send_header('Last-Modified', last_modified)
+        self.end_headers()
+        return body
+
+
+class SlowDownHTTPResponsesController(Controller):
+    """Controller for :func:`.slow_down_http_responses`. Objects are always created and returned by
+    :func:`.slow_down_http_responses` and should not be created outside the :mod:`poorconn` package. Updating its
+    attributes affects responses that start afterwards.
+
+    :param server: The server whose responses are slowed down.
+    :param ttfb: Same as ``ttfb`` in :func:`slow_down_http_responses`.
+    :param header_delay: Same as ``header_delay`` in :func:`slow_down_http_responses`.
+    :param chunk_size: Same as ``chunk_size`` in :func:`slow_down_http_responses`.
+    :param chunk_delay: Same as ``chunk_delay`` in :func:`slow_down_http_responses`.
+    :param stall_after: Same as ``stall_after`` in :func:`slow_down_http_responses`.
+    :param stall: Same as ``stall`` in :func:`slow_down_http_responses`.
+
+    .. versionadded:: 0.3
+    """
+
+    __slots__ = (
+        'ttfb',
+        'header_delay',
+        'chunk_size',
+        'chunk_delay',
+        'stall_after',
+        'stall',
+        'responses',
+        'pacer',
+        '_server',
+        '_handler_class',
+        '_original_handler_class',
+        '_lock',
+    )
+
+    def __init__(self, server: BaseServer, ttfb: float, header_delay: float, chunk_size: Optional[int],
+                 chunk_delay: float, stall_after: Optional[int], stall: float):
+        super().__init__()
+        self.ttfb: float = ttfb
+        "Same as ``ttfb`` in :func:`slow_down_http_responses`."
+        self.header_delay: float = header_delay
+        "Same as ``header_delay`` in :func:`slow_down_http_responses`."
+        self.chunk_size: Optional[int] = chunk_size
+        "Same as ``chunk_size`` in :func:`slow_down_http_responses`."
+        self.chunk_delay: float = chunk_delay
+        "Same as ``chunk_delay`` in :func:`slow_down_http_responses`."
+        self.stall_after: Optional[int] = stall_after
+        "Same as ``stall_after`` in :func:`slow_down_http_responses`."
+        self.stall: float = stall
+        "Same as ``stall`` in :func:`slow_down_http_responses`."
+        self.responses: int = 0
+        "Number of responses that have been started."
+        self.pacer: Pacer = Pacer()
+        """A :class:`.Pacer` object that reports how precise the delays between the chunks of bodies are. The chunks of
+        each body are paced on their own schedule, whose statistics are added to it when the body has been sent."""
+        self._server = server
+        self._original_handler_class: Type[SimpleHTTPRequestHandler] = server.RequestHandlerClass  # type: ignore
+        self._handler_class: Type[SimpleHTTPRequestHandler] = type(
+            f'Slow{self._original_handler_class.__name__}',
+            (_SlowHTTPRequestHandlerMixin, self._original_handler_class), {'_poorconn_controller': self})
+        self._lock = threading.Lock()
+
+    def remove(self) -> None:
+        "Same as :meth:`.Controller.remove`, and additionally restores the request handler class of the server."
+
+        if self._server.RequestHandlerClass is self._handler_class:
+            self._server.RequestHandlerClass = self._original_handler_class
+        super().remove()
+
+
+class _SlowHTTPRequestHandlerMixin:
+    """Mixin of :class:`http.server.SimpleHTTPRequestHandler` classes that simulates the slowness configured by
+    :attr:`_poorconn_controller`."""
+
+    _poorconn_controller: SlowDownHTTPResponsesController
+    # Whether the body of the current response is sent with the chunked transfer encoding
+    _poorconn_chunked: bool = False
+    # The timeline of the connection, which the responses to it are slowed down on
+    _poorconn_clock: Optional[Clock] = None
+
+    # Attributes of BaseHTTPRequestHandler
+    command: str
+    request_version: str
+    protocol_version: str
+    wfile: Any
+
+    def _poorconn_timeline(self) -> Clock:
+        "Get the timeline of the connection, which is created upon its first response."
+
+        if self._poorconn_clock is None:
+            self._poorconn_clock = self._poorconn_controller._clock.timeline()
+        return self._poorconn_clock
+
+    def send_response(self, code: int, message: Optional[str] = None) -> None:
+        controller = self._poorconn_controller
+        with controller._lock:
+            controller.responses += 1
+        # Bodies of errors are written without copyfile(), and are never chunked
+        self._poorconn_chunked = (controller.chunk_size is not None and self.command == 'GET' and
+                                  200 <= code < 300 and code != 204 and self.request_version >= 'HTTP/1.1')
+        if self._poorconn_chunked and self.protocol_version < 'HTTP/1.1':
+            # The chunked transfer encoding requires HTTP/1.1, which persists connections unless told otherwise
+            self.protocol_version = 'HTTP/1.1'
+            super().send_response(code, message)  # type: ignore[misc]
+            self.send_header('Connection', 'close')
+            return
+        super().send_response(code, message)  # type: ignore[misc]
+
+    def send_header(self, keyword: str, value: str) -> None:
+        if self._poorconn_chunked and keyword.lower() == 'content-length':
+            keyword, value = 'Transfer-Encoding', 'chunked'
+        super().send_header(keyword, value)  # type: ignore[misc]
+
+    def flush_headers(self) -> None:
+        controller = self._poorconn_controller
+        lines = getattr(self, '_headers_buffer', [])
+        if not lines or (controller.ttfb <= 0 and controller.header_delay <= 0):
+            super().flush_headers()  # type: ignore[misc]
+            return
+        clock = self._poorconn_timeline()
+        clock.sleep(controller.ttfb)
+        # The first line is the status line, followed by the header lines and the empty line that ends them
+        for i, line in enumerate(lines):
+            if i > 0:
+                clock.sleep(controller.header_delay)
+            self.wfile.write(line)
+        self._headers_buffer = []  # type: ignore[var-annotated]
+
+    def copyfile(self, source: Any, outputfile: Any) -> None:
+        controller = self._poorconn_controller
+        chunk_size, chunk_delay = controller.chunk_size, controller.chunk_delay
+        stall_after, stall = controller.stall_after, controller.stall
+        if chunk_size is None and stall_after is None:
+            super().copyfile(source, outputfile)  # type: ignore[misc]
+            return
+
+        # Responses are sent concurrently, so that each of them has its own schedule
+        pacer = Pacer(clock=self._poorconn_timeline())
+        written = 0
+        try:
+            while True:
+                if stall_after is not None and written >= stall_after:
+                    self._poorconn_timeline().sleep(stall)
+                    stall_after = None
+                size = chunk_size or 65536
+                if stall_after is not None:
+                    size = min(size, stall_after - written)
+                data = source.read(size)
+                if not data:
+                    break
+                if written > 0 and chunk_size is not None:
+                    pacer.wait(chunk_delay)
+                if self._poorconn_chunked:
+                    _write_chunk(outputfile, data)
+                else:
+                    outputfile.write(data)
+                written += len(data)
+        finally:
+            controller.pacer._add(pacer)  # Before the end of the body, which the client may wait for
+        if self._poorconn_chunked:
+            outputfile.write(b'0\r\n\r\n')
+
+
+def slow_down_http_responses(server: BaseServer, *, ttfb: float = 0.0, header_delay: float = 0.0,
+                             chunk_size: Optional[int] = None, chunk_delay: float = 0.0,
+                             stall_after: Optional[int] = None, stall: float = 0.0) -> SlowDownHTTPResponsesController:
+    """Slow down the responses of an HTTP server at the HTTP level, which socket-level simulations cannot tell apart:
+
+    - Delay the status line by ``ttfb`` seconds, i.e., slow time to first byte.
+    - Delay each line of the header after the status line by ``header_delay`` seconds, i.e., trickled headers.
+    - Send the bodies of successful ``GET`` responses in chunks of ``chunk_size`` bytes, each ``chunk_delay`` seconds
+      after the previous one. If the request is HTTP/1.1, the chunked transfer encoding is used, which streaming parsers
+      and progressive rendering handle chunk by chunk.
+    - Stall for ``stall`` seconds after the first ``stall_after`` bytes of such bodies.
+
+    ``server`` must be a :class:`socketserver.BaseServer` object, such as :class:`http.server.HTTPServer`, whose request
+    handler class is a subclass of :class:`http.server.SimpleHTTPRequestHandler`. The request handler class is replaced
+    by a subclass that simulates the slowness, and is restored upon :meth:`~.Controller.remove`. Socket-level
+    simulations can be applied to the server socket as well::
+
+        with HTTPServer(('localhost', 8000), SimpleHTTPRequestHandler) as httpd:
+            slow_down_http_responses(httpd, ttfb=2, chunk_size=1024, chunk_delay=0.1)
+            httpd.serve_forever()
+
+    :param server: The server to be slowed down.
+    :param ttfb: Number of seconds to delay the status line.
+    :param header_delay: Number of seconds to delay each header line.
+    :param chunk_size: Number of bytes of each chunk of bodies, or ``None`` to send bodies as usual.
+    :param chunk_delay: Number of seconds between chunks. Only takes effect if ``chunk_size`` is not ``None``.
+    :param stall_after: Number of bytes of bodies to send before stalling, or ``None`` for no stall.
+    :param stall: Number of seconds to stall for.
+    :raises TypeError: The request handler class of ``server`` is not a subclass of
+        :class:`http.server.SimpleHTTPRequestHandler`.
+    :raises ValueError: ``server`` has already been slowed down, whose controller should be updated instead.
+
+    :return: A :class:`SlowDownHTTPResponsesController` object that controls the slowness.
+
+    .. versionadded:: 0.3
+    """
+
+    handler_class = server.RequestHandlerClass
+    if not (isinstance(handler_class, type) and issubclass(handler_class, SimpleHTTPRequestHandler)):
+        raise TypeError(f'{handler_class!r} is not a subclass of SimpleHTTPRequestHandler')
+    if issubclass(handler_class, _SlowHTTPRequestHandlerMixin):
+        raise ValueError('Responses of the server have already been slowed down')
+    controller = SlowDownHTTPResponsesController(server, ttfb=ttfb, header_delay=header_delay, chunk_size=chunk_size,
+                                                 chunk_delay=chunk_delay, stall_after=stall_after, stall=stall)
+    server.RequestHandlerClass = controller._handler_class
+    return controller
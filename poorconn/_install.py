@@ -0,0 +1,280 @@
+# Copyright (C) 2021  Hong Xu <hong@topbug.net>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from __future__ import annotations
+
+import ipaddress
+import socket
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional, Union
+
+from ._controller import Controller
+from ._profile import get_profile, Profile
+from ._wrappers import sending_methods, wrap, Wrapping
+
+try:
+    import ssl
+except ImportError:  # pragma: no cover, Python is built without ssl
+    ssl = None  # type: ignore[assignment]
+
+
+Destination = Union[str, Iterable[str], Callable[[str, int], bool]]
+"""Type of the destination filter of :func:`install`."""
+
+
+class _Pattern:
+    """A parsed destination pattern of :func:`.install`. See :func:`.install` for the syntax.
+
+    :param pattern: The pattern.
+    """
+
+    __slots__ = (
+        'hostname',
+        'networks',
+        'port',
+    )
+
+    def __init__(self, pattern: str):
+        super().__init__()
+        if pattern.startswith('['):  # [IPv6 address or network]:port
+            host, _, port = pattern[1:].partition(']')
+            port = port[1:]
+        elif pattern.count(':') == 1:  # host:port
+            host, port = pattern.split(':')
+        else:  # Only host, which may be an IPv6 address or network
+            host, port = pattern, ''
+
+        self.port: Optional[int] = int(port) if port else None
+        self.hostname: Optional[str] = None
+        self.networks: List[Union[ipaddress.IPv4Network, ipaddress.IPv6Network]] = []
+        if not host:
+            return
+        try:
+            self.networks.append(ipaddress.ip_network(host, strict=False))
+        except ValueError:  # A host name. Resolve it now, because the address passed to connect() is usually resolved.
+            self.hostname = host.lower()
+            try:
+                infos = socket.getaddrinfo(host, None)
+            except OSError:
+                infos = []
+            self.networks.extend(ipaddress.ip_network(info[4][0]) for info in infos)
+
+    def match(self, host: str, port: int) -> bool:
+        "Whether the destination ``(host, port)`` matches this pattern."
+
+        if self.port is not None and self.port != port:
+            return False
+        if self.hostname is None and not self.networks:
+            return True
+        if self.hostname is not None and self.hostname == host.lower():
+            return True
+        try:
+            address = ipaddress.ip_address(host.partition('%')[0])  # Strip the scope ID of an IPv6 address
+        except ValueError:
+            return False
+        return any(address in network for network in self.networks)
+
+
+def _make_matcher(match: Optional[Destination]) -> Callable[[str, int], bool]:
+    "Convert the ``match`` parameter of :func:`.install` to a function."
+
+    if match is None:
+        return lambda host, port: True
+    if callable(match):
+        return match
+    patterns = [_Pattern(match)] if isinstance(match, str) else [_Pattern(pattern) for pattern in match]
+    return lambda host, port: any(pattern.match(host, port) for pattern in patterns)
+
+
+class InstallController(Controller):
+    """Controller for :func:`.install`. Objects are always created and returned by :func:`.install` and should not be
+    created outside the :mod:`poorconn` package.
+
+    :param profile: Same as ``profile`` in :func:`install`.
+    :param matcher: A function that tells whether a destination matches ``match`` in :func:`install`.
+
+    .. versionadded:: 0.3
+    """
+
+    __slots__ = (
+        'profile',
+        'connections',
+        'bytes_sent',
+        '_matcher',
+    )
+
+    def __init__(self, profile: Profile, matcher: Callable[[str, int], bool]):
+        super().__init__()
+        self.profile: Profile = profile
+        """Same as ``profile`` in :func:`install`. Updating it in the controller affects connections that are made
+        afterwards."""
+        self.connections: int = 0
+        "Number of connections that have been shaped."
+        self.bytes_sent: int = 0
+        "Number of bytes that have been sent by the shaped connections."
+        self._matcher = matcher
+
+    def metrics(self) -> Dict[str, Any]:
+        """Get the metrics of the installation.
+
+        :return: A JSON-serializable dictionary with the name of the profile (``profile``), :attr:`connections`,
+            :attr:`bytes_sent`, and the number of seconds since the installation (:attr:`elapsed`).
+        """
+        return {'profile': self.profile.name,
+                'connections': self.connections,
+                'bytes_sent': self.bytes_sent,
+                'elapsed': self.elapsed}
+
+    def _shape(self, s: socket.socket, profile: Profile) -> None:
+        "Shape ``s`` with ``profile`` and count the bytes it sends."
+
+        # The socket keeps its controller alive, because the installation only holds a weak reference to it
+        s._poorconn_controller = profile.apply(s)  # type: ignore[attr-defined]
+        s._poorconn_controller._wrappings.extend(self._count(s))  # type: ignore[attr-defined]
+        s._poorconn_installation = self  # type: ignore[attr-defined]
+        self._children.add(s._poorconn_controller)  # type: ignore[attr-defined]
+
+    def _count(self, s: socket.socket) -> List[Wrapping]:
+        """Count the bytes sent by ``s``.
+
+        :return: The wrappings of the sending methods of ``s``.
+        """
+
+        def after_send(s: socket.socket, *, original: int, before: Any) -> int:
+            self.bytes_sent += original
+            return original
+
+        def before_sendall(s: socket.socket, data: Any, *args: Any, **kwargs: Any) -> None:
+            self.bytes_sent += memoryview(data).nbytes
+
+        meths = sending_methods(s)  # SSLSocket.sendall calls send, which is counted
+        return [wrap(s, meth=meth, before=before_sendall) if meth == 'sendall' else wrap(s, meth=meth, after=after_send)
+                for meth in meths]
+
+    def remove(self) -> None:
+        """Uninstall: Sockets created afterwards are no longer hooked, and sockets that have been shaped are restored.
+        Other installations are not affected."""
+
+        with _installations_lock:
+            if self in _installations:
+                _installations.remove(self)
+            if not _installations and '__new__' in vars(socket.socket):
+                del socket.socket.__new__
+                if ssl is not None:
+                    ssl.SSLContext.wrap_socket = _original_wrap_socket  # type: ignore[assignment]
+        super().remove()
+
+
+_installations: List[InstallController] = []
+_installations_lock = threading.Lock()
+_original_socket_new = socket.socket.__new__
+_original_wrap_socket = ssl.SSLContext.wrap_socket if ssl is not None else None
+
+
+class _HookedSocket(socket.socket):
+    """The subclass of :class:`socket.socket` whose objects are created in place of :class:`socket.socket` objects while
+    :func:`.install` is in effect (see :func:`_hooked_socket_new`). Unlike :class:`socket.socket`, it has ``__dict__``,
+    so its sending methods are patchable without creating a :class:`.PatchableSocket` object."""
+
+    def connect(self, address: Any) -> None:  # type: ignore[override]
+        "Decide whether to shape this socket before calling :meth:`socket.socket.connect`."
+        self._poorconn_decide(address)
+        return super().connect(address)
+
+    def connect_ex(self, address: Any) -> int:  # type: ignore[override]
+        "Decide whether to shape this socket before calling :meth:`socket.socket.connect_ex`."
+        self._poorconn_decide(address)
+        return super().connect_ex(address)
+
+    def _poorconn_decide(self, address: Any) -> None:
+        "Apply the profile of the first installation that matches ``address``. Only the first call has an effect."
+
+        if self.__dict__.get('_poorconn_decided', False):
+            return
+        self._poorconn_decided = True
+        if self.family not in (socket.AF_INET, socket.AF_INET6) or self.type != socket.SOCK_STREAM:
+            return
+        host, port = address[0], address[1]
+        with _installations_lock:
+            for installation in _installations:
+                if installation._matcher(host, port):
+                    installation.connections += 1
+                    installation._shape(self, installation.profile)
+                    return
+
+
+def _hooked_socket_new(cls: type, *args: Any, **kwargs: Any) -> Any:
+    """Replace :meth:`socket.socket.__new__` while :func:`.install` is in effect: Create a :class:`_HookedSocket` object
+    in place of a :class:`socket.socket` object. :class:`socket.socket` itself stays in place, so that existing sockets
+    and subclasses such as :class:`ssl.SSLSocket` are still instances of it."""
+
+    return _original_socket_new(_HookedSocket if cls is socket.socket else cls, *args, **kwargs)
+
+
+def _hooked_wrap_socket(context: Any, sock: socket.socket, *args: Any, **kwargs: Any) -> Any:
+    """Replace :meth:`ssl.SSLContext.wrap_socket` while :func:`.install` is in effect: If ``sock`` has been shaped,
+    delay the handshake by the latency of the profile and shape the returned :class:`ssl.SSLSocket` object in place of
+    ``sock``, which is detached by :meth:`ssl.SSLContext.wrap_socket`."""
+
+    installation = getattr(sock, '__dict__', {}).get('_poorconn_installation')
+    if installation is None:
+        return _original_wrap_socket(context, sock, *args, **kwargs)
+    controller = sock._poorconn_controller  # type: ignore[attr-defined]
+    profile = controller.profile
+    controller.remove()
+    if profile.latency is not None:
+        controller._clock.sleep(profile.latency)  # The handshake takes a round trip
+    ssl_sock = _original_wrap_socket(context, sock, *args, **kwargs)
+    installation._shape(ssl_sock, profile)
+    return ssl_sock
+
+
+def install(profile: Union[str, Profile], match: Optional[Destination] = None) -> InstallController:
+    """Shape all TCP connections that are made in the current process and whose destinations match ``match`` with
+    ``profile``, including those made by third-party libraries.
+
+    This function achieves the results by hooking the creation of :class:`socket.socket` objects, so that they are
+    created as objects of a subclass that decides whether to apply ``profile`` once, upon
+    :meth:`~socket.socket.connect` or :meth:`~socket.socket.connect_ex`. :class:`socket.socket` itself is not replaced,
+    so that type checks such as ``isinstance(s, socket.socket)`` are not affected. Sockets whose destinations do not
+    match are left unpatched and are not slowed down at all. Only sockets created after this function is called are
+    affected. Therefore, it is recommended to call this function as early as possible.
+
+    When a shaped socket is wrapped by :meth:`ssl.SSLContext.wrap_socket`, the TLS handshake is delayed by the latency
+    of the profile, and the returned :class:`ssl.SSLSocket` object is shaped instead.
+
+    This function can be called more than once with different profiles and destination filters. A connection is shaped
+    with the profile of the first installation whose destination filter matches.
+
+    :param profile: A :class:`Profile` object or the name of a built-in profile in :data:`profiles`.
+    :param match: The destination filter. It can be a pattern string, an iterable of pattern strings that match if any
+        of them matches, or a function that receives the host and the port and returns whether they match. A pattern
+        string is one of ``HOST``, ``HOST:PORT``, ``:PORT``, and ``[HOST]:PORT``, where ``HOST`` is a host name, an IP
+        address, or a network in the CIDR notation (e.g., ``10.0.0.0/8``), and must be enclosed in brackets if it is an
+        IPv6 address or network and ``PORT`` is present. Host names are resolved when this function is called. ``None``
+        matches all destinations.
+
+    :return: An :class:`InstallController` object, whose :meth:`~InstallController.remove` undoes the installation.
+
+    .. versionadded:: 0.3
+    """
+
+    controller = InstallController(get_profile(profile), _make_matcher(match))
+    with _installations_lock:
+        _installations.append(controller)
+        socket.socket.__new__ = staticmethod(_hooked_socket_new)  # type: ignore[assignment]
+        if ssl is not None:
+            ssl.SSLContext.wrap_socket = _hooked_wrap_socket  # type: ignore[assignment]
+    return controller
@@ -0,0 +1,314 @@
+# Copyright (C) 2021  Hong Xu <hong@topbug.net>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from __future__ import annotations
+
+import errno
+import io
+import socket as _socket_module
+from socket import SHUT_RD, SHUT_RDWR, SHUT_WR, SOCK_STREAM, SOL_SOCKET, SO_RCVBUF, SO_SNDBUF
+import threading
+import time
+from typing import Any, Iterable, Optional, Tuple
+
+
+class _Pipe:
+    "One direction of a simulated connection: A bounded byte buffer that one end writes to and the other reads from."
+
+    __slots__ = (
+        'capacity',
+        'buffer',
+        'condition',
+        'write_closed',
+        'read_closed',
+    )
+
+    def __init__(self, capacity: int):
+        super().__init__()
+        self.capacity = capacity
+        self.buffer = bytearray()
+        self.condition = threading.Condition()
+        # Whether the writing end has shut down writing, upon which the reading end receives EOF
+        self.write_closed = False
+        # Whether the reading end has been closed, upon which the writing end fails with EPIPE
+        self.read_closed = False
+
+
+def _wait(condition: threading.Condition, ready: Any, timeout: Optional[float], deadline: Optional[float]) -> None:
+    "Wait on ``condition`` until ``ready()`` is true, subject to the timeout of a socket."
+
+    while not ready():
+        if timeout == 0:
+            raise BlockingIOError(errno.EAGAIN, 'Resource temporarily unavailable')
+        remaining = None if deadline is None else deadline - time.monotonic()
+        if remaining is not None and remaining <= 0:
+            raise _socket_module.timeout('timed out')
+        condition.wait(remaining)
+
+
+class SimulatedSocket:
+    """One end of a simulated stream connection, which is held in memory instead of the operating system. It supports
+    the parts of the interface of :class:`socket.socket` that clients and servers of stream connections commonly use,
+    including timeouts, :meth:`shutdown` and :meth:`makefile`, and its methods can be patched by all simulation
+    functions for stream sockets without :func:`.make_socket_patchable`. Since it has no file descriptor, it cannot be
+    passed to :mod:`select` or other functions of the operating system. Objects are always created and returned by
+    :func:`.simulated_socketpair` and should not be created outside the :mod:`poorconn` package.
+
+    :param incoming: The direction from which this end receives.
+    :param outgoing: The direction to which this end sends.
+    :param name: The address of this end.
+    :param peer_name: The address of the other end.
+
+    .. versionadded:: 0.3
+    """
+
+    family = getattr(_socket_module, 'AF_UNIX', _socket_module.AF_INET)
+    "The address family, which is the same as that of :func:`socket.socketpair`."
+    type = SOCK_STREAM
+    "The socket type."
+    proto = 0
+    "The protocol number."
+
+    def __init__(self, incoming: _Pipe, outgoing: _Pipe, name: str, peer_name: str):
+        super().__init__()
+        self._incoming = incoming
+        self._outgoing = outgoing
+        self._name = name
+        self._peer_name = peer_name
+        self._timeout: Optional[float] = None
+        # As in socket.socket, the connection is not closed until the file objects created by makefile() are closed
+        self._closed = False
+        self._real_closed = False
+        self._io_refs = 0
+
+    def __enter__(self) -> SimulatedSocket:
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    def __repr__(self) -> str:
+        return f'<{type(self).__name__} {self._name}{" [closed]" if self._real_closed else ""}>'
+
+    def _check_open(self) -> None:
+        if self._real_closed:
+            raise OSError(errno.EBADF, 'Bad file descriptor')
+
+    def _deadline(self) -> Optional[float]:
+        return None if not self._timeout else time.monotonic() + self._timeout
+
+    def _wait_writable(self) -> None:
+        "Wait until the outgoing direction has room, regardless of the timeout."
+        pipe = self._outgoing
+        with pipe.condition:
+            _wait(pipe.condition, lambda: len(pipe.buffer) < pipe.capacity or pipe.read_closed or pipe.write_closed,
+                  None, None)
+
+    def fileno(self) -> int:
+        "Return -1, since the socket has no file descriptor."
+        return -1
+
+    def gettimeout(self) -> Optional[float]:
+        "Same as :meth:`socket.socket.gettimeout`."
+        return self._timeout
+
+    def settimeout(self, value: Optional[float]) -> None:
+        "Same as :meth:`socket.socket.settimeout`."
+        if value is not None and value < 0:
+            raise ValueError('Timeout value out of range')
+        self._timeout = None if value is None else float(value)
+
+    def getblocking(self) -> bool:
+        "Same as :meth:`socket.socket.getblocking`."
+        return self._timeout != 0
+
+    def setblocking(self, flag: bool) -> None:
+        "Same as :meth:`socket.socket.setblocking`."
+        self._timeout = None if flag else 0.0
+
+    def getsockname(self) -> str:
+        "Get the address of this end."
+        return self._name
+
+    def getpeername(self) -> str:
+        "Get the address of the other end."
+        return self._peer_name
+
+    def getsockopt(self, level: int, optname: int) -> int:
+        "Get the sizes of the buffers (``SO_SNDBUF`` and ``SO_RCVBUF``). Other options are not supported."
+
+        self._check_open()
+        if level == SOL_SOCKET and optname in (SO_SNDBUF, SO_RCVBUF):
+            return (self._outgoing if optname == SO_SNDBUF else self._incoming).capacity
+        raise OSError(errno.ENOPROTOOPT, 'Protocol not available')
+
+    def setsockopt(self, level: int, optname: int, value: int) -> None:
+        "Set the sizes of the buffers (``SO_SNDBUF`` and ``SO_RCVBUF``). Other options are not supported."
+
+        self._check_open()
+        if level == SOL_SOCKET and optname in (SO_SNDBUF, SO_RCVBUF):
+            pipe = self._outgoing if optname == SO_SNDBUF else self._incoming
+            with pipe.condition:
+                pipe.capacity = max(1, int(value))
+                pipe.condition.notify_all()
+            return
+        raise OSError(errno.ENOPROTOOPT, 'Protocol not available')
+
+    def send(self, data: Any, flags: int = 0) -> int:
+        "Same as :meth:`socket.socket.send`. ``flags`` is ignored."
+
+        self._check_open()
+        view = memoryview(data).cast('B')
+        pipe = self._outgoing
+        with pipe.condition:
+            _wait(pipe.condition, lambda: len(pipe.buffer) < pipe.capacity or pipe.read_closed or pipe.write_closed,
+                  self._timeout, self._deadline())
+            if pipe.read_closed or pipe.write_closed:
+                raise BrokenPipeError(errno.EPIPE, 'Broken pipe')
+            view = view[:pipe.capacity - len(pipe.buffer)]
+            pipe.buffer += view
+            pipe.condition.notify_all()
+            return len(view)
+
+    def sendall(self, data: Any, flags: int = 0) -> None:
+        "Same as :meth:`socket.socket.sendall`. ``flags`` is ignored."
+
+        # Like those of socket.socket, the methods do not call each other, so that patching one does not affect others
+        view = memoryview(data).cast('B')
+        while view:
+            view = view[SimulatedSocket.send(self, view, flags):]
+
+    def sendmsg(self, buffers: Iterable[Any], ancdata: Iterable[Any] = (), flags: int = 0, address: Any = None) -> int:
+        """Same as :meth:`socket.socket.sendmsg`. Ancillary data and addresses are not supported, and ``flags`` is
+        ignored."""
+
+        if tuple(ancdata) or address is not None:
+            raise OSError(errno.EOPNOTSUPP, 'Operation not supported')
+        return SimulatedSocket.send(self, b''.join(buffers), flags)
+
+    def recv_into(self, buffer: Any, nbytes: int = 0, flags: int = 0) -> int:
+        "Same as :meth:`socket.socket.recv_into`. ``flags`` is ignored."
+
+        self._check_open()
+        view = memoryview(buffer).cast('B')
+        if nbytes:
+            view = view[:nbytes]
+        pipe = self._incoming
+        with pipe.condition:
+            _wait(pipe.condition, lambda: pipe.buffer or pipe.write_closed or pipe.read_closed,
+                  self._timeout, self._deadline())
+            if pipe.read_closed:  # Shut down for reading
+                return 0
+            n = min(len(view), len(pipe.buffer))
+            view[:n] = pipe.buffer[:n]
+            del pipe.buffer[:n]
+            pipe.condition.notify_all()
+            return n
+
+    def recv(self, bufsize: int, flags: int = 0) -> bytes:
+        "Same as :meth:`socket.socket.recv`. ``flags`` is ignored."
+
+        buffer = bytearray(bufsize)
+        return bytes(buffer[:self.recv_into(buffer)])
+
+    def shutdown(self, how: int) -> None:
+        "Same as :meth:`socket.socket.shutdown`."
+
+        self._check_open()
+        if how in (SHUT_WR, SHUT_RDWR):
+            with self._outgoing.condition:
+                self._outgoing.write_closed = True
+                self._outgoing.condition.notify_all()
+        if how in (SHUT_RD, SHUT_RDWR):
+            with self._incoming.condition:
+                self._incoming.read_closed = True
+                self._incoming.condition.notify_all()
+
+    def close(self) -> None:
+        "Same as :meth:`socket.socket.close`. The other end receives EOF, and fails to send afterwards."
+
+        self._closed = True
+        if self._io_refs <= 0:
+            self._real_close()
+
+    def _real_close(self) -> None:
+        if not self._real_closed:
+            self.shutdown(SHUT_RDWR)
+            self._real_closed = True
+
+    def _decref_socketios(self) -> None:
+        "Called by :class:`socket.SocketIO` objects created by :meth:`makefile` when they are closed."
+        if self._io_refs > 0:
+            self._io_refs -= 1
+        if self._closed and self._io_refs <= 0:
+            self._real_close()
+
+    def makefile(self, mode: str = 'r', buffering: Optional[int] = None, *, encoding: Optional[str] = None,
+                 errors: Optional[str] = None, newline: Optional[str] = None) -> Any:
+        "Same as :meth:`socket.socket.makefile`."
+
+        if not set(mode) <= {'r', 'w', 'b'}:
+            raise ValueError(f'invalid mode {mode!r} (only r, w, b allowed)')
+        writing = 'w' in mode
+        reading = 'r' in mode or not writing
+        rawmode = ('r' if reading else '') + ('w' if writing else '')
+        raw = _socket_module.SocketIO(self, rawmode)  # type: ignore[arg-type]
+        self._io_refs += 1
+        if buffering is None:
+            buffering = -1
+        if buffering < 0:
+            buffering = io.DEFAULT_BUFFER_SIZE
+        if buffering == 0:
+            if 'b' not in mode:
+                raise ValueError('unbuffered streams must be binary')
+            return raw
+        buffer: Any
+        if reading and writing:
+            buffer = io.BufferedRWPair(raw, raw, buffering)
+        elif reading:
+            buffer = io.BufferedReader(raw, buffering)
+        else:
+            buffer = io.BufferedWriter(raw, buffering)
+        if 'b' in mode:
+            return buffer
+        text = io.TextIOWrapper(buffer, encoding, errors, newline)
+        text.mode = mode  # type: ignore[misc]
+        return text
+
+
+def simulated_socketpair(buffer_size: int = 65536) -> Tuple[SimulatedSocket, SimulatedSocket]:
+    """Create a pair of connected stream sockets that are simulated in memory, like :func:`socket.socketpair` without
+    the operating system. Simulation functions for stream sockets can be applied to the sending methods of either end
+    to shape that direction, and they run on the clock that is in effect when they are applied (see :func:`.use_clock`).
+    Since no ports or file descriptors are used, any number of simulated connections can run in parallel, and with a
+    :class:`.VirtualClock`, they run without sleeping, each on its own timeline::
+
+        a, b = simulated_socketpair()
+        with use_clock(VirtualClock()):
+            delay_before_sending(a, t=1, length=1024)
+            ...
+
+    Each direction buffers up to ``buffer_size`` bytes, after which the sender blocks until the receiver receives,
+    subject to the timeout of the sender.
+
+    :param buffer_size: Number of bytes that each direction buffers.
+    :return: The two ends of the connection, whose addresses are ``'simulated-a'`` and ``'simulated-b'``.
+
+    .. versionadded:: 0.3
+    """
+
+    a_to_b, b_to_a = _Pipe(buffer_size), _Pipe(buffer_size)
+    return (SimulatedSocket(b_to_a, a_to_b, 'simulated-a', 'simulated-b'),
+            SimulatedSocket(a_to_b, b_to_a, 'simulated-b', 'simulated-a'))
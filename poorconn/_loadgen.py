@@ -0,0 +1,325 @@
+# Copyright (C) 2021  Hong Xu <hong@topbug.net>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Generating load of many slow HTTP clients, such as slow uploaders and slow readers, on one thread with
+:mod:`asyncio`. Since patched sockets block in their delays, clients are shaped by their own pacing instead, according
+to the same :class:`poorconn.Profile` characteristics."""
+
+from __future__ import annotations
+
+import asyncio
+from collections import Counter
+import dataclasses
+from dataclasses import dataclass
+import ssl
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from urllib.parse import urlsplit
+
+from ._clock import Pacer
+from ._profile import get_profile, Profile
+from ._stats import summarize
+
+
+@dataclass(frozen=True)
+class LoadgenReport:
+    "Results of :func:`loadgen`."
+
+    connections: int
+    "Number of concurrent client connections."
+    requests: int
+    "Number of requests that have been attempted."
+    errors: Dict[str, int]
+    """Number of failed requests, keyed by the reason, such as ``HTTP 404`` for responses with status codes of 400 or
+    above, or the name of the exception, such as ``ConnectionResetError``."""
+    duration: float
+    "Number of seconds that all connections took."
+    bytes_sent: int
+    "Number of bytes of requests that have been sent."
+    bytes_received: int
+    "Number of bytes of responses that have been received."
+    latency: Dict[str, float]
+    """Summary of the number of seconds from the start of sending each successful request to the end of receiving its
+    response (see :func:`poorconn.summarize`), which is empty if no request succeeded."""
+
+    @property
+    def error_rate(self) -> float:
+        "Fraction of the requests that have failed."
+        return sum(self.errors.values()) / self.requests if self.requests else 0.0
+
+    @property
+    def throughput(self) -> float:
+        "Number of bytes sent and received per second."
+        return (self.bytes_sent + self.bytes_received) / self.duration if self.duration > 0 else 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        "Convert to a JSON-serializable dictionary, including :attr:`error_rate` and :attr:`throughput`."
+        return dict(dataclasses.asdict(self), error_rate=self.error_rate, throughput=self.throughput)
+
+
+async def _pace(pacer: Pacer, t: float) -> None:
+    "The :mod:`asyncio` counterpart of :meth:`poorconn.Pacer.wait`, which sleeps without blocking other connections."
+
+    now = time.monotonic()
+    await asyncio.sleep(pacer._schedule(t, now) - now)
+
+
+class _Connection:
+    """A shaped client connection, which sends at :attr:`.Profile.rate` after :attr:`.Profile.latency`, and reads at
+    ``read_rate``.
+
+    :param reader: The reader of the connection.
+    :param writer: The writer of the connection.
+    :param profile: The profile of the connection.
+    :param read_rate: Number of bytes read per second, or ``None`` for no limit.
+    """
+
+    __slots__ = (
+        'reader',
+        'writer',
+        'profile',
+        'read_rate',
+        'bytes_sent',
+        'bytes_received',
+        '_send_pacer',
+        '_read_pacer',
+    )
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, profile: Profile,
+                 read_rate: Optional[float]):
+        super().__init__()
+        self.reader: asyncio.StreamReader = reader
+        "Same as ``reader`` in :class:`_Connection`."
+        self.writer: asyncio.StreamWriter = writer
+        "Same as ``writer`` in :class:`_Connection`."
+        self.profile: Profile = profile
+        "Same as ``profile`` in :class:`_Connection`."
+        self.read_rate: Optional[float] = read_rate
+        "Same as ``read_rate`` in :class:`_Connection`."
+        self.bytes_sent: int = 0
+        "Number of bytes sent."
+        self.bytes_received: int = 0
+        "Number of bytes received."
+        self._send_pacer = Pacer()
+        self._read_pacer = Pacer()
+
+    async def send(self, data: bytes) -> None:
+        "Send ``data``."
+
+        if self.profile.latency is not None:
+            await asyncio.sleep(self.profile.latency)
+        self._send_pacer.max_lag = self.profile.mss / self.profile.rate if self.profile.rate else 0.01
+        step = len(data) if self.profile.rate is None else self.profile.mss
+        for i in range(0, len(data), step):
+            segment = data[i:i + step]
+            if self.profile.rate is not None:
+                await _pace(self._send_pacer, len(segment) / self.profile.rate)
+            self.writer.write(segment)
+            await self.writer.drain()
+            self.bytes_sent += len(segment)
+
+    async def _received(self, data: bytes) -> bytes:
+        "Account for ``data`` that has been received, and pace reading."
+
+        self.bytes_received += len(data)
+        if self.read_rate is not None and data:
+            await _pace(self._read_pacer, len(data) / self.read_rate)
+        return data
+
+    async def readline(self) -> bytes:
+        "Read a line."
+        return await self._received(await self.reader.readuntil(b'\n'))
+
+    async def readexactly(self, n: int) -> None:
+        "Read and discard ``n`` bytes."
+
+        while n > 0:
+            data = await self.reader.read(min(n, self.profile.mss if self.read_rate is not None else 65536))
+            if not data:
+                raise asyncio.IncompleteReadError(b'', n)
+            n -= len(await self._received(data))
+
+    async def read_until_eof(self) -> None:
+        "Read and discard data until the end of the stream."
+
+        while await self._received(await self.reader.read(self.profile.mss if self.read_rate is not None else 65536)):
+            pass
+
+    async def close(self) -> None:
+        "Close the connection."
+
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except (OSError, ssl.SSLError):  # Already reset by the server
+            pass
+
+
+async def _read_response(connection: _Connection, method: str) -> Tuple[int, bool]:
+    """Read the response to a request, and return its status code and whether the connection can be reused.
+
+    :raises ValueError: The response is malformed.
+    """
+
+    status_line = (await connection.readline()).decode('latin-1')
+    version, _, rest = status_line.partition(' ')
+    if not version.startswith('HTTP/') or not rest[:3].isdigit():
+        raise ValueError(f'Malformed status line {status_line.strip()!r}')
+    status = int(rest[:3])
+    headers: Dict[str, str] = {}
+    while True:
+        line = (await connection.readline()).decode('latin-1').strip()
+        if not line:
+            break
+        name, _, value = line.partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    keep_alive = (version != 'HTTP/1.0' and headers.get('connection', '').lower() != 'close')
+    if method == 'HEAD' or status in (204, 304) or 100 <= status < 200:
+        pass
+    elif headers.get('transfer-encoding', '').lower() == 'chunked':
+        while True:
+            size = int((await connection.readline()).split(b';')[0], 16)
+            if size == 0:
+                break
+            await connection.readexactly(size + 2)  # With the trailing CRLF
+        while (await connection.readline()).strip():  # Trailer fields, up to the empty line
+            pass
+    elif 'content-length' in headers:
+        await connection.readexactly(int(headers['content-length']))
+    else:
+        await connection.read_until_eof()
+        keep_alive = False
+    return status, keep_alive
+
+
+async def _client(url: str, *, requests: int, method: str, paths: Sequence[str], headers: Sequence[str],
+                  body: bytes, think_time: float, profile: Profile, read_rate: Optional[float], timeout: float,
+                  latencies: List[float], errors: Counter, totals: List[int]) -> None:
+    "Make ``requests`` requests on one connection, which is reopened after each failure or closure by the server."
+
+    parts = urlsplit(url)
+    use_ssl = parts.scheme == 'https'
+    host = parts.hostname or 'localhost'
+    port = parts.port or (443 if use_ssl else 80)
+    connection: Optional[_Connection] = None
+    try:
+        for i in range(requests):
+            if i > 0 and think_time > 0:
+                await asyncio.sleep(think_time)
+            path = paths[i % len(paths)]
+            request = ''.join((f'{method} {path} HTTP/1.1\r\nHost: {parts.netloc}\r\n',
+                               f'Content-Length: {len(body)}\r\n' if body else '',
+                               ''.join(f'{header}\r\n' for header in headers), '\r\n')).encode('latin-1') + body
+            starting_time = time.monotonic()
+            try:
+                if connection is None:
+                    reader, writer = await asyncio.wait_for(asyncio.open_connection(
+                        host, port, ssl=use_ssl or None,
+                        # A small buffer lets slow reading hold back the server with TCP flow control
+                        limit=profile.mss if read_rate is not None else 2 ** 16), timeout)
+                    connection = _Connection(reader, writer, profile, read_rate)
+
+                async def exchange(connection: _Connection) -> Tuple[int, bool]:
+                    await connection.send(request)
+                    return await _read_response(connection, method)
+
+                status, keep_alive = await asyncio.wait_for(exchange(connection), timeout)
+            except (OSError, ssl.SSLError, asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError,
+                    ValueError) as e:
+                errors[type(e).__name__] += 1
+                keep_alive = False
+            else:
+                if status >= 400:
+                    errors[f'HTTP {status}'] += 1
+                else:
+                    latencies.append(time.monotonic() - starting_time)
+            if not keep_alive and connection is not None:
+                await connection.close()
+                totals[0] += connection.bytes_sent
+                totals[1] += connection.bytes_received
+                connection = None
+    finally:
+        if connection is not None:
+            await connection.close()
+            totals[0] += connection.bytes_sent
+            totals[1] += connection.bytes_received
+
+
+def loadgen(url: str, *,
+            connections: int = 1,
+            requests: int = 1,
+            method: str = 'GET',
+            paths: Sequence[str] = (),
+            headers: Sequence[str] = (),
+            body_size: int = 0,
+            think_time: float = 0.0,
+            profile: Optional[str] = None,
+            rate: Optional[float] = None,
+            latency: Optional[float] = None,
+            read_rate: Optional[float] = None,
+            timeout: float = 60.0) -> LoadgenReport:
+    """Make requests to ``url`` from ``connections`` concurrent client connections, each of which makes ``requests``
+    requests in turn with HTTP/1.1 keep-alive, and report the results. All connections run on the current thread with
+    :mod:`asyncio`, so that thousands of them can run on one machine, given a high enough limit of open files.
+
+    :param url: The URL of the target, such as ``http://localhost:8000/bytes/1024``.
+    :param connections: Number of concurrent client connections.
+    :param requests: Number of requests that each connection makes.
+    :param method: The request method.
+    :param paths: Paths to request in turn, such as ``['/a', '/b?c=d']``. The path of ``url`` if empty.
+    :param headers: Extra header lines, such as ``['Accept: */*']``.
+    :param body_size: Number of bytes of the body of each request, which is sent with ``Content-Length``.
+    :param think_time: Number of seconds between the requests of each connection.
+    :param profile: Name of a built-in profile that shapes the sending of each connection. See
+        :data:`poorconn.profiles`.
+    :param rate: Override :attr:`.Profile.rate` of the profile, which makes slow uploads.
+    :param latency: Override :attr:`.Profile.latency` of the profile, which delays each request.
+    :param read_rate: Number of bytes each connection reads per second, which makes slow readers, or ``None`` for no
+        limit.
+    :param timeout: Number of seconds after which a request fails, including connecting.
+    :return: The results.
+    :raises ValueError: ``url`` or another argument is invalid.
+    """
+
+    parts = urlsplit(url)
+    if parts.scheme not in ('http', 'https') or not parts.hostname:
+        raise ValueError(f'Unsupported URL {url!r}. Only http and https URLs are supported')
+    if connections < 1 or requests < 1:
+        raise ValueError('The numbers of connections and requests must be positive')
+    if any(value is not None and value <= 0 for value in (rate, read_rate)):
+        raise ValueError('The sending and reading rates must be positive')
+    overrides: Dict[str, Any] = {name: value for name, value in (('rate', rate), ('latency', latency))
+                                 if value is not None}
+    shaping = dataclasses.replace(get_profile(profile) if profile is not None else Profile('custom'), **overrides)
+    if not paths:
+        paths = [(parts.path or '/') + (f'?{parts.query}' if parts.query else '')]
+
+    latencies: List[float] = []
+    errors: Counter = Counter()
+    totals = [0, 0]
+
+    async def main() -> None:
+        await asyncio.gather(*(_client(url, requests=requests, method=method.upper(), paths=paths, headers=headers,
+                                       body=bytes(body_size), think_time=think_time, profile=shaping,
+                                       read_rate=read_rate, timeout=timeout, latencies=latencies, errors=errors,
+                                       totals=totals)
+                               for _ in range(connections)))
+
+    starting_time = time.monotonic()
+    asyncio.run(main())
+    return LoadgenReport(connections=connections, requests=connections * requests, errors=dict(errors),
+                         duration=time.monotonic() - starting_time, bytes_sent=totals[0], bytes_received=totals[1],
+                         latency=summarize(latencies) if latencies else {})
@@ -0,0 +1,51 @@
+# Copyright (C) 2021  Hong Xu <hong@topbug.net>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+"""Preload Poorconn in a process started by :func:`poorconn._run.run`. :mod:`site` imports this module upon the start
+of the process because its directory is prepended to ``PYTHONPATH``."""
+
+import importlib.machinery
+import importlib.util
+import os
+import sys
+
+
+def _preload() -> None:
+    "Run the ``sitecustomize`` module that this module shadows, if any, and then preload Poorconn."
+
+    this_dir = os.path.dirname(os.path.abspath(__file__))
+    sys.path[:] = [path for path in sys.path if os.path.abspath(path) != this_dir]
+    spec = importlib.machinery.PathFinder.find_spec(__name__, sys.path)
+    if spec is not None and spec.loader is not None:
+        # The shadowed module replaces this one in sys.modules
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[__name__] = module
+        spec.loader.exec_module(module)
+
+    # Import Poorconn from the installation that started this process, without putting the directory that contains it,
+    # which usually contains other packages too, on sys.path ahead of the packages of this process
+    if 'poorconn' not in sys.modules:
+        spec = importlib.machinery.PathFinder.find_spec('poorconn', [os.path.dirname(os.path.dirname(this_dir))])
+        if spec is not None and spec.loader is not None:
+            module = importlib.util.module_from_spec(spec)
+            sys.modules['poorconn'] = module
+            spec.loader.exec_module(module)
+
+    from poorconn._run import preload
+    preload()
+
+
+_preload()
@@ -0,0 +1,119 @@
+# Copyright (C) 2021  Hong Xu <hong@topbug.net>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from socket import socket
+from typing import Dict, List, Optional, Tuple, Union
+
+from ._clock import _timeline, _use_timeline
+from ._controller import Controller
+from ._send import delay_before_sending_once, limit_link_rate
+from ._socket import is_tls_socket
+from ._transit import delay_in_transit
+
+
+@dataclass(frozen=True)
+class Profile:
+    """A named set of poor network characteristics, which are simulated by applying a combination of simulation
+    functions to a socket object. Use :func:`dataclasses.replace` to derive a profile from an existing one.
+
+    .. versionadded:: 0.3
+    """
+
+    name: str
+    "Name of the profile."
+    rate: Optional[float] = None
+    "Number of bytes sent per second (see :func:`limit_link_rate`), or ``None`` for no limit."
+    latency: Optional[float] = None
+    """Number of seconds by which sent data is delayed in transit (see :func:`delay_in_transit`), or ``None`` for no
+    extra latency. Since often only one direction of a connection is shaped, the latencies of the built-in profiles are
+    round-trip values. For :class:`ssl.SSLSocket` objects, only the first sending is delayed."""
+    mss: int = 1448
+    "Number of bytes of each of the segments in which data is sent when :attr:`rate` is set."
+
+    def apply(self, s: socket) -> ProfileController:
+        """Apply the profile to ``s``. ``s`` must be patchable (see :func:`poorconn.make_socket_patchable`).
+
+        :param s: The :class:`socket.socket` object to be shaped.
+        :return: A :class:`ProfileController` object that controls the patched socket object.
+        """
+
+        controllers: List[Controller] = []
+        with _use_timeline(_timeline()):  # The simulations of the profile delay the same data one after another
+            if self.latency is not None:
+                # A TLS connection cannot be written to from the thread of the delay line
+                controllers.append(delay_before_sending_once(s, t=self.latency) if is_tls_socket(s) else
+                                   delay_in_transit(s, t=self.latency))
+            if self.rate is not None:  # Stacked on top of the delay line, so that the sender is paced
+                controllers.append(limit_link_rate(s, rate=self.rate, mss=self.mss))
+            return ProfileController(self, tuple(controllers))
+
+
+class ProfileController(Controller):
+    """Controller for :meth:`.Profile.apply`. Objects are always created and returned by :meth:`.Profile.apply` and
+    should not be created outside the :mod:`poorconn` package.
+
+    :param profile: The applied profile.
+    :param controllers: Controllers of the simulation functions that have been applied.
+
+    .. versionadded:: 0.3
+    """
+
+    __slots__ = (
+        'profile',
+        'controllers',
+    )
+
+    def __init__(self, profile: Profile, controllers: Tuple[Controller, ...]):
+        super().__init__()
+        self.profile: Profile = profile
+        "The applied profile. Updating it has no effect on the patched socket object."
+        self.controllers: Tuple[Controller, ...] = controllers
+        "Controllers of the simulation functions that have been applied, in the order they were applied."
+        self._children.update(controllers)
+
+
+profiles: Dict[str, Profile] = {profile.name: profile for profile in (
+    Profile('gprs', rate=50_000 / 8, latency=0.5),
+    Profile('edge', rate=240_000 / 8, latency=0.3),
+    Profile('slow-3g', rate=400_000 / 8, latency=0.4),
+    Profile('3g', rate=1_600_000 / 8, latency=0.15),
+    Profile('4g', rate=9_000_000 / 8, latency=0.085),
+    Profile('dsl', rate=2_000_000 / 8, latency=0.05),
+)}
+"""Built-in profiles, keyed by their names.
+
+.. versionadded:: 0.3
+"""
+
+
+def get_profile(profile: Union[str, Profile]) -> Profile:
+    """Get a profile.
+
+    :param profile: Either a :class:`Profile` object, which is returned as is, or the name of a built-in profile in
+        :data:`profiles`.
+    :raises ValueError: ``profile`` is not the name of any built-in profile.
+
+    .. versionadded:: 0.3
+    """
+
+    if isinstance(profile, Profile):
+        return profile
+    try:
+        return profiles[profile]
+    except KeyError:
+        raise ValueError(f'Unknown profile {profile!r}. Available profiles: {", ".join(profiles)}') from None
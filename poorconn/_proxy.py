@@ -0,0 +1,269 @@
+# Copyright (C) 2021  Hong Xu <hong@topbug.net>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from __future__ import annotations
+
+import socket
+import threading
+from typing import Any, Callable, List, Optional, Sequence, Set, Tuple, Union
+
+from ._clock import _use_timeline
+from ._controller import Controller
+from ._profile import get_profile, Profile
+from ._socket import make_socket_patchable
+from ._wrappers import wrap_accept
+
+Simulation = Union[str, Profile, Callable[[socket.socket], Controller]]
+"""Type of simulations that are applied to connections: The name of a built-in profile, a :class:`Profile` object, or a
+function that applies a simulation to a socket object and returns its controller, such as
+``lambda s: delay_before_sending(s, t=1, length=1024)``."""
+
+_POLL_INTERVAL: float = 0.05
+"Number of seconds between polls for removal of the proxy, which bounds the time that removing it takes."
+
+
+def _simulate(s: socket.socket, simulation: Simulation) -> Controller:
+    "Apply ``simulation`` to ``s``, which must be patchable, and return the controller."
+
+    if isinstance(simulation, (str, Profile)):
+        return get_profile(simulation).apply(s)
+    return simulation(s)
+
+
+class SimulateUponAcceptanceController(Controller):
+    """Controller for :func:`.simulate_upon_acceptance`. Objects are always created and returned by
+    :func:`.simulate_upon_acceptance` and should not be created outside the :mod:`poorconn` package.
+
+    :param simulation: Same as ``simulation`` in :func:`simulate_upon_acceptance`.
+
+    .. versionadded:: 0.3
+    """
+
+    __slots__ = (
+        'simulation',
+    )
+
+    def __init__(self, simulation: Simulation):
+        super().__init__()
+        self.simulation: Simulation = simulation
+        """Same as ``simulation`` in :func:`simulate_upon_acceptance`. Updating it in the controller affects sockets
+        that are accepted afterwards."""
+
+
+def simulate_upon_acceptance(s: socket.socket, simulation: Simulation) -> SimulateUponAcceptanceController:
+    """For every socket object returned by ``s.accept()``, apply ``simulation``, which can be any simulation or profile
+    for connection sockets.
+
+    :param s: The :class:`socket.socket` object whose ``accept()`` function is to be wrapped.
+    :param simulation: The simulation to apply to every connection socket.
+
+    :return: A :class:`SimulateUponAcceptanceController` object that controls the patched socket object.
+
+    .. versionadded:: 0.3
+    """
+
+    controller = SimulateUponAcceptanceController(simulation)
+
+    def after(s: socket.socket, *, original: Sequence, before: Any) -> Tuple[Any, Any]:
+        conn_sock = make_socket_patchable(original[0], (':sending',))
+        with _use_timeline(controller._clock.timeline()):  # Each connection has its own timeline
+            child = _simulate(conn_sock, controller.simulation)
+        # The connection socket keeps the controller alive, which may not be referenced by its patched methods
+        conn_sock._poorconn_simulation = child  # type: ignore[attr-defined]
+        controller._children.add(child)
+        return conn_sock, original[1]
+
+    controller._wrappings.append(wrap_accept(s, after=after))
+    return controller
+
+
+class ProxyController(Controller):
+    """Controller for :func:`.start_proxy`. Objects are always created and returned by :func:`.start_proxy` and should
+    not be created outside the :mod:`poorconn` package. Removing it stops the proxy and closes its connections.
+
+    :param target: Same as ``target`` in :func:`start_proxy`.
+    :param simulation: Same as ``simulation`` in :func:`start_proxy`.
+    :param upstream_simulation: Same as ``upstream_simulation`` in :func:`start_proxy`.
+    :param server_socket: The listening socket of the proxy.
+
+    .. versionadded:: 0.3
+    """
+
+    __slots__ = (
+        'target',
+        'simulation',
+        'upstream_simulation',
+        'connections',
+        '_server_socket',
+        '_sockets',
+        '_lock',
+        '_stopped',
+        '_thread',
+    )
+
+    def __init__(self, target: Tuple[str, int], simulation: Optional[Simulation],
+                 upstream_simulation: Optional[Simulation], server_socket: socket.socket):
+        super().__init__()
+        self.target: Tuple[str, int] = target
+        "Same as ``target`` in :func:`start_proxy`. Updating it in the controller affects connections made afterwards."
+        self.simulation: Optional[Simulation] = simulation
+        """Same as ``simulation`` in :func:`start_proxy`. Updating it in the controller affects connections made
+        afterwards."""
+        self.upstream_simulation: Optional[Simulation] = upstream_simulation
+        """Same as ``upstream_simulation`` in :func:`start_proxy`. Updating it in the controller affects connections
+        made afterwards."""
+        self.connections: int = 0
+        "Number of connections that have been accepted by the proxy."
+        self._server_socket = server_socket
+        # Sockets of open connections, which are closed when the proxy is removed
+        self._sockets: Set[socket.socket] = set()
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._serve, name='Poorconn proxy', daemon=True)
+
+    @property
+    def address(self) -> Tuple[str, int]:
+        "The address that the proxy listens on, whose port is the actual port if port 0 was requested."
+        return self._server_socket.getsockname()[:2]
+
+    def _serve(self) -> None:
+        "Accept connections until the proxy is removed."
+
+        while not self._stopped.is_set():
+            try:
+                conn_sock, _ = self._server_socket.accept()
+            except socket.timeout:
+                continue
+            except OSError:  # The listening socket has been closed
+                return
+            conn_sock.settimeout(None)
+            self.connections += 1
+            threading.Thread(target=self._connect, args=(conn_sock,), name='Poorconn proxy connection',
+                             daemon=True).start()
+
+    def _connect(self, conn_sock: socket.socket) -> None:
+        "Connect ``conn_sock`` to the target, and forward data in both directions."
+
+        try:
+            upstream_sock = socket.create_connection(self.target)
+        except OSError:  # The target is down, which the client sees as a closed connection
+            conn_sock.close()
+            return
+        conn_sock = make_socket_patchable(conn_sock, (':sending',))
+        upstream_sock = make_socket_patchable(upstream_sock, (':sending',))
+        controllers: List[Controller] = []
+        if self.simulation is not None:
+            with _use_timeline(self._clock.timeline()):  # Each socket sends on its own thread and timeline
+                controllers.append(_simulate(conn_sock, self.simulation))
+        if self.upstream_simulation is not None:
+            with _use_timeline(self._clock.timeline()):
+                controllers.append(_simulate(upstream_sock, self.upstream_simulation))
+        with self._lock:
+            if self._stopped.is_set():
+                conn_sock.close()
+                upstream_sock.close()
+                return
+            self._sockets.update((conn_sock, upstream_sock))
+            self._children.update(controllers)
+
+        upstream = threading.Thread(target=self._forward, args=(conn_sock, upstream_sock),
+                                    name='Poorconn proxy upstream', daemon=True)
+        upstream.start()
+        self._forward(upstream_sock, conn_sock)
+        upstream.join()
+        with self._lock:
+            self._sockets.difference_update((conn_sock, upstream_sock))
+        for s in (conn_sock, upstream_sock):
+            s.close()
+        for controller in controllers:
+            controller.remove()
+
+    @staticmethod
+    def _forward(source: socket.socket, destination: socket.socket) -> None:
+        "Send data received from ``source`` to ``destination`` until ``source`` is shut down."
+
+        try:
+            while True:
+                data = source.recv(65536)
+                if not data:
+                    break
+                destination.sendall(data)
+            destination.shutdown(socket.SHUT_WR)
+        except OSError:  # Either side has been reset or closed, which ends both directions
+            for s in (source, destination):
+                try:
+                    s.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+    def remove(self) -> None:
+        "Same as :meth:`.Controller.remove`, and additionally stops the proxy and closes its connections."
+
+        self._stopped.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        self._server_socket.close()
+        with self._lock:
+            sockets = tuple(self._sockets)
+        for s in sockets:
+            try:
+                s.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        super().remove()
+
+
+def start_proxy(target: Tuple[str, int], simulation: Optional[Simulation] = None,
+                upstream_simulation: Optional[Simulation] = None,
+                address: Tuple[str, int] = ('localhost', 0)) -> ProxyController:
+    """Start a TCP proxy that listens on ``address`` and forwards every connection to ``target`` on background threads,
+    so that any simulation can be put in front of a service that cannot be patched, such as a database server in another
+    process. ``simulation`` is applied to every connection socket of the proxy, which shapes data sent to the client,
+    and ``upstream_simulation`` to every socket that the proxy connects to ``target`` with, which shapes data sent to
+    the service. Each of them is either the name of a built-in profile, a :class:`Profile` object, or a function that
+    applies a simulation to a socket object and returns its controller::
+
+        controller = start_proxy(('localhost', 6379), simulation='3g',
+                                 upstream_simulation=lambda s: delay_before_sending(s, t=0.1, length=1024))
+        client = redis.Redis(*controller.address)
+
+    A connection of the proxy is closed when either side closes it, and its simulations are then removed. If ``target``
+    cannot be connected to, connections are closed immediately.
+
+    :param target: The address of the service to forward connections to.
+    :param simulation: The simulation to apply to data sent to clients, or ``None`` for none.
+    :param upstream_simulation: The simulation to apply to data sent to the service, or ``None`` for none.
+    :param address: The address to listen on. Port 0 means a port chosen by the operating system, which can be found
+        in :attr:`ProxyController.address`.
+
+    :return: A :class:`ProxyController` object that controls the proxy.
+
+    .. versionadded:: 0.3
+    """
+
+    host, port = address
+    family = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)[0][0]
+    server_socket = socket.socket(family, socket.SOCK_STREAM)
+    try:
+        server_socket.bind(address)
+        server_socket.listen()
+    except OSError:
+        server_socket.close()
+        raise
+    server_socket.settimeout(_POLL_INTERVAL)
+    controller = ProxyController(target=target, simulation=simulation, upstream_simulation=upstream_simulation,
+                                 server_socket=server_socket)
+    controller._thread.start()
+    return controller
@@ -0,0 +1,128 @@
+# Copyright (C) 2021  Hong Xu <hong@topbug.net>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+"""Running a Python program with Poorconn preloaded. The child process imports the ``sitecustomize`` module in
+:mod:`poorconn._preload`, which calls :func:`preload`."""
+
+from __future__ import annotations
+
+import atexit
+import dataclasses
+import json
+import os
+import pathlib
+import subprocess
+import sys
+import tempfile
+from typing import Any, Dict, Optional, Sequence
+
+from ._install import install, InstallController
+from ._profile import get_profile, Profile
+
+CONFIG_ENV = 'POORCONN_RUN_CONFIG'
+"Name of the environment variable that passes the configuration to the child process."
+
+
+def preload() -> Optional[InstallController]:
+    """Install the profile configured by :func:`run` in the current process, and dump its metrics upon exit. Do nothing
+    if the current process is not started by :func:`run`.
+
+    :return: The :class:`.InstallController` object, or ``None`` if nothing is installed.
+    """
+
+    config_json = os.environ.get(CONFIG_ENV)
+    if not config_json:
+        return None
+    config: Dict[str, Any] = json.loads(config_json)
+
+    profile = get_profile(config['profile']) if config.get('profile') else Profile('custom')
+    overrides = {key: config[key] for key in ('rate', 'latency') if config.get(key) is not None}
+    profile = dataclasses.replace(profile, **overrides)
+    controller = install(profile, match=config.get('match') or None)
+
+    metrics_file = config.get('metrics_file')
+    if metrics_file:
+        atexit.register(_dump_metrics, controller, metrics_file)
+
+    return controller
+
+
+def _dump_metrics(controller: InstallController, metrics_file: str) -> None:
+    "Append the metrics of ``controller`` to ``metrics_file`` as a line of JSON."
+
+    metrics = controller.metrics()
+    metrics['pid'] = os.getpid()
+    metrics['argv'] = sys.argv
+    # Processes, such as those started by the child process, may dump metrics to the same file concurrently. Each of
+    # them appends a single line in one write, which does not interleave with others in append mode.
+    with open(metrics_file, 'a') as f:
+        f.write(json.dumps(metrics) + '\n')
+
+
+def run(command: Sequence[str], *,
+        profile: Optional[str] = None,
+        rate: Optional[float] = None,
+        latency: Optional[float] = None,
+        match: Sequence[str] = (),
+        metrics_file: Optional[str] = None) -> int:
+    """Run ``command`` with Poorconn preloaded in all Python processes that it starts, and print a summary of their
+    metrics to stderr after it exits.
+
+    The preloading relies on the ``sitecustomize`` mechanism of :mod:`site`: The directory of :mod:`poorconn._preload`
+    is prepended to ``PYTHONPATH``. Any ``sitecustomize`` module that the child process would have imported otherwise
+    is still imported afterwards. Poorconn is then imported from the same installation as the current process, whose
+    directory is not added to ``sys.path`` of the child process, so that it does not shadow the packages of the child
+    process.
+
+    :param command: The command to run, such as ``['python', 'app.py']``.
+    :param profile: Name of a built-in profile. See :data:`poorconn.profiles`.
+    :param rate: Override :attr:`.Profile.rate` of the profile.
+    :param latency: Override :attr:`.Profile.latency` of the profile.
+    :param match: Destination patterns. See ``match`` in :func:`poorconn.install`.
+    :param metrics_file: The file that each process appends its metrics to as a line of JSON. A temporary file is used
+        if it is ``None``.
+    :return: The exit code of ``command``.
+    """
+
+    if profile is not None:
+        get_profile(profile)  # Fail early if the profile does not exist
+
+    package_dir = pathlib.Path(__file__).resolve().parent
+    python_path = [str(package_dir / '_preload')]
+    if os.environ.get('PYTHONPATH'):
+        python_path.append(os.environ['PYTHONPATH'])
+
+    with tempfile.TemporaryDirectory(prefix='poorconn-') as temp_dir:
+        if metrics_file is None:
+            metrics_file = os.path.join(temp_dir, 'metrics.jsonl')
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join(python_path)
+        env[CONFIG_ENV] = json.dumps({'profile': profile, 'rate': rate, 'latency': latency, 'match': list(match),
+                                      'metrics_file': os.path.abspath(metrics_file)})
+        returncode = subprocess.call(command, env=env)  # nosec: The command comes from the user
+
+        connections = bytes_sent = processes = 0
+        if os.path.exists(metrics_file):
+            with open(metrics_file) as f:
+                for line in f:
+                    metrics = json.loads(line)
+                    processes += 1
+                    connections += metrics['connections']
+                    bytes_sent += metrics['bytes_sent']
+        print(f'poorconn: {connections} connection(s) shaped, {bytes_sent} byte(s) sent, '
+              f'in {processes} Python process(es)', file=sys.stderr)
+
+    return returncode
@@ -15,17 +15,29 @@
 
 from __future__ import annotations
 
+import math
+import socket as _socket_module
 from socket import socket
-import time
-from types import MethodType
-from typing import Any, Callable, Dict, Sequence, Tuple
+import struct
+import sys
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
 
-from ._wrappers import wrap, wrap_accept, wrap_send
+from ._clock import _use_timeline, Pacer
+from ._controller import Controller
+from ._wrappers import replace, sending_methods, wrap, wrap_accept, wrap_send
 
-from ._socket import make_socket_patchable
+from ._socket import is_tls_socket, make_socket_patchable
+from ._tls import tls_plaintext_length
 
+try:
+    import fcntl
+    import termios
+except ImportError:  # pragma: no cover, not Unix
+    fcntl = termios = None  # type: ignore[assignment]
 
-class DelayBeforeSendingOnceController:
+
+class DelayBeforeSendingOnceController(Controller):
     """Controller for :func:`.delay_before_sending_once`. Objects are always created and returned by
     :func:`.delay_before_sending_once` and should not be created outside the :mod:`poorconn` package.
 
@@ -64,9 +76,9 @@ class DelayBeforeSendingOnceController:
 def delay_before_sending_once(s: socket, t: float) -> DelayBeforeSendingOnceController:
     """Delay ``t`` seconds before sending for once (first time only).
 
-    This function achieves the results by patching ``s``'s member methods :meth:`~socket.socket.send` and
-    :meth:`~socket.socket.sendall`. ``s``'s :meth:`~socket.socket.sendfile` method is not patched due to its
-    inconsistent behavior across operating systems.
+    This function achieves the results by patching ``s``'s member methods :meth:`~socket.socket.send`,
+    :meth:`~socket.socket.sendall` and :meth:`~socket.socket.sendmsg`. ``s``'s :meth:`~socket.socket.sendfile` method
+    is not patched due to its inconsistent behavior across operating systems.
 
     :param s: The :class:`socket.socket` object whose sending methods are to be delayed for once and once only.
     :param t: Number of seconds to delay.
@@ -78,14 +90,14 @@ def delay_before_sending_once(s: socket, t: float) -> DelayBeforeSendingOnceCont
 
     def before(*args: Any, **kwargs: Any) -> None:
         if controller._use():
-            time.sleep(controller.t)
+            controller._clock.sleep(controller.t)
 
-    wrap_send(s, before=before, before_pass=False)
+    controller._wrappings.extend(wrap_send(s, before=before, before_pass=False))
 
     return controller
 
 
-class DelayBeforeSendingController:
+class DelayBeforeSendingController(Controller):
     """Controller for :func:`.delay_before_sending`. Objects are always created and returned by
     :func:`.delay_before_sending` and should not be created outside the :mod:`poorconn` package.
 
@@ -96,6 +108,7 @@ class DelayBeforeSendingController:
     __slots__ = (
         't',
         'length',
+        'pacer',
     )
 
     def __init__(self, t: float, length: int):
@@ -106,15 +119,25 @@ class DelayBeforeSendingController:
         self.length: int = length
         """Same as ``length`` in :func:`delay_before_sending`. Updating it in the controller affects ``s`` in
         :func:`delay_before_sending`."""
+        self.pacer: Pacer = Pacer(clock=self._clock)
+        "The :class:`.Pacer` object that schedules the delays, which reports how precise they have been."
 
 
 def delay_before_sending(s: socket, t: float, length: int = 1024) -> DelayBeforeSendingController:
-    """Chop the content (``bytes`` in :meth:`socket.socket.send` and :meth:`socket.socket.sendall`) to be sent in
-    ``length`` bytes and delay ``t`` seconds before sending every time.
+    """Chop the content (``bytes`` in :meth:`socket.socket.send` and :meth:`socket.socket.sendall`, and ``buffers`` in
+    :meth:`socket.socket.sendmsg`) to be sent in ``length`` bytes and delay ``t`` seconds before sending every time.
+    Buffers passed to :meth:`~socket.socket.sendmsg` are sliced across their boundaries without being concatenated, and
+    each call sends at most ``length`` bytes. The delays within a call of :meth:`~socket.socket.sendall` are scheduled
+    by deadlines (see :class:`.Pacer`), so that oversleeping and the time spent sending are compensated in subsequent
+    delays rather than accumulated.
+
+    This function achieves the results by patching ``s``'s member methods :meth:`~socket.socket.send`,
+    :meth:`~socket.socket.sendall` and :meth:`~socket.socket.sendmsg`. ``s``'s :meth:`~socket.socket.sendfile` method
+    is not patched due to its inconsistent behavior across operating systems.
 
-    This function achieves the results by patching ``s``'s member methods :meth:`~socket.socket.send` and
-    :meth:`~socket.socket.sendall`. ``s``'s :meth:`~socket.socket.sendfile` method is not patched due to its
-    inconsistent behavior across operating systems.
+    If ``s`` is an :class:`ssl.SSLSocket` object, ``length`` is the number of bytes of TLS records on the wire, which
+    include the overhead of TLS on top of the content, and only :meth:`~ssl.SSLSocket.send` is patched because
+    :meth:`~ssl.SSLSocket.sendall` relies on it.
 
     :param s: The :class:`socket.socket` object whose sending methods are to be delayed every time.
     :param t: Number of seconds to delay.
@@ -125,14 +148,29 @@ def delay_before_sending(s: socket, t: float, length: int = 1024) -> DelayBefore
 
     controller = DelayBeforeSendingController(t=t, length=length)
 
+    tls = is_tls_socket(s)
+
     def before(sock: socket, *args: Any, **kwargs: Any) -> Tuple[Tuple, Dict]:
-        time.sleep(controller.t)
+        controller.pacer.reset()
+        controller.pacer.wait(controller.t)
         bytes_ = args[0] if len(args) > 0 else kwargs.get('bytes')  # Content of the bytes parameter from send
         flags = args[1] if len(args) > 1 else kwargs.get('flags')
-        return (bytes_[:min(controller.length, len(bytes_))],) + ((flags,) if flags is not None else ()), {}
+        # Each send() of an SSLSocket writes its content as TLS records, which are larger than the content
+        length = tls_plaintext_length(sock, controller.length) if tls else controller.length
+        return (bytes_[:min(length, len(bytes_))],) + ((flags,) if flags is not None else ()), {}
+
+    def before_sendmsg(sock: socket, buffers: Iterable[Any], *args: Any, **kwargs: Any) -> Tuple[Tuple, Dict]:
+        controller.pacer.reset()
+        controller.pacer.wait(controller.t)
+        return (head_of_buffers(buffers, controller.length),) + args, kwargs
 
     # For send, simply truncate the length of the content to be sent to ``length`` and delay that by ``t`` seconds.
-    wrap(s, meth='send', before=before, before_pass=True)
+    controller._wrappings.append(wrap(s, meth='send', before=before, before_pass=True))
+    if tls:  # SSLSocket.sendall() calls send() repeatedly
+        return controller
+    # The same goes for sendmsg, except that the content is a sequence of buffers.
+    if 'sendmsg' in sending_methods(s):
+        controller._wrappings.append(wrap(s, meth='sendmsg', before=before_sendmsg, before_pass=True))
     wrapped_sendall = s.sendall
 
     # The functions that wraps sendall
@@ -140,39 +178,63 @@ def delay_before_sending(s: socket, t: float, length: int = 1024) -> DelayBefore
         bytes_ = args[0] if len(args) > 0 else kwargs.get('bytes')  # Content of the bytes parameter from send
         flags = args[1] if len(args) > 1 else kwargs.get('flags')   # flags parameter
 
+        controller.pacer.reset()
         for i in range(0, len(bytes_), controller.length):
-            time.sleep(controller.t)
+            controller.pacer.wait(controller.t)
             begin = i
             end = min(len(bytes_), i + controller.length)
             args = (bytes_[begin:end],) + ((flags,) if flags is not None else ())
             wrapped_sendall(*args)
 
-    # See https://github.com/python/mypy/issues/2427#issuecomment-480263443 for the type ignoring below
-    s.sendall = MethodType(wrapping_function, s)  # type: ignore
+    controller._wrappings.append(replace(s, meth='sendall', function=wrapping_function))
 
     return controller
 
 
-def wrap_sending_upon_acceptance(s: socket, wrapper: Callable, param_func: Callable[[], Tuple[Any, Any]]) -> None:
+def head_of_buffers(buffers: Iterable[Any], length: int) -> List[memoryview]:
+    """Get the first ``length`` bytes of a sequence of buffers, such as ``buffers`` in :meth:`socket.socket.sendmsg`,
+    without copying them.
+
+    :param buffers: The buffers, which are objects that support the buffer protocol.
+    :param length: Maximum number of bytes.
+    :return: :class:`memoryview` objects of the buffers, the last one of which may be sliced, and whose total size is at
+        most ``length`` bytes.
+    """
+
+    head = []
+    for buffer in buffers:
+        if length <= 0:
+            break
+        view = memoryview(buffer).cast('B')[:length]
+        head.append(view)
+        length -= len(view)
+    return head
+
+
+def wrap_sending_upon_acceptance(s: socket, wrapper: Callable[..., Controller],
+                                 param_func: Callable[[], Tuple[Any, Any]], controller: Controller) -> None:
     """Wrap sending functions of the connection socket returned by ``s.accept()``.
 
     :param s: The :class:`socket.socket` object where ``s.accept()``'s sending methods are to be wrapped.
     :param wrapper: The wrapper function.
     :param param_func: A function that returns a tuple ``(args, kwargs)``, where ``args`` are passed as positional
          arguments to the wrapper and ``kwargs`` are passed as keyword parameters.
+    :param controller: The controller of ``s``. It keeps track of the wrapping of ``s.accept()`` and the controllers
+         returned by ``wrapper``, so that all of them are removed by :meth:`.Controller.remove`.
     """
 
     def after(s: socket, *, original: Sequence, before: Any) -> Tuple[Any, Any]:
         conn_sock = original[0]
         conn_sock = make_socket_patchable(conn_sock, (':sending',))
         args, kwargs = param_func()
-        wrapper(conn_sock, *args, **kwargs)
+        with _use_timeline(controller._clock.timeline()):  # Each connection has its own timeline
+            controller._children.add(wrapper(conn_sock, *args, **kwargs))
         return conn_sock, original[1]
 
-    wrap_accept(s, after=after)
+    controller._wrappings.append(wrap_accept(s, after=after))
 
 
-class DelayBeforeSendingUponAcceptanceOnceController:
+class DelayBeforeSendingUponAcceptanceOnceController(Controller):
     """Controller for :func:`.delay_before_sending_upon_acceptance_once`. Objects are always created and returned by
     :func:`.delay_before_sending_upon_acceptance_once` and should not be created outside the :mod:`poorconn` package.
 
@@ -194,19 +256,20 @@ def delay_before_sending_upon_acceptance_once(s: socket, t: float) -> DelayBefor
     """Delay ``t`` seconds before sending for all sockets returned by ``s.accept()``, for once (first time only).
     Parameters mean the same as :func:`.delay_before_sending_once`.
 
-    This function achieves the results by patching the connection sockets' member methods :meth:`~socket.socket.send`
-    and :meth:`~socket.socket.sendall`. Their :meth:`~socket.socket.sendfile` methods are not patched due to their
-    inconsistent behavior across operating systems.
+    This function achieves the results by patching the connection sockets' member methods :meth:`~socket.socket.send`,
+    :meth:`~socket.socket.sendall` and :meth:`~socket.socket.sendmsg`. Their :meth:`~socket.socket.sendfile` methods
+    are not patched due to their inconsistent behavior across operating systems.
 
     :return: A :class:`DelayBeforeSendingUponAcceptanceOnceController` object that controls the patched socket object.
     """
 
     controller = DelayBeforeSendingUponAcceptanceOnceController(t=t)
-    wrap_sending_upon_acceptance(s, delay_before_sending_once, param_func=lambda: ((), {'t': controller.t}))
+    wrap_sending_upon_acceptance(s, delay_before_sending_once, param_func=lambda: ((), {'t': controller.t}),
+                                 controller=controller)
     return controller
 
 
-class DelayBeforeSendingUponAcceptanceController:
+class DelayBeforeSendingUponAcceptanceController(Controller):
     """Controller for :func:`.delay_before_sending_upon_acceptance`. Objects are always created and returned by
     :func:`.delay_before_sending_upon_acceptance` and should not be created outside the :mod:`poorconn` package.
 
@@ -235,14 +298,251 @@ def delay_before_sending_upon_acceptance(s: socket, t: float,
     :meth:`socket.socket.sendall`) to be sent in ``length`` bytes and delay ``t`` seconds before sending every time.
     Parameters mean the same as :func:`.delay_before_sending`.
 
-    This function achieves the results by patching the connection sockets' member methods :meth:`~socket.socket.send`
-    and :meth:`~socket.socket.sendall`. Their :meth:`~socket.socket.sendfile` methods are not patched due to their
-    inconsistent behavior across operating systems.
+    This function achieves the results by patching the connection sockets' member methods :meth:`~socket.socket.send`,
+    :meth:`~socket.socket.sendall` and :meth:`~socket.socket.sendmsg`. Their :meth:`~socket.socket.sendfile` methods
+    are not patched due to their inconsistent behavior across operating systems.
 
     :return: A :class:`DelayBeforeSendingUponAcceptanceController` object that controls the patched socket object.
     """
 
     controller = DelayBeforeSendingUponAcceptanceController(t=t, length=length)
     wrap_sending_upon_acceptance(s, delay_before_sending, param_func=lambda: ((), {'t': controller.t,
-                                                                                   'length': controller.length}))
+                                                                                   'length': controller.length}),
+                                 controller=controller)
+    return controller
+
+
+class LimitLinkRateController(Controller):
+    """Controller for :func:`.limit_link_rate`. Objects are always created and returned by :func:`.limit_link_rate` and
+    should not be created outside the :mod:`poorconn` package.
+
+    :param rate: Same as ``rate`` in :func:`limit_link_rate`.
+    :param mss: Same as ``mss`` in :func:`limit_link_rate`.
+    :param timer_resolution: Same as ``timer_resolution`` in :func:`limit_link_rate`.
+
+    .. versionadded:: 0.3
+    """
+
+    __slots__ = (
+        'rate',
+        'mss',
+        'timer_resolution',
+        'pace_kernel_queue',
+        'pacer',
+        '_lock',
+        '_next_time',
+        '_send_buffer',
+    )
+
+    def __init__(self, rate: float, mss: int, timer_resolution: float, pace_kernel_queue: bool):
+        super().__init__()
+        self.rate: float = rate
+        """Same as ``rate`` in :func:`limit_link_rate`. Updating it in the controller affects ``s`` in
+        :func:`limit_link_rate`."""
+        self.mss: int = mss
+        """Same as ``mss`` in :func:`limit_link_rate`. Updating it in the controller affects ``s`` in
+        :func:`limit_link_rate`."""
+        self.timer_resolution: float = timer_resolution
+        """Same as ``timer_resolution`` in :func:`limit_link_rate`. Updating it in the controller affects ``s`` in
+        :func:`limit_link_rate`."""
+        self.pace_kernel_queue: bool = pace_kernel_queue
+        """Same as ``pace_kernel_queue`` in :func:`limit_link_rate`. Updating it in the controller affects ``s`` in
+        :func:`limit_link_rate`, but not its send buffer size."""
+        self.pacer: Pacer = Pacer(clock=self._clock)
+        "The :class:`.Pacer` object that sleeps until the deadlines, which reports how precise they have been."
+        self._lock = threading.Lock()
+        # The time at which the link finishes serializing the segments that have been scheduled
+        self._next_time = 0.0
+        # The socket whose send buffer size has been changed and its original send buffer size
+        self._send_buffer: Optional[Tuple[socket, int]] = None
+
+    def _batch_length(self) -> int:
+        "Number of bytes of segments that are serialized in one batch, which takes at least the timer resolution."
+        return self.mss * max(1, math.ceil(self.timer_resolution * self.rate / self.mss))
+
+    def _serialize(self, length: int) -> None:
+        "Wait until the link has serialized ``length`` more bytes."
+
+        with self._lock:
+            # The deadlines are scheduled from the previous one rather than from the time of waking up, so that
+            # oversleeping does not accumulate. An idle link does not save up time for a later burst.
+            self._next_time = max(self._next_time, self._clock.monotonic()) + length / self.rate
+            deadline = self._next_time
+        self.pacer.sleep_until(deadline)
+
+    def _wait_for_kernel_queue(self, s: socket, length: int) -> None:
+        """Wait until no more than ``length`` bytes sent by ``s`` are waiting in the kernel to be sent or acknowledged,
+        so that data is sent at the rate at which it leaves the host rather than the rate at which it enters the send
+        buffer. Return immediately if the platform does not support querying the send queue."""
+
+        while True:
+            queued = _kernel_send_queue_length(s)
+            if queued is None or queued <= length:
+                return
+            self._clock.sleep(max(self.timer_resolution, (queued - length) / self.rate))
+
+    def _size_send_buffer(self, s: socket) -> None:
+        "Shrink the send buffer of ``s`` to hold about two batches, so that the kernel does not absorb bursts."
+
+        if not sys.platform.startswith('linux') or s.fileno() < 0:  # Simulated sockets have no kernel buffers
+            return
+        original = s.getsockopt(_socket_module.SOL_SOCKET, _socket_module.SO_SNDBUF)
+        # Linux doubles the value to account for its bookkeeping overhead, and reports the doubled value
+        s.setsockopt(_socket_module.SOL_SOCKET, _socket_module.SO_SNDBUF, self._batch_length())
+        self._send_buffer = s, original // 2
+
+    def remove(self) -> None:
+        "Same as :meth:`.Controller.remove`, and additionally restores the send buffer size of the socket object."
+
+        super().remove()
+        if self._send_buffer is not None:
+            s, size = self._send_buffer
+            self._send_buffer = None
+            if s.fileno() != -1:
+                s.setsockopt(_socket_module.SOL_SOCKET, _socket_module.SO_SNDBUF, size)
+
+
+def _kernel_send_queue_length(s: socket) -> Optional[int]:
+    """Get the number of bytes in the send queue of ``s`` in the kernel, i.e., bytes that have not been sent or
+    acknowledged by the peer.
+
+    :return: The number of bytes, or ``None`` if the platform does not support querying it.
+    """
+
+    if not sys.platform.startswith('linux') or fcntl is None:  # pragma: no cover, Linux-only
+        return None
+    if s.fileno() < 0:  # Simulated sockets have no kernel queue
+        return None
+    try:
+        # SIOCOUTQ, which shares its value with TIOCOUTQ on Linux
+        return int(struct.unpack('i', fcntl.ioctl(s.fileno(), termios.TIOCOUTQ, b'\0' * 4))[0])
+    except OSError:
+        return None
+
+
+def limit_link_rate(s: socket, rate: float, mss: int = 1448, timer_resolution: float = 0.001,
+                    pace_kernel_queue: bool = False) -> LimitLinkRateController:
+    """Limit the rate at which ``s`` sends to ``rate`` bytes per second, as a link serializes segments: Sent data is
+    split into segments of ``mss`` bytes, each of which takes ``mss / rate`` seconds to serialize before it is sent. To
+    stay accurate at high rates, consecutive segments are serialized in batches that take at least ``timer_resolution``
+    seconds, each of which is sent with one call to the operating system after one sleep, and sleeps are scheduled by
+    deadlines so that oversleeping does not accumulate.
+
+    This function achieves the results by patching ``s``'s member methods :meth:`~socket.socket.send`,
+    :meth:`~socket.socket.sendall` and :meth:`~socket.socket.sendmsg`. ``s``'s :meth:`~socket.socket.sendfile` method
+    is not patched due to its inconsistent behavior across operating systems.
+
+    If ``s`` is an :class:`ssl.SSLSocket` object, segments count the bytes of TLS records on the wire, as
+    :func:`delay_before_sending` does.
+
+    Data that has been sent may still wait in the send buffer of ``s`` in the kernel, which would send it in a burst
+    later if the network is slower than ``rate``. If ``pace_kernel_queue`` is true, ``s`` does not send a batch until
+    the send queue in the kernel holds no more than one batch, which the kernel reports through the ``SIOCOUTQ``
+    ioctl, and the send buffer of ``s`` is shrunk to about two batches until the controller is removed. This option has
+    an effect on Linux only.
+
+    :param s: The :class:`socket.socket` object whose sending is to be limited.
+    :param rate: Number of bytes that the link serializes per second.
+    :param mss: Number of bytes of a segment.
+    :param timer_resolution: Minimum number of seconds to sleep at a time.
+    :param pace_kernel_queue: Whether to pace sending against the send queue in the kernel.
+
+    :return: A :class:`LimitLinkRateController` object that controls the patched socket object.
+
+    .. versionadded:: 0.3
+    """
+
+    controller = LimitLinkRateController(rate=rate, mss=mss, timer_resolution=timer_resolution,
+                                         pace_kernel_queue=pace_kernel_queue)
+    if pace_kernel_queue:
+        controller._size_send_buffer(s)
+    tls = is_tls_socket(s)
+
+    def batch(sock: socket, size: int) -> int:
+        "Serialize the next batch of up to ``size`` bytes, and return the number of bytes in it."
+        length = min(size, controller._batch_length())
+        controller._serialize(length)
+        if controller.pace_kernel_queue:
+            controller._wait_for_kernel_queue(sock, controller._batch_length())
+        return min(size, tls_plaintext_length(sock, length)) if tls else length
+
+    def before_send(sock: socket, data: Any, *args: Any, **kwargs: Any) -> Tuple[Tuple, Dict]:
+        view = memoryview(data).cast('B')
+        return (view[:batch(sock, len(view))],) + args, kwargs
+
+    def before_sendmsg(sock: socket, buffers: Iterable[Any], *args: Any, **kwargs: Any) -> Tuple[Tuple, Dict]:
+        buffers = list(buffers)
+        return (head_of_buffers(buffers, batch(sock, sum(memoryview(b).nbytes for b in buffers))),) + args, kwargs
+
+    meths = sending_methods(s)
+    controller._wrappings.append(wrap(s, meth='send', before=before_send, before_pass=True))
+    if 'sendmsg' in meths:
+        controller._wrappings.append(wrap(s, meth='sendmsg', before=before_sendmsg, before_pass=True))
+    if 'sendall' in meths:
+        wrapped_sendall = s.sendall
+
+        def sendall(self: socket, data: Any, *args: Any, **kwargs: Any) -> None:
+            view = memoryview(data).cast('B')
+            while view:
+                length = batch(self, len(view))
+                wrapped_sendall(view[:length], *args, **kwargs)
+                view = view[length:]
+
+        controller._wrappings.append(replace(s, meth='sendall', function=sendall))
+
+    return controller
+
+
+class LimitLinkRateUponAcceptanceController(Controller):
+    """Controller for :func:`.limit_link_rate_upon_acceptance`. Objects are always created and returned by
+    :func:`.limit_link_rate_upon_acceptance` and should not be created outside the :mod:`poorconn` package.
+
+    :param rate: Same as ``rate`` in :func:`limit_link_rate_upon_acceptance`.
+    :param mss: Same as ``mss`` in :func:`limit_link_rate_upon_acceptance`.
+    :param timer_resolution: Same as ``timer_resolution`` in :func:`limit_link_rate_upon_acceptance`.
+
+    .. versionadded:: 0.3
+    """
+
+    __slots__ = (
+        'rate',
+        'mss',
+        'timer_resolution',
+        'pace_kernel_queue',
+    )
+
+    def __init__(self, rate: float, mss: int, timer_resolution: float, pace_kernel_queue: bool):
+        super().__init__()
+        self.rate: float = rate
+        """Same as ``rate`` in :func:`limit_link_rate_upon_acceptance`. Updating it in the controller affects sockets
+        that are accepted afterwards."""
+        self.mss: int = mss
+        """Same as ``mss`` in :func:`limit_link_rate_upon_acceptance`. Updating it in the controller affects sockets
+        that are accepted afterwards."""
+        self.timer_resolution: float = timer_resolution
+        """Same as ``timer_resolution`` in :func:`limit_link_rate_upon_acceptance`. Updating it in the controller
+        affects sockets that are accepted afterwards."""
+        self.pace_kernel_queue: bool = pace_kernel_queue
+        """Same as ``pace_kernel_queue`` in :func:`limit_link_rate_upon_acceptance`. Updating it in the controller
+        affects sockets that are accepted afterwards."""
+
+
+def limit_link_rate_upon_acceptance(s: socket, rate: float, mss: int = 1448, timer_resolution: float = 0.001,
+                                    pace_kernel_queue: bool = False) -> LimitLinkRateUponAcceptanceController:
+    """For every socket object returned by ``s.accept()``, limit the rate at which it sends as a link serializes
+    segments. Parameters mean the same as :func:`.limit_link_rate`.
+
+    :return: A :class:`LimitLinkRateUponAcceptanceController` object that controls the patched socket object.
+
+    .. versionadded:: 0.3
+    """
+
+    controller = LimitLinkRateUponAcceptanceController(rate=rate, mss=mss, timer_resolution=timer_resolution,
+                                                       pace_kernel_queue=pace_kernel_queue)
+    wrap_sending_upon_acceptance(s, limit_link_rate,
+                                 param_func=lambda: ((), {'rate': controller.rate,
+                                                          'mss': controller.mss,
+                                                          'timer_resolution': controller.timer_resolution,
+                                                          'pace_kernel_queue': controller.pace_kernel_queue}),
+                                 controller=controller)
     return controller
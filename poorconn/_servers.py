@@ -0,0 +1,88 @@
+# Copyright (C) 2021  Hong Xu <hong@topbug.net>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"Servers that are shared by the pytest plugin and the listeners of configuration files."
+
+from __future__ import annotations
+
+from http.server import ThreadingHTTPServer
+import pathlib
+import socket
+from socketserver import ThreadingTCPServer
+import threading
+from typing import Any, Callable, Optional, Tuple
+
+from ._http import FileCache, HTTPRequestHandler
+
+_POLL_INTERVAL: float = 0.05
+"Number of seconds between polls for shutdown of servers, which bounds the time that stopping a server takes."
+
+
+class _ServerMixin:
+    "A mixin of :class:`socketserver.BaseServer` classes that allows reusing address and serving on a new thread."
+
+    allow_reuse_address: bool = True
+    socket: socket.socket
+    serve_forever: Callable[..., None]
+
+    def serve_forever_new_thread(self) -> threading.Thread:
+        "Serve forever, but in a new thread."
+
+        # [NOTE SO_REUSEADDR]
+        # With SO_REUSEADDR, multiple sockets on Windows can listen on the same
+        # ports and cause undetermined behaviors. Use SO_EXCLUSIVEADDRUSE to
+        # prevent this. See
+        # https://docs.microsoft.com/en-us/windows/win32/winsock/using-so-reuseaddr-and-so-exclusiveaddruse
+        if hasattr(socket, 'SO_EXCLUSIVEADDRUSE'):  # pragma: no cover, Windows-only
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_EXCLUSIVEADDRUSE, 1)
+        else:  # pragma: no cover
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        thread = threading.Thread(target=self.serve_forever, kwargs={'poll_interval': _POLL_INTERVAL},
+                                  name='Http server on a new thread', daemon=True)
+        thread.start()
+        return thread
+
+
+if hasattr(socket, 'SO_EXCLUSIVEADDRUSE'):  # pragma: no cover, Windows-only
+    _ServerMixin.allow_reuse_address = False
+else:  # pragma: no cover
+    _ServerMixin.allow_reuse_address = True
+
+
+class _HTTPServer(_ServerMixin, ThreadingHTTPServer):
+    """Our inherited :class:`ThreadingHTTPServer` class that allows reusing address, and serves a directory that can be
+    changed while it is running."""
+
+    def __init__(self, server_address: Tuple[str, int], directory: pathlib.Path):
+        super().__init__(server_address, _HTTPRequestHandler)
+        self.directory: pathlib.Path = directory
+        "The directory to serve."
+        self.file_cache: Optional[FileCache] = None
+        "The cache of the served files, if any."
+
+
+class _TCPServer(_ServerMixin, ThreadingTCPServer):
+    "Our inherited :class:`socketserver.ThreadingTCPServer` class that allows reusing address."
+
+    daemon_threads: bool = True
+
+
+class _HTTPRequestHandler(HTTPRequestHandler):
+    "Serves the current directory of the :class:`_HTTPServer` object."
+
+    def __init__(self, request: Any, client_address: Any, server: _HTTPServer, **kwargs: Any):
+        # The following type ignore is because of https://github.com/python/mypy/issues/6799
+        super().__init__(request, client_address, server, directory=str(server.directory),  # type: ignore[misc]
+                         **kwargs)
@@ -0,0 +1,227 @@
+# Copyright (C) 2021  Hong Xu <hong@topbug.net>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from __future__ import annotations
+
+import math
+import random
+from socket import socket
+import threading
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from ._controller import Controller
+from ._send import head_of_buffers, wrap_sending_upon_acceptance
+from ._wrappers import replace, sending_methods, wrap
+
+
+class EmulateSlowStartController(Controller):
+    """Controller for :func:`.emulate_slow_start`. Objects are always created and returned by
+    :func:`.emulate_slow_start` and should not be created outside the :mod:`poorconn` package.
+
+    :param rtt: Same as ``rtt`` in :func:`emulate_slow_start`.
+    :param rate: Same as ``rate`` in :func:`emulate_slow_start`.
+    :param initial_window: Same as ``initial_window`` in :func:`emulate_slow_start`.
+    :param mss: Same as ``mss`` in :func:`emulate_slow_start`.
+    :param loss: Same as ``loss`` in :func:`emulate_slow_start`.
+
+    .. versionadded:: 0.3
+    """
+
+    __slots__ = (
+        'rtt',
+        'rate',
+        'initial_window',
+        'mss',
+        'loss',
+        'cwnd',
+        'ssthresh',
+        'losses',
+        '_lock',
+        '_round_start',
+        '_sent',
+    )
+
+    def __init__(self, rtt: float, rate: Optional[float], initial_window: int, mss: int, loss: float):
+        super().__init__()
+        self.rtt: float = rtt
+        "Same as ``rtt`` in :func:`emulate_slow_start`. Updating it in the controller affects ``s``."
+        self.rate: Optional[float] = rate
+        "Same as ``rate`` in :func:`emulate_slow_start`. Updating it in the controller affects ``s``."
+        self.initial_window: int = initial_window
+        """Same as ``initial_window`` in :func:`emulate_slow_start`. Updating it in the controller affects restarts
+        after idle periods."""
+        self.mss: int = mss
+        "Same as ``mss`` in :func:`emulate_slow_start`. Updating it in the controller affects ``s``."
+        self.loss: float = loss
+        "Same as ``loss`` in :func:`emulate_slow_start`. Updating it in the controller affects ``s``."
+        self.cwnd: int = initial_window
+        "The current congestion window in bytes."
+        self.ssthresh: float = math.inf
+        "The current slow start threshold in bytes."
+        self.losses: int = 0
+        "Number of rounds in which a loss has been simulated."
+        self._lock = threading.Lock()
+        # The start time of the current round, and the number of bytes sent in it
+        self._round_start: Optional[float] = None
+        self._sent = 0
+
+    def _end_round(self) -> None:
+        "Update the congestion window at the end of a round."
+
+        packets = math.ceil(self._sent / self.mss)
+        if self.loss > 0 and random.random() < 1 - (1 - self.loss) ** packets:
+            # Fast retransmit and fast recovery halve the congestion window
+            self.losses += 1
+            self.ssthresh = max(self.cwnd // 2, 2 * self.mss)
+            self.cwnd = int(self.ssthresh)
+        elif self._sent >= self.cwnd:  # Only a fully used window grows
+            self.cwnd = self.cwnd * 2 if self.cwnd < self.ssthresh else self.cwnd + self.mss
+        if self.rate is not None:  # A window larger than the bandwidth-delay product does not increase throughput
+            self.cwnd = min(self.cwnd, max(self.mss, math.ceil(self.rate * self.rtt)))
+
+    def _take(self, size: int) -> int:
+        """Wait until the congestion window allows sending, and take up to ``size`` bytes from it.
+
+        :return: Number of bytes that may be sent.
+        """
+
+        if size == 0:
+            return 0
+        while True:
+            with self._lock:
+                now = self._clock.monotonic()
+                if self._round_start is None:
+                    self._round_start = now
+                elif now >= self._round_start + 2 * self.rtt:  # Idle for longer than a round
+                    # Restart from the initial window, as RFC 5681 recommends
+                    self.cwnd = min(self.cwnd, self.initial_window)
+                    self._round_start, self._sent = now, 0
+                elif now >= self._round_start + self.rtt:
+                    self._end_round()
+                    self._round_start, self._sent = now, 0
+                available = self.cwnd - self._sent
+                if available > 0:
+                    taken = min(size, available)
+                    self._sent += taken
+                    return taken
+                wait = self._round_start + self.rtt - now
+            self._clock.sleep(wait)  # Until acknowledgements arrive
+
+
+def emulate_slow_start(s: socket, rtt: float, rate: Optional[float] = None, initial_window: int = 14480,
+                       mss: int = 1448, loss: float = 0.0) -> EmulateSlowStartController:
+    """Emulate the congestion window of TCP: In every round trip of ``rtt`` seconds, ``s`` sends at most as many bytes
+    as its congestion window, which starts at ``initial_window`` bytes and doubles every round in slow start until a
+    loss is simulated. A loss halves the window, after which it grows by ``mss`` bytes every round. After ``s`` has
+    been idle for a round, the window restarts from ``initial_window``. Therefore, new connections are slow at first
+    and become faster subsequently, like real ones.
+
+    This function achieves the results by patching ``s``'s member methods :meth:`~socket.socket.send`,
+    :meth:`~socket.socket.sendall` and :meth:`~socket.socket.sendmsg`, which block when the window is used up until the
+    round ends. ``s``'s :meth:`~socket.socket.sendfile` method is not patched due to its inconsistent behavior across
+    operating systems.
+
+    :param s: The :class:`socket.socket` object whose sending is to be limited by the congestion window.
+    :param rtt: Number of seconds of a round trip.
+    :param rate: Number of bytes per second at which the window stops growing, i.e., the window grows up to the
+        bandwidth-delay product ``rate * rtt``. ``None`` means no limit.
+    :param initial_window: Number of bytes of the initial congestion window. The default is 10 segments, as RFC 6928
+        recommends.
+    :param mss: Number of bytes of a segment.
+    :param loss: Probability of losing each segment, between 0 and 1. A round with any lost segment halves the window.
+
+    :return: A :class:`EmulateSlowStartController` object that controls the patched socket object.
+
+    .. versionadded:: 0.3
+    """
+
+    controller = EmulateSlowStartController(rtt=rtt, rate=rate, initial_window=initial_window, mss=mss, loss=loss)
+
+    def before_send(sock: socket, data: Any, *args: Any, **kwargs: Any) -> Tuple[Tuple, Dict]:
+        view = memoryview(data).cast('B')
+        return (view[:controller._take(len(view))],) + args, kwargs
+
+    def before_sendmsg(sock: socket, buffers: Iterable[Any], *args: Any, **kwargs: Any) -> Tuple[Tuple, Dict]:
+        buffers = list(buffers)
+        size = sum(memoryview(buffer).nbytes for buffer in buffers)
+        return (head_of_buffers(buffers, controller._take(size)),) + args, kwargs
+
+    meths = sending_methods(s)
+    controller._wrappings.append(wrap(s, meth='send', before=before_send, before_pass=True))
+    if 'sendmsg' in meths:
+        controller._wrappings.append(wrap(s, meth='sendmsg', before=before_sendmsg, before_pass=True))
+    if 'sendall' in meths:
+        wrapped_sendall = s.sendall
+
+        def sendall(self: socket, data: Any, *args: Any, **kwargs: Any) -> None:
+            view = memoryview(data).cast('B')
+            while view:
+                taken = controller._take(len(view))
+                wrapped_sendall(view[:taken], *args, **kwargs)
+                view = view[taken:]
+
+        controller._wrappings.append(replace(s, meth='sendall', function=sendall))
+
+    return controller
+
+
+class EmulateSlowStartUponAcceptanceController(Controller):
+    """Controller for :func:`.emulate_slow_start_upon_acceptance`. Objects are always created and returned by
+    :func:`.emulate_slow_start_upon_acceptance` and should not be created outside the :mod:`poorconn` package.
+
+    Its attributes are the same as the parameters of :func:`emulate_slow_start_upon_acceptance`. Updating them in the
+    controller affects sockets that are accepted afterwards.
+
+    .. versionadded:: 0.3
+    """
+
+    __slots__ = (
+        'rtt',
+        'rate',
+        'initial_window',
+        'mss',
+        'loss',
+    )
+
+    def __init__(self, rtt: float, rate: Optional[float], initial_window: int, mss: int, loss: float):
+        super().__init__()
+        self.rtt: float = rtt
+        self.rate: Optional[float] = rate
+        self.initial_window: int = initial_window
+        self.mss: int = mss
+        self.loss: float = loss
+
+
+def emulate_slow_start_upon_acceptance(s: socket, rtt: float, rate: Optional[float] = None,
+                                       initial_window: int = 14480, mss: int = 1448,
+                                       loss: float = 0.0) -> EmulateSlowStartUponAcceptanceController:
+    """For every socket object returned by ``s.accept()``, emulate the congestion window of TCP, which starts from the
+    initial window for every connection. Parameters mean the same as :func:`.emulate_slow_start`.
+
+    :return: A :class:`EmulateSlowStartUponAcceptanceController` object that controls the patched socket object.
+
+    .. versionadded:: 0.3
+    """
+
+    controller = EmulateSlowStartUponAcceptanceController(rtt=rtt, rate=rate, initial_window=initial_window, mss=mss,
+                                                          loss=loss)
+    wrap_sending_upon_acceptance(s, emulate_slow_start,
+                                 param_func=lambda: ((), {'rtt': controller.rtt,
+                                                          'rate': controller.rate,
+                                                          'initial_window': controller.initial_window,
+                                                          'mss': controller.mss,
+                                                          'loss': controller.loss}),
+                                 controller=controller)
+    return controller
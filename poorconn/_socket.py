@@ -19,6 +19,11 @@ from socket import socket
 import threading
 from typing import Any, Iterable, no_type_check
 
+try:
+    from ssl import SSLSocket
+except ImportError:  # pragma: no cover, Python is built without ssl
+    SSLSocket = None  # type: ignore[misc,assignment]
+
 
 class PatchableSocket(socket):
     """A class that allows some :class:`socket.socket` functions to be patchable and thus can be wrapped.
@@ -59,6 +64,17 @@ class PatchableSocket(socket):
         "Wraps :meth:`~socket.socket.sendall` so that this function is patchable."
         return super().sendall(*args, **kwargs)
 
+    @no_type_check
+    def sendto(self, *args, **kwargs):
+        "Wraps :meth:`~socket.socket.sendto` so that this function is patchable."
+        return super().sendto(*args, **kwargs)
+
+    if hasattr(socket, 'sendmsg'):  # Not available on Windows
+        @no_type_check
+        def sendmsg(self, *args, **kwargs):
+            "Wraps :meth:`~socket.socket.sendmsg` so that this function is patchable."
+            return super().sendmsg(*args, **kwargs)
+
 
 _patchability_thread_lock: threading.Lock = threading.Lock()
 
@@ -68,32 +84,54 @@ def is_patchable(s: Any, attr: str) -> bool:
 
     :param s: The object.
     :param attr: The name of the attribute.
-    :return: True if ``s.attr`` is patchable, False otherwise.
+    :return: True if ``s.attr`` is patchable, False otherwise, including if ``s`` has no such attribute.
     """
     with _patchability_thread_lock:
+        if not hasattr(s, attr):  # Such as socket.sendmsg on Windows
+            return False
+        shadowing = attr in getattr(s, '__dict__', {})
         cur_attr = getattr(s, attr)
         try:
             setattr(s, attr, 1)
         except AttributeError:  # readonly attribute
             return False
         else:
-            setattr(s, attr, cur_attr)
+            if shadowing:
+                setattr(s, attr, cur_attr)
+            else:  # Expose the attribute of the class again instead of shadowing it
+                delattr(s, attr)
             return True
 
 
+def is_tls_socket(s: socket) -> bool:
+    """Test whether ``s`` is an :class:`ssl.SSLSocket` object.
+
+    :param s: The socket object.
+    :return: True if ``s`` is an :class:`ssl.SSLSocket` object, False otherwise.
+    """
+    return SSLSocket is not None and isinstance(s, SSLSocket)
+
+
 def make_socket_patchable(s: socket, funcs: Iterable[str] = (':sending', 'accept')) -> socket:
     """Make a socket patchable: Create a :class:`.PatchableSocket` object if any functions in ``funcs`` are not
     patchable. This function is not thread-safe even if ``s`` is returned. Please ensure that no other threads are
     operating on ``s`` during the execution of this function.
 
+    :class:`ssl.SSLSocket` objects are always patchable and returned as is. Simulation functions shape them in terms of
+    the TLS records that they write to the wire.
+
     :param s: The socket to be made patchable.
     :param funcs: Create a :class:`.PatchableSocket` object if any functions in it are not patchable. ``':sending'``
-        means ``'send'`` and ``'sendall'``, and may include any additional sending methods in the future.
+        means ``'send'``, ``'sendall'``, ``'sendto'`` and ``'sendmsg'``, and may include any additional sending methods
+        in the future.
+
+    .. versionchanged:: 0.3
+       ``':sending'`` includes ``'sendto'`` and ``'sendmsg'``.
     """
 
     for func in funcs:
         if func == ':sending':
-            fs: Iterable[str] = ('send', 'sendall')
+            fs: Iterable[str] = ('send', 'sendall', 'sendto', 'sendmsg')
         else:
             fs = (func,)
 
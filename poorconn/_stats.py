@@ -0,0 +1,59 @@
+# Copyright (C) 2021  Hong Xu <hong@topbug.net>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from __future__ import annotations
+
+import math
+from typing import Dict, Iterable, Sequence
+
+
+def percentile(samples: Sequence[float], q: float) -> float:
+    """Get the ``q``-th percentile of ``samples``, interpolated linearly between the closest ranks, as
+    :func:`numpy.percentile` does by default.
+
+    :param samples: The samples, which need not be sorted.
+    :param q: The percentile, between 0 and 100.
+    :raises ValueError: ``samples`` is empty, or ``q`` is out of range.
+
+    .. versionadded:: 0.3
+    """
+
+    if not samples:
+        raise ValueError('Percentiles of no samples are undefined')
+    if not 0 <= q <= 100:
+        raise ValueError(f'Percentile {q} is not between 0 and 100')
+    ordered = sorted(samples)
+    rank = (len(ordered) - 1) * q / 100
+    low, high = math.floor(rank), math.ceil(rank)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def summarize(samples: Sequence[float], percentiles: Iterable[float] = (50, 95, 99)) -> Dict[str, float]:
+    """Summarize ``samples``, such as latencies.
+
+    :param samples: The samples.
+    :param percentiles: The percentiles to include.
+    :return: A JSON-serializable dictionary with the minimum (``min``), the mean (``mean``), the maximum (``max``), and
+        the percentiles (``p50``, ``p95``, etc.) of ``samples``.
+    :raises ValueError: ``samples`` is empty.
+
+    .. versionadded:: 0.3
+    """
+
+    if not samples:
+        raise ValueError('Summaries of no samples are undefined')
+    summary = {'min': min(samples), 'mean': sum(samples) / len(samples), 'max': max(samples)}
+    summary.update((f'p{q:g}', percentile(samples, q)) for q in percentiles)
+    return summary
@@ -0,0 +1,169 @@
+# Copyright (C) 2021  Hong Xu <hong@topbug.net>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+from __future__ import annotations
+
+import math
+from socket import socket
+from typing import Any, Sequence, Tuple
+
+from ._clock import Clock
+from ._controller import Controller
+from ._wrappers import wrap, wrap_accept
+
+MAX_TLS_RECORD_PLAINTEXT_LENGTH: int = 16384
+"Maximum number of bytes of plaintext in a TLS record."
+
+
+def tls_record_overhead(s: socket) -> int:
+    """Get the number of bytes that a TLS record adds to the plaintext that it carries.
+
+    :param s: An :class:`ssl.SSLSocket` object.
+    :return: The overhead of the header, the content type (TLS 1.3 only), the explicit nonce (TLS 1.2 only) and the
+        authentication tag of AEAD ciphers, which are used by practically all connections.
+    """
+
+    if s.version() == 'TLSv1.3':  # type: ignore[attr-defined]
+        return 5 + 1 + 16
+    else:  # TLS 1.2 or handshake not done yet
+        return 5 + 8 + 16
+
+
+def tls_plaintext_length(s: socket, length: int) -> int:
+    """Get the number of bytes of plaintext that ``s`` turns into ``length`` bytes of TLS records on the wire.
+
+    :param s: An :class:`ssl.SSLSocket` object.
+    :param length: Number of bytes on the wire.
+    :return: Number of bytes of plaintext, at least 1.
+    """
+
+    overhead = tls_record_overhead(s)
+    num_records = math.ceil(length / (MAX_TLS_RECORD_PLAINTEXT_LENGTH + overhead))
+    return max(1, length - num_records * overhead)
+
+
+class DelayTLSHandshakeController(Controller):
+    """Controller for :func:`.delay_tls_handshake`. Objects are always created and returned by
+    :func:`.delay_tls_handshake` and should not be created outside the :mod:`poorconn` package.
+
+    :param s: Same as ``s`` in :func:`delay_tls_handshake`.
+    :param t: Same as ``t`` in :func:`delay_tls_handshake`.
+
+    .. versionadded:: 0.3
+    """
+
+    __slots__ = (
+        't',
+        '_socket',
+        '_do_handshake_on_connect',
+    )
+
+    def __init__(self, s: socket, t: float):
+        super().__init__()
+        self.t: float = t
+        """Same as ``t`` in :func:`delay_tls_handshake`. Updating it in the controller affects ``s`` in
+        :func:`delay_tls_handshake`."""
+        self._socket = s
+        self._do_handshake_on_connect: bool = s.do_handshake_on_connect  # type: ignore[attr-defined]
+
+    def remove(self) -> None:
+        self._socket.do_handshake_on_connect = self._do_handshake_on_connect  # type: ignore[attr-defined]
+        super().remove()
+
+    remove.__doc__ = Controller.remove.__doc__
+
+    def _delay_handshake(self, s: socket, upon_io: bool = False) -> None:
+        """Delay the first call to ``s.do_handshake()``.
+
+        :param upon_io: Whether to do the delayed handshake upon the first reading or writing if
+            ``s.do_handshake()`` has not been called, for connection sockets whose handshakes would have been done upon
+            acceptance.
+        """
+
+        child = _DelayTLSHandshakeOnceController(self._clock.timeline())
+
+        def before(*args: Any, **kwargs: Any) -> None:
+            if child._first_time:
+                child._first_time = False
+                child._clock.sleep(self.t)
+
+        child._wrappings.append(wrap(s, meth='do_handshake', before=before))
+        if upon_io:
+            def before_io(s: socket, *args: Any, **kwargs: Any) -> None:
+                if child._first_time:
+                    s.do_handshake()  # type: ignore[attr-defined]
+
+            child._wrappings.extend(wrap(s, meth=meth, before=before_io) for meth in _IO_METHODS)
+        self._children.add(child)
+
+
+_IO_METHODS: Tuple[str, ...] = ('recv', 'recv_into', 'read', 'send', 'sendall', 'write')
+"Methods of :class:`ssl.SSLSocket` that read or write, which do the handshake implicitly if it has not been done."
+
+
+class _DelayTLSHandshakeOnceController(Controller):
+    "Controller of a socket whose first handshake is delayed by :func:`.delay_tls_handshake`."
+
+    __slots__ = (
+        '_first_time',
+    )
+
+    def __init__(self, clock: Clock) -> None:
+        super().__init__(clock)
+        self._first_time = True
+
+
+def delay_tls_handshake(s: socket, t: float) -> DelayTLSHandshakeController:
+    """Delay ``t`` seconds before the TLS handshake of ``s``, or, if ``s`` is a listening server socket, before the TLS
+    handshakes of all connections returned by ``s.accept()``. Like a server or a client on a high-latency network, the
+    peer waits ``t`` seconds longer for the handshake to complete.
+
+    If ``s`` is a connection socket, this function achieves the results by patching ``s``'s member method
+    :meth:`~ssl.SSLSocket.do_handshake`. Therefore, it has no effect if ``s`` is a client socket that has been connected
+    with ``do_handshake_on_connect=True``, because the handshake has been done. Wrap the socket before connecting it,
+    or pass ``do_handshake_on_connect=False`` to :meth:`ssl.SSLContext.wrap_socket`. :func:`poorconn.install` delays
+    handshakes of sockets that it shapes automatically.
+
+    If ``s`` is a listening socket, this function achieves the results by patching ``s``'s member method
+    :meth:`~ssl.SSLSocket.accept`, which patches :meth:`~ssl.SSLSocket.do_handshake` of the connection sockets. If
+    ``s.do_handshake_on_connect`` is True, the handshakes are not done upon acceptance, but upon the first reading or
+    writing of the connection sockets after the delay, so that ``s`` keeps accepting connections while their handshakes
+    are delayed.
+
+    :param s: The :class:`ssl.SSLSocket` object whose handshake is to be delayed.
+    :param t: Number of seconds to delay.
+
+    :return: A :class:`DelayTLSHandshakeController` object that controls the patched socket object.
+
+    .. versionadded:: 0.3
+    """
+
+    controller = DelayTLSHandshakeController(s, t=t)
+    controller._delay_handshake(s)
+
+    if s.server_side:  # type: ignore[attr-defined]
+        # Handshakes of connection sockets are delayed by the connection sockets instead, so accept() does not wait.
+        s.do_handshake_on_connect = False  # type: ignore[attr-defined]
+
+        def after(s: socket, *, original: Sequence, before: Any) -> Any:
+            conn_sock = original[0]
+            controller._delay_handshake(conn_sock, upon_io=controller._do_handshake_on_connect)
+            conn_sock.do_handshake_on_connect = controller._do_handshake_on_connect
+            return original
+
+        controller._wrappings.append(wrap_accept(s, after=after))
+
+    return controller
@@ -0,0 +1,371 @@
+# Copyright (C) 2021  Hong Xu <hong@topbug.net>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from __future__ import annotations
+
+import abc
+from collections import deque
+import errno
+import select
+import socket as _socket_module
+from socket import socket, SHUT_RD, SHUT_RDWR, SHUT_WR, SOCK_STREAM
+import threading
+from typing import Any, Callable, cast, Deque, Iterable, List, Optional, Tuple
+
+from ._clock import Clock
+from ._controller import Controller
+from ._link import SimulatedSocket
+from ._send import head_of_buffers, wrap_sending_upon_acceptance
+from ._socket import is_tls_socket
+from ._wrappers import replace
+
+
+class DelayLineController(Controller, metaclass=abc.ABCMeta):
+    """Base class of the controllers of simulations that put sent data into a delay line, which releases the data to the
+    operating system from a background thread. Objects are always created by simulation functions and should not be
+    created outside the :mod:`poorconn` package.
+
+    :param s: The socket object whose sent data is put into the delay line.
+    :param clock: Same as ``clock`` in :class:`.Controller`.
+
+    .. versionadded:: 0.3
+    """
+
+    __slots__ = (
+        'in_flight',
+        '_socket',
+        '_send',
+        '_queue',
+        '_condition',
+        '_pumping',
+        '_error',
+        '_deferred',
+    )
+
+    def __init__(self, s: socket, clock: Optional[Clock] = None):
+        super().__init__(clock)
+        self.in_flight: int = 0
+        "Number of bytes that have been sent by the caller but not yet released to the operating system."
+        self._socket = s
+        # The send method that the delay line releases data with
+        self._send = s.send
+        # Entries are (release time, data)
+        self._queue: Deque[Tuple[float, bytes]] = deque()
+        self._condition = threading.Condition()
+        self._pumping = False
+        # The error that the delay line encountered when releasing data, which is raised to the caller
+        self._error: Optional[OSError] = None
+        # Functions that the pump thread calls once the delay line is empty, such as closing the socket
+        self._deferred: List[Callable[[], None]] = []
+
+    @abc.abstractmethod
+    def _admit(self, size: int, now: float) -> Tuple[int, Optional[float]]:
+        """Decide how many of ``size`` bytes may enter the delay line at time ``now``. Called with the condition of the
+        delay line held.
+
+        :return: ``(n, release_time)`` if ``n > 0`` bytes may enter the delay line and are to be released at
+            ``release_time``; otherwise, ``(0, t)``, where ``t`` is the number of seconds after which to try again, or
+            ``None`` to try again once data has been released.
+        """
+
+    def _accept(self, buffers: Iterable[Any]) -> int:
+        """Put as much of ``buffers`` into the delay line as it admits. If it admits nothing, wait for it to have room,
+        subject to the timeout of the socket.
+
+        :return: Number of bytes that have been put into the delay line.
+        """
+
+        buffers = list(buffers)
+        size = sum(memoryview(buffer).nbytes for buffer in buffers)
+        if size == 0:
+            return 0
+        clock = self._clock
+        timeout = self._socket.gettimeout()
+        deadline = None if timeout is None else clock.monotonic() + timeout
+        with self._condition:
+            while True:
+                if self._error is not None:
+                    raise self._error
+                now = clock.monotonic()
+                admitted, when = self._admit(size, now)
+                if admitted > 0:
+                    break
+                remaining = None if deadline is None else deadline - now
+                if remaining is not None and remaining <= 0:
+                    if timeout == 0:
+                        raise BlockingIOError(errno.EAGAIN, 'The delay line is full')
+                    raise _socket_module.timeout('timed out')
+                if when is None:  # Released data is signaled by the pump thread
+                    self._condition.wait(remaining)
+                    continue
+                # Releasing data does not change the decision, so do not try again until the given time
+                retry_time = now + when if remaining is None else now + min(when, remaining)
+                while self._error is None and clock.monotonic() < retry_time:
+                    clock.wait(self._condition, retry_time - clock.monotonic())
+
+            data = b''.join(head_of_buffers(buffers, admitted))
+            self._queue.append((cast(float, when), data))
+            self.in_flight += len(data)
+            if not self._pumping:  # The pump thread exits whenever the delay line is empty
+                self._pumping = True
+                threading.Thread(target=self._pump, name='Poorconn delay line', daemon=True).start()
+            return len(data)
+
+    def _pump(self) -> None:
+        "Release data in the delay line to the operating system when it is due."
+
+        clock = self._clock
+        while True:
+            with self._condition:
+                while True:
+                    if not self._queue:
+                        self._stop_pumping()
+                        return
+                    delay = self._queue[0][0] - clock.monotonic()
+                    if delay <= 0:
+                        break
+                    clock.wait(self._condition, delay)
+                data = self._queue[0][1]
+
+            try:
+                self._release(data)
+            except OSError as e:
+                with self._condition:
+                    self._error = e
+                    self._queue.clear()
+                    self.in_flight = 0
+                    self._stop_pumping()
+                return
+
+            with self._condition:
+                self._queue.popleft()
+                self.in_flight -= len(data)
+                self._condition.notify_all()
+
+    def _stop_pumping(self) -> None:
+        "Mark the pump thread as exited and call the deferred functions. Called with the condition held."
+
+        self._pumping = False
+        self._condition.notify_all()
+        deferred, self._deferred = self._deferred, []
+        for function in deferred:
+            try:
+                function()
+            except OSError:  # There is no caller to report to, such as when the connection has been reset
+                pass
+
+    def _release(self, data: bytes) -> None:
+        "Send all of ``data``, even if the socket is non-blocking or has a timeout."
+
+        view = memoryview(data)
+        while view:
+            try:
+                view = view[self._send(view):]
+            except (BlockingIOError, _socket_module.timeout):
+                if isinstance(self._socket, SimulatedSocket):  # It has no file descriptor
+                    self._socket._wait_writable()
+                else:
+                    select.select((), (self._socket,), ())
+
+    def _drain(self, timeout: Optional[float] = None) -> None:
+        """Wait until all data in the delay line has been released.
+
+        :param timeout: Maximum number of seconds to wait, or ``None`` to wait indefinitely.
+        :raises BlockingIOError: ``timeout`` is 0 and the delay line is not empty.
+        :raises socket.timeout: The delay line is not empty after ``timeout`` seconds.
+        """
+
+        with self._condition:
+            if not self._condition.wait_for(lambda: not self._queue, timeout):
+                if timeout == 0:
+                    raise BlockingIOError(errno.EAGAIN, 'The delay line is not empty')
+                raise _socket_module.timeout('timed out')
+
+    def _after_drain(self, function: Callable[[], None], error: OSError) -> None:
+        """Call ``function`` once all data in the delay line has been released, without waiting for it: If the delay
+        line is not empty, the pump thread calls ``function`` after releasing the data, and sending raises ``error``
+        in the meantime, just like the operating system sends the remaining data of a closed socket in the
+        background."""
+
+        with self._condition:
+            if self._pumping:
+                self._deferred.append(function)
+                if self._error is None:
+                    self._error = error
+                return
+        function()
+
+    def remove(self) -> None:
+        """Same as :meth:`.Controller.remove`, except that it first waits until all data in the delay line has been
+        released, so that data sent afterwards does not overtake it."""
+
+        self._drain()
+        super().remove()
+
+
+class DelayInTransitController(DelayLineController):
+    """Controller for :func:`.delay_in_transit`. Objects are always created and returned by :func:`.delay_in_transit`
+    and should not be created outside the :mod:`poorconn` package.
+
+    :param s: Same as ``s`` in :func:`delay_in_transit`.
+    :param t: Same as ``t`` in :func:`delay_in_transit`.
+    :param window: Same as ``window`` in :func:`delay_in_transit`.
+
+    .. versionadded:: 0.3
+    """
+
+    __slots__ = (
+        't',
+        'window',
+    )
+
+    def __init__(self, s: socket, t: float, window: int):
+        super().__init__(s)
+        self.t: float = t
+        """Same as ``t`` in :func:`delay_in_transit`. Updating it in the controller affects data that is sent
+        afterwards."""
+        self.window: int = window
+        """Same as ``window`` in :func:`delay_in_transit`. Updating it in the controller affects ``s`` in
+        :func:`delay_in_transit`."""
+
+    def _admit(self, size: int, now: float) -> Tuple[int, Optional[float]]:
+        available = self.window - self.in_flight
+        return (min(size, available), now + self.t) if available > 0 else (0, None)
+
+
+def patch_delay_line(s: socket, controller: DelayLineController) -> None:
+    """Patch the sending methods of ``s``, as well as :meth:`~socket.socket.shutdown` and :meth:`~socket.socket.close`,
+    so that sent data is put into the delay line of ``controller``. See :func:`delay_in_transit` for details.
+
+    :raises ValueError: ``s`` is not a stream socket or is an :class:`ssl.SSLSocket` object.
+    """
+
+    if s.type != SOCK_STREAM or is_tls_socket(s):
+        raise ValueError('A delay line requires a stream socket that is not an SSLSocket')
+
+    original_sendmsg = getattr(s, 'sendmsg', None)
+    original_shutdown = s.shutdown
+    original_close = s.close
+
+    def send(self: socket, data: Any, flags: int = 0) -> int:
+        return controller._accept((data,))
+
+    def sendall(self: socket, data: Any, flags: int = 0) -> None:
+        view = memoryview(data).cast('B')
+        while view:
+            view = view[controller._accept((view,)):]
+
+    def sendmsg(self: socket, buffers: Iterable[Any], ancdata: Iterable[Any] = (), flags: int = 0,
+                address: Any = None) -> int:
+        if ancdata or address is not None:
+            controller._drain(self.gettimeout())
+            return original_sendmsg(buffers, ancdata, flags, address)  # type: ignore[misc]
+        return controller._accept(buffers)
+
+    def shutdown(self: socket, how: int) -> None:
+        if how == SHUT_RD:
+            original_shutdown(how)
+            return
+        if how == SHUT_RDWR:
+            original_shutdown(SHUT_RD)
+        controller._after_drain(lambda: original_shutdown(SHUT_WR),
+                                BrokenPipeError(errno.EPIPE, 'The socket has been shut down for writing'))
+
+    def close(self: socket) -> None:
+        controller._after_drain(original_close, OSError(errno.EBADF, 'The socket has been closed'))
+
+    controller._wrappings.append(replace(s, meth='send', function=send))
+    controller._wrappings.append(replace(s, meth='sendall', function=sendall))
+    if original_sendmsg is not None:
+        controller._wrappings.append(replace(s, meth='sendmsg', function=sendmsg))
+    controller._wrappings.append(replace(s, meth='shutdown', function=shutdown))
+    controller._wrappings.append(replace(s, meth='close', function=close))
+
+
+def delay_in_transit(s: socket, t: float, window: int = 1 << 20) -> DelayInTransitController:
+    """Delay data sent by ``s`` by ``t`` seconds in transit, like a link with a one-way latency of ``t`` seconds. Unlike
+    :func:`delay_before_sending`, the sender is not blocked: Sent data is put into a delay line and released to the
+    operating system ``t`` seconds later by a background thread, while the sender keeps sending until ``window`` bytes
+    are in flight. Therefore, latency does not limit throughput as long as ``window`` is larger than the
+    bandwidth-delay product, and throughput can be limited independently by stacking :func:`delay_before_sending` on
+    top.
+
+    This function achieves the results by patching ``s``'s member methods :meth:`~socket.socket.send`,
+    :meth:`~socket.socket.sendall` and :meth:`~socket.socket.sendmsg`. If the window is full, these methods wait
+    according to the timeout of ``s``, and raise :class:`BlockingIOError` if ``s`` is non-blocking. Ancillary data
+    passed to :meth:`~socket.socket.sendmsg` is sent after the delay line has been drained, which waits according to the
+    timeout of ``s``. :meth:`~socket.socket.close` and :meth:`~socket.socket.shutdown` are also patched so that no data
+    is lost: They return immediately, and the background thread closes ``s`` or shuts it down for writing after it has
+    released the remaining data, just like the operating system sends the remaining data of a closed socket in the
+    background. ``s``'s :meth:`~socket.socket.sendfile` method is not patched due to its inconsistent behavior across
+    operating systems.
+
+    :param s: The stream :class:`socket.socket` object whose data is to be delayed in transit.
+    :param t: Number of seconds to delay.
+    :param window: Maximum number of bytes in flight, i.e., sent by the caller but not yet released.
+
+    :return: A :class:`DelayInTransitController` object that controls the patched socket object. Removing it waits until
+        all data in the delay line has been released.
+    :raises ValueError: ``s`` is not a stream socket or is an :class:`ssl.SSLSocket` object, whose TLS connection
+        cannot be written to from a background thread safely.
+
+    .. versionadded:: 0.3
+    """
+
+    controller = DelayInTransitController(s, t=t, window=window)
+    patch_delay_line(s, controller)
+    return controller
+
+
+class DelayInTransitUponAcceptanceController(Controller):
+    """Controller for :func:`.delay_in_transit_upon_acceptance`. Objects are always created and returned by
+    :func:`.delay_in_transit_upon_acceptance` and should not be created outside the :mod:`poorconn` package.
+
+    :param t: Same as ``t`` in :func:`delay_in_transit_upon_acceptance`.
+    :param window: Same as ``window`` in :func:`delay_in_transit_upon_acceptance`.
+
+    .. versionadded:: 0.3
+    """
+
+    __slots__ = (
+        't',
+        'window',
+    )
+
+    def __init__(self, t: float, window: int):
+        super().__init__()
+        self.t: float = t
+        """Same as ``t`` in :func:`delay_in_transit_upon_acceptance`. Updating it in the controller affects sockets that
+        are accepted afterwards."""
+        self.window: int = window
+        """Same as ``window`` in :func:`delay_in_transit_upon_acceptance`. Updating it in the controller affects sockets
+        that are accepted afterwards."""
+
+
+def delay_in_transit_upon_acceptance(s: socket, t: float,
+                                     window: int = 1 << 20) -> DelayInTransitUponAcceptanceController:
+    """For every socket object returned by ``s.accept()``, delay sent data by ``t`` seconds in transit. Parameters mean
+    the same as :func:`.delay_in_transit`.
+
+    :return: A :class:`DelayInTransitUponAcceptanceController` object that controls the patched socket object.
+
+    .. versionadded:: 0.3
+    """
+
+    controller = DelayInTransitUponAcceptanceController(t=t, window=window)
+    wrap_sending_upon_acceptance(s, delay_in_transit, param_func=lambda: ((), {'t': controller.t,
+                                                                               'window': controller.window}),
+                                 controller=controller)
+    return controller
@@ -0,0 +1,243 @@
+# Copyright (C) 2021  Hong Xu <hong@topbug.net>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Serving with multiple worker processes, which share the parameters of their simulations in shared memory, so that
+one update applies to all of them, and report counters that are merged by the parent process."""
+
+from __future__ import annotations
+
+import json
+import math
+import multiprocessing
+import os
+import signal
+from socketserver import StreamRequestHandler, ThreadingTCPServer
+import threading
+from typing import Any, Callable, Dict, List, Mapping, Optional, Sequence, Tuple
+
+from ._controller import Controller
+
+_POLL_INTERVAL: float = 0.05
+"Number of seconds between synchronizations of a worker process with the shared memory."
+
+
+class SharedParameters:
+    """Numeric parameters of simulations, such as ``t`` and ``length``, in shared memory. Updates by any process, e.g.,
+    through :class:`ControlServer`, are applied to the controllers of all worker processes by
+    :func:`synchronize_controllers`. ``None`` is stored as NaN.
+
+    :param values: The initial values of the parameters.
+    :param types: The type of each parameter, such as :class:`int` and :class:`float`.
+    """
+
+    __slots__ = (
+        'types',
+        '_names',
+        '_values',
+        '_version',
+    )
+
+    def __init__(self, values: Mapping[str, Optional[float]], types: Mapping[str, Callable[[Any], Any]]):
+        super().__init__()
+        self.types: Dict[str, Callable[[Any], Any]] = dict(types)
+        "Same as ``types`` in :class:`SharedParameters`."
+        self._names = tuple(values)
+        self._values = multiprocessing.Array('d', [math.nan if v is None else float(v) for v in values.values()])
+        self._version = multiprocessing.Value('Q', 0)
+
+    @property
+    def version(self) -> int:
+        "Number of updates so far, which tells worker processes whether they need to synchronize."
+        return self._version.value  # type: ignore[no-any-return]
+
+    def get(self) -> Dict[str, Any]:
+        "Get the values of all parameters."
+
+        with self._values.get_lock():
+            values: List[float] = self._values[:]
+        return {name: None if math.isnan(value) else self.types[name](value)
+                for name, value in zip(self._names, values)}
+
+    def update(self, values: Mapping[str, Optional[float]]) -> None:
+        """Update parameters.
+
+        :param values: The new values of the parameters to update.
+        :raises KeyError: A parameter does not exist.
+        """
+
+        unknown = [name for name in values if name not in self._names]
+        if unknown:
+            raise KeyError(f'Unknown parameters: {", ".join(unknown)}')
+        with self._values.get_lock():
+            for name, value in values.items():
+                self._values[self._names.index(name)] = math.nan if value is None else float(value)
+            with self._version.get_lock():
+                self._version.value += 1
+
+
+class Counters:
+    """Counters of worker processes in shared memory, such as the number of responses, each of which is written by its
+    worker process and merged by the parent process.
+
+    :param names: Names of the counters.
+    :param workers: Number of worker processes.
+    """
+
+    __slots__ = (
+        'names',
+        'workers',
+        '_values',
+    )
+
+    def __init__(self, names: Sequence[str], workers: int):
+        super().__init__()
+        self.names: Tuple[str, ...] = tuple(names)
+        "Same as ``names`` in :class:`Counters`."
+        self.workers: int = workers
+        "Same as ``workers`` in :class:`Counters`."
+        # Each worker process writes only its own slots, hence no lock is needed
+        self._values = multiprocessing.RawArray('q', len(self.names) * workers)
+
+    def set(self, worker: int, values: Mapping[str, int]) -> None:
+        "Set the counters of worker process ``worker``."
+        for name, value in values.items():
+            self._values[worker * len(self.names) + self.names.index(name)] = value
+
+    def per_worker(self) -> List[Dict[str, int]]:
+        "Get the counters of every worker process."
+        return [dict(zip(self.names, self._values[i * len(self.names):(i + 1) * len(self.names)]))
+                for i in range(self.workers)]
+
+    def merged(self) -> Dict[str, int]:
+        "Get the sums of the counters of all worker processes."
+        per_worker = self.per_worker()
+        return {name: sum(counters[name] for counters in per_worker) for name in self.names}
+
+
+def synchronize_controllers(parameters: SharedParameters, controllers: Sequence[Controller], counters: Counters,
+                            worker: int, count: Callable[[], Mapping[str, int]],
+                            stopped: threading.Event) -> threading.Thread:
+    """Start a thread that, until ``stopped`` is set, applies updates of ``parameters`` to the attributes of the same
+    names of ``controllers``, and writes the counters returned by ``count`` to ``counters``.
+
+    :param parameters: The shared parameters.
+    :param controllers: The controllers of the simulations of the current process.
+    :param counters: The shared counters.
+    :param worker: Index of the current process in ``counters``.
+    :param count: A function that returns the counters of the current process.
+    :param stopped: The event that stops the thread.
+    :return: The started thread.
+    """
+
+    def work() -> None:
+        version = parameters.version
+        while True:
+            if parameters.version != version:
+                version = parameters.version
+                for name, value in parameters.get().items():
+                    for controller in controllers:
+                        if hasattr(controller, name):
+                            setattr(controller, name, value)
+            counters.set(worker, count())
+            if stopped.wait(_POLL_INTERVAL):
+                counters.set(worker, count())
+                return
+
+    thread = threading.Thread(target=work, name='Poorconn worker synchronization', daemon=True)
+    thread.start()
+    return thread
+
+
+class _ControlRequestHandler(StreamRequestHandler):
+    """Handles commands, one per line, each of which is answered with a line of JSON:
+
+    - ``get``: Get the parameters.
+    - ``set <name>=<value> ...``: Update parameters. ``none`` stands for ``None``.
+    - ``stats``: Get the merged counters (``total``) and the counters of every worker process (``workers``).
+    """
+
+    server: ControlServer
+
+    def handle(self) -> None:
+        for line in self.rfile:
+            words = line.decode(errors='replace').split()
+            if not words:  # Blank lines are not commands
+                continue
+            command, *operands = words
+            response: Any
+            try:
+                if command == 'get':
+                    response = self.server.parameters.get()
+                elif command == 'set':
+                    values = {}
+                    for operand in operands:
+                        name, _, value = operand.partition('=')
+                        if name not in self.server.parameters.types:
+                            raise KeyError(f'Unknown parameter {name!r}')
+                        values[name] = None if value.lower() == 'none' else self.server.parameters.types[name](value)
+                    self.server.parameters.update(values)
+                    response = self.server.parameters.get()
+                elif command == 'stats':
+                    response = {'total': self.server.counters.merged(), 'workers': self.server.counters.per_worker()}
+                else:
+                    raise ValueError(f'Unknown command {command!r}')
+            except (KeyError, ValueError) as e:
+                response = {'error': str(e.args[0]) if e.args else str(e)}
+            self.wfile.write(json.dumps(response).encode() + b'\n')
+
+
+class ControlServer(ThreadingTCPServer):
+    """A TCP server that controls worker processes with commands in lines: ``get`` and ``set <name>=<value> ...`` get
+    and update the shared parameters, and ``stats`` gets the counters. Each command is answered with a line of JSON.
+
+    :param address: The address to listen on.
+    :param parameters: The shared parameters.
+    :param counters: The shared counters.
+    """
+
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], parameters: SharedParameters, counters: Counters):
+        super().__init__(address, _ControlRequestHandler)
+        self.parameters: SharedParameters = parameters
+        "Same as ``parameters`` in :class:`ControlServer`."
+        self.counters: Counters = counters
+        "Same as ``counters`` in :class:`ControlServer`."
+
+
+def run_workers(processes: int, target: Callable[[int], None]) -> List[Optional[int]]:
+    """Run ``target(i)`` in worker processes ``i = 0, 1, ..., processes - 1``, and wait for them to exit. Upon
+    :class:`KeyboardInterrupt`, interrupt the worker processes and wait for them to exit.
+
+    :param processes: Number of worker processes.
+    :param target: The function to run, which must be picklable.
+    :return: The exit codes of the worker processes.
+    """
+
+    workers = [multiprocessing.Process(target=target, args=(i,), name=f'Poorconn worker {i}', daemon=True)
+               for i in range(processes)]
+    for worker in workers:
+        worker.start()
+    try:
+        for worker in workers:
+            worker.join()
+    except KeyboardInterrupt:
+        for worker in workers:
+            if worker.pid is not None and worker.is_alive():
+                os.kill(worker.pid, signal.SIGINT)
+        for worker in workers:
+            worker.join()
+    return [worker.exitcode for worker in workers]
@@ -16,15 +16,100 @@
 from __future__ import annotations
 
 from socket import socket
+import threading
 from types import MethodType
-from typing import Any, Callable, Optional
+from typing import Any, Callable, Optional, Tuple
+
+from ._socket import is_tls_socket
+
+
+_wrapping_thread_lock: threading.Lock = threading.Lock()
+
+
+class Wrapping:
+    """A record of a socket member method that has been wrapped or replaced. Objects are always created and returned by
+    :func:`.replace` and should not be created elsewhere.
+
+    :param s: The socket object.
+    :param meth: Name of the method.
+    """
+
+    __slots__ = (
+        'meth',
+        'active',
+        'original',
+        '_socket',
+        '_shadowing',
+    )
+
+    def __init__(self, s: socket, meth: str):
+        super().__init__()
+        self.meth: str = meth
+        "Name of the wrapped method."
+        self.active: bool = True
+        "Whether the wrapping is in effect. An inactive wrapping passes all calls to :attr:`original` directly."
+        self.original: Callable[..., Any] = getattr(s, meth)
+        "The method that has been wrapped."
+        # The socket is kept alive by the bound method in original anyway
+        self._socket: socket = s
+        # Whether the original method is an attribute of the object, as opposed to a method of the class
+        self._shadowing: bool = meth in getattr(s, '__dict__', {})
+
+    def remove(self) -> None:
+        """Remove the wrapping. If the wrapping is the outermost one, the method that it wraps is restored in place.
+        Otherwise, it becomes a pass-through to the method that it wraps and is removed when all wrappings stacked on
+        top of it are removed. Either way, calls that are made after this function returns are no longer affected by the
+        wrapping."""
+
+        self.active = False
+        s = self._socket
+        with _wrapping_thread_lock:
+            # Peel off all inactive wrappings from the outermost one
+            wrapping = _get_wrapping(getattr(s, self.meth))
+            while wrapping is not None and not wrapping.active:
+                if wrapping._shadowing:
+                    setattr(s, self.meth, wrapping.original)
+                else:
+                    delattr(s, self.meth)  # Expose the method of the class again
+                wrapping = _get_wrapping(getattr(s, self.meth))
+
+
+def _get_wrapping(meth: Any) -> Optional[Wrapping]:
+    "Get the :class:`.Wrapping` object of a method that is installed by :func:`.replace`, or None if there isn't any."
+    return getattr(getattr(meth, '__func__', None), '_poorconn_wrapping', None)
+
+
+def replace(s: socket, *, meth: str, function: Callable[..., Any]) -> Wrapping:
+    """Replace a socket member method named ``meth`` with ``function``.
+
+    :param s: The socket object.
+    :param meth: Name of the method to be replaced.
+    :param function: The function that replaces the method. The socket object will be passed in as the first parameter,
+        followed by the arguments passed in by the caller. The replaced method can be accessed as
+        :attr:`Wrapping.original` of the returned object.
+    :return: A :class:`.Wrapping` object that can be used to remove the replacement.
+    """
+
+    wrapping = Wrapping(s, meth)
+    original = wrapping.original
+
+    def wrapping_function(self: socket, *args: Any, **kwargs: Any) -> Any:
+        if wrapping.active:
+            return function(self, *args, **kwargs)
+        else:
+            return original(*args, **kwargs)
+
+    setattr(wrapping_function, '_poorconn_wrapping', wrapping)
+    setattr(s, meth, MethodType(wrapping_function, s))
+
+    return wrapping
 
 
 def wrap(s: socket, *,
          meth: str,
          before: Optional[Callable[..., Any]] = None,
          before_pass: bool = False,
-         after: Optional[Callable[..., Any]] = None) -> None:
+         after: Optional[Callable[..., Any]] = None) -> Wrapping:
     """Wrap a socket member method named ``meth``.
 
     :param s: The socket object.
@@ -38,6 +123,7 @@ def wrap(s: socket, *,
         first parameter. It must accept a ``wrapped`` keyword argument, to which the return value of the wrapped
         :func:`socket.socket.accept` will be passed. It must accept a ``before`` keyword argument, to which the return
         value of the ``before`` function will be pass.
+    :return: A :class:`.Wrapping` object that can be used to remove the wrapping.
     """
 
     wrapped_meth = getattr(s, meth)
@@ -50,24 +136,36 @@ def wrap(s: socket, *,
             ret_wrapped = wrapped_meth(*args, **kwargs)
         return after(self, original=ret_wrapped, before=ret_before) if after is not None else ret_wrapped
 
-    setattr(s, meth, MethodType(wrapping_function, s))
+    return replace(s, meth=meth, function=wrapping_function)
 
 
 def wrap_accept(s: socket, *,
                 before: Optional[Callable[..., Any]] = None,
-                after: Optional[Callable[..., Any]] = None) -> None:
+                after: Optional[Callable[..., Any]] = None) -> Wrapping:
     "Wrap :meth:`socket.socket.accept`. This function calls :func:`.wrap` with ``meth='accept'``."
 
-    wrap(s, meth='accept', before=before, after=after)
+    return wrap(s, meth='accept', before=before, after=after)
 
 
 def wrap_send(s: socket, *,
               before: Optional[Callable[..., Any]] = None,
               after: Optional[Callable[..., Any]] = None,
-              before_pass: bool = False) -> None:
-    """Wrap :meth:`socket.socket.send`, :meth:`socket.socket.sendall`. This function calls :func:`.wrap` twice with
-    ``meth='send'`` and ``meth='sendall'``.
+              before_pass: bool = False) -> Tuple[Wrapping, ...]:
+    """Wrap :meth:`socket.socket.send`, :meth:`socket.socket.sendall` and :meth:`socket.socket.sendmsg`. This function
+    calls :func:`.wrap` with ``meth='send'``, ``meth='sendall'`` and ``meth='sendmsg'``.
+    :meth:`socket.socket.sendmsg` is not wrapped on platforms where it is unavailable.
+
+    If ``s`` is an :class:`ssl.SSLSocket` object, only ``send`` is wrapped, because :meth:`ssl.SSLSocket.sendall` calls
+    :meth:`~ssl.SSLSocket.send` repeatedly, each of which writes TLS records to the wire, and
+    :meth:`ssl.SSLSocket.sendmsg` is not supported.
     """
 
-    for meth in ('send', 'sendall'):
-        wrap(s, meth=meth, before=before, after=after, before_pass=before_pass)
+    return tuple(wrap(s, meth=meth, before=before, after=after, before_pass=before_pass) for meth in sending_methods(s))
+
+
+def sending_methods(s: socket) -> Tuple[str, ...]:
+    "Get the names of the sending methods of a stream socket that simulation functions patch."
+
+    if is_tls_socket(s):
+        return ('send',)
+    return ('send', 'sendall', 'sendmsg') if hasattr(s, 'sendmsg') else ('send', 'sendall')
@@ -15,4 +15,17 @@
 
 ":mod:`pytest` plugin."
 
-from ._impl import Server, poorconn_http_server, pytest_configure
+from ._benchmark import (BenchmarkResult,
+                         poorconn_benchmark,
+                         pytest_addoption,
+                         pytest_sessionfinish,
+                         pytest_terminal_summary,
+                         THRESHOLDS)
+
+from ._impl import (_poorconn_shared_http_server,
+                    poorconn_http_server,
+                    poorconn_proxy,
+                    poorconn_shared_http_server,
+                    poorconn_tcp_server,
+                    pytest_configure,
+                    Server)
@@ -0,0 +1,222 @@
+# Copyright (C) 2021  Hong Xu <hong@topbug.net>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from __future__ import annotations
+
+from dataclasses import asdict, dataclass
+import json
+import time
+from typing import Any, Callable, Dict, Iterable, List, no_type_check, Optional
+
+import pytest
+
+from poorconn import Controller
+from poorconn import summarize
+
+THRESHOLDS = ('max_mean', 'max_p50', 'max_p95', 'max_p99', 'max_max', 'min_throughput')
+"""Thresholds that :func:`poorconn_benchmark` supports. ``max_*`` are the maximum numbers of seconds of the
+statistics of the durations of rounds, and ``min_throughput`` is the minimum number of bytes per second."""
+
+
+@dataclass(frozen=True)
+class BenchmarkResult:
+    "The result of a benchmark run by :func:`poorconn_benchmark`."
+
+    name: str
+    "Name of the benchmark, which is the node ID of the test, followed by the name passed in if any."
+    durations: List[float]
+    "Number of seconds that each round took."
+    latency: Dict[str, float]
+    "Summary of :attr:`durations`, as returned by :func:`poorconn.summarize`."
+    bytes: int
+    "Total number of bytes transferred, as returned by the benchmarked function."
+    throughput: Optional[float]
+    "Number of bytes transferred per second over all rounds, or ``None`` if no bytes were reported."
+    overshoot: Optional[Dict[str, float]]
+    """The mean (``mean``) and maximum (``max``) number of seconds by which the delays of the simulations have overslept
+    (see :class:`poorconn.Pacer`), or ``None`` if no controllers with pacers were given."""
+    failures: List[str]
+    "Descriptions of the thresholds that have been exceeded."
+
+
+def _pacers(controllers: Iterable[Controller]) -> Iterable[Any]:
+    "Find the pacers of ``controllers`` and the controllers of connection sockets created by them."
+
+    for controller in controllers:
+        pacer = getattr(controller, 'pacer', None)
+        if pacer is not None:
+            yield pacer
+        yield from _pacers(tuple(controller._children))
+
+
+_RESULT_PROPERTY = 'poorconn_benchmark'
+"Name of the user property of test reports that carries the result of a benchmark."
+
+_RECORDER_NAME = 'poorconn_benchmark_recorder'
+"Name under which :class:`_BenchmarkRecorder` is registered with the plugin manager of pytest."
+
+
+class _BenchmarkRecorder:
+    """Collects the results of benchmarks from the reports of tests. With ``pytest-xdist``, the reports, including their
+    user properties, are sent by worker processes to the controller, where the results of all workers are collected."""
+
+    def __init__(self) -> None:
+        self.results: List[BenchmarkResult] = []
+
+    # The types of the parameters are private to pytest
+    @no_type_check
+    def pytest_runtest_logreport(self, report) -> None:
+        if report.when == 'teardown':  # The last report of a test, which has all of its user properties
+            self.results.extend(BenchmarkResult(**value) for name, value in report.user_properties
+                                if name == _RESULT_PROPERTY)
+
+
+def _register_recorder(config: Any) -> None:
+    "Register :class:`_BenchmarkRecorder` with ``config``, which is called upon configuring pytest."
+    config.pluginmanager.register(_BenchmarkRecorder(), _RECORDER_NAME)
+
+
+def _benchmarks(config: Any) -> List[BenchmarkResult]:
+    "Get the results of the benchmarks that have run in the session."
+    return config.pluginmanager.get_plugin(_RECORDER_NAME).results  # type: ignore[no-any-return]
+
+
+def _is_worker(config: Any) -> bool:
+    "Whether the current process is a worker process of ``pytest-xdist``, which does not report the results."
+    return hasattr(config, 'workerinput')
+
+
+def _format(value: float, unit: str) -> str:
+    return f'{value:.4g}{unit}'
+
+
+@pytest.fixture
+def poorconn_benchmark(request: pytest.FixtureRequest) -> Callable[..., BenchmarkResult]:
+    """A :mod:`pytest` fixture: A function that benchmarks another function, typically a client that talks to a server
+    with poor network conditions, and fails the test if the results exceed thresholds. It calls the function for a
+    number of rounds, and measures the duration of every round. If the function returns an integer, it is taken as the
+    number of bytes that the round has transferred, from which the throughput is computed. The results are returned as a
+    :class:`BenchmarkResult` object, printed in the terminal summary, and written to the JSON file given by the
+    ``--poorconn-benchmark-json`` option, which are done by the controller for all worker processes with
+    ``pytest-xdist``. It accepts the following parameters:
+
+    - ``function``: The function to benchmark, which is called without arguments.
+    - ``rounds``: Number of rounds. The default is 3.
+    - ``controllers``: Controllers of the simulations involved, e.g., :attr:`Server.controller`. The precision of their
+      delays (see :class:`poorconn.Pacer`) is included in the results.
+    - ``name``: Name of the benchmark, which distinguishes benchmarks in the same test.
+    - Any of :data:`THRESHOLDS`.
+
+    The defaults of these parameters, except ``function``, can be modified by applying the
+    ``@pytest.mark.poorconn_benchmark`` marker.
+
+    Example:
+
+    .. code-block:: python
+
+       @pytest.mark.poorconn_benchmark(rounds=5, max_p95=3)
+       @pytest.mark.poorconn_http_server_config(t=0.1, length=1024)
+       def test_download(poorconn_benchmark, poorconn_http_server, tmp_path):
+           (tmp_path / 'file').write_bytes(b'a' * 10240)
+           poorconn_benchmark(lambda: len(requests.get(f'{poorconn_http_server.url}/file').content),
+                              controllers=[poorconn_http_server.controller])
+
+    .. versionadded:: 0.3
+    """
+
+    marker = request.node.get_closest_marker('poorconn_benchmark')
+    defaults = dict(marker.kwargs) if marker is not None else {}
+
+    def benchmark(function: Callable[[], Any], **kwargs: Any) -> BenchmarkResult:
+        options = {**defaults, **kwargs}
+        unknown = set(options) - {'rounds', 'controllers', 'name', *THRESHOLDS}
+        if unknown:
+            raise TypeError(f'Unknown benchmark options: {", ".join(sorted(unknown))}')
+        controllers = tuple(options.get('controllers', ()))
+
+        durations = []
+        transferred = 0
+        for _ in range(options.get('rounds', 3)):
+            starting_time = time.perf_counter()
+            value = function()
+            durations.append(time.perf_counter() - starting_time)
+            if isinstance(value, int) and not isinstance(value, bool):
+                transferred += value
+
+        latency = summarize(durations)
+        total = sum(durations)
+        throughput = transferred / total if transferred and total > 0 else None
+        pacers = tuple(_pacers(controllers))
+        waits = sum(pacer.waits for pacer in pacers)
+        overshoot = {'mean': sum(pacer.total_overshoot for pacer in pacers) / waits if waits else 0.0,
+                     'max': max((pacer.max_overshoot for pacer in pacers), default=0.0)} if pacers else None
+
+        failures = []
+        for threshold in THRESHOLDS:
+            limit = options.get(threshold)
+            if limit is None:
+                continue
+            if threshold == 'min_throughput':
+                if throughput is None or throughput < limit:
+                    failures.append(f'throughput {_format(throughput or 0, " B/s")} is below {limit} B/s')
+            elif latency[threshold[4:]] > limit:
+                failures.append(f'{threshold[4:]} {_format(latency[threshold[4:]], " s")} exceeds {limit} s')
+
+        name = request.node.nodeid + (f'[{options["name"]}]' if 'name' in options else '')
+        result = BenchmarkResult(name=name, durations=durations, latency=latency, bytes=transferred,
+                                 throughput=throughput, overshoot=overshoot, failures=failures)
+        request.node.user_properties.append((_RESULT_PROPERTY, asdict(result)))
+        if failures:
+            pytest.fail(f'Benchmark {name}: {"; ".join(failures)}')
+        return result
+
+    return benchmark
+
+
+# The types of the parameters are private to pytest
+@no_type_check
+def pytest_addoption(parser) -> None:
+    parser.getgroup('poorconn').addoption(
+        '--poorconn-benchmark-json', metavar='PATH', default=None,
+        help='Write the results of poorconn benchmarks to a JSON file.')
+
+
+@no_type_check
+def pytest_terminal_summary(terminalreporter, exitstatus, config) -> None:
+    results = _benchmarks(config)
+    if not results or _is_worker(config):
+        return
+    terminalreporter.write_sep('=', 'poorconn benchmarks')
+    for result in results:
+        columns = [result.name, f'rounds={len(result.durations)}']
+        columns.extend(f'{key}={_format(value, "s")}' for key, value in result.latency.items())
+        if result.throughput is not None:
+            columns.append(f'throughput={_format(result.throughput, "B/s")}')
+        if result.overshoot is not None:
+            columns.append(f'overshoot(mean/max)={_format(result.overshoot["mean"], "s")}/'
+                           f'{_format(result.overshoot["max"], "s")}')
+        if result.failures:
+            columns.append('FAILED')
+        terminalreporter.write_line('  '.join(columns))
+
+
+@no_type_check
+def pytest_sessionfinish(session, exitstatus) -> None:
+    path = session.config.getoption('poorconn_benchmark_json')
+    results = _benchmarks(session.config)
+    if path is None or not results or _is_worker(session.config):  # Otherwise, workers overwrite each other
+        return
+    with open(path, 'w') as f:
+        json.dump({'benchmarks': [asdict(result) for result in results]}, f, indent=2)
@@ -15,17 +15,26 @@
 
 from __future__ import annotations
 
+import contextlib
 from dataclasses import dataclass
-from http.server import HTTPServer, SimpleHTTPRequestHandler
 import pathlib
-import socket
-from socketserver import BaseServer
-import threading
-from typing import Any, Iterator, no_type_check
+from socketserver import BaseRequestHandler, BaseServer
+from typing import Any, Callable, Dict, Iterator, no_type_check, Optional, Type
 
 import pytest
 
-from poorconn import delay_before_sending_upon_acceptance, make_socket_patchable
+from poorconn import (Controller,
+                      delay_before_sending_upon_acceptance,
+                      FileCache,
+                      make_socket_patchable,
+                      ProxyController,
+                      simulate_upon_acceptance,
+                      Simulation,
+                      start_proxy)
+
+from poorconn._servers import _HTTPServer, _TCPServer
+
+from ._benchmark import _register_recorder
 
 
 # The type of ``config`` is private to pytest
@@ -33,8 +42,14 @@ from poorconn import delay_before_sending_upon_acceptance, make_socket_patchable
 def pytest_configure(config) -> None:
     # register markers
     config.addinivalue_line(
-        "markers", "poorconn_http_server_config(address, port, t, length): Configure fixture ``poorconn_http_server``."
+        "markers", "poorconn_http_server_config(address, port, t, length, cache_size): Configure fixture "
+        "``poorconn_http_server``."
     )
+    config.addinivalue_line(
+        "markers", "poorconn_benchmark(rounds, controllers, name, max_mean, max_p50, max_p95, max_p99, max_max, "
+        "min_throughput): Configure the defaults of fixture ``poorconn_benchmark``."
+    )
+    _register_recorder(config)
 
 
 @dataclass(frozen=True)
@@ -44,50 +59,59 @@ class Server:
     "A :class:`socketserver.BaseServer` object."
     url: str
     "The URL to the root of :attr:`~.Server.server`."
+    controller: Optional[Controller] = None
+    """The controller of the simulation that is applied to :attr:`~.Server.server`, which can be updated to change the
+    simulation during a test.
 
+    .. versionadded:: 0.3
+    """
 
-class _HTTPServer(HTTPServer):
-    "Our inherited :class:`HTTPServer` class that allows reusing address."
 
-    allow_reuse_address: bool = True
+class _PoorConnHTTPServerDefault:
+    "Default of options for :func:`poorconn_http_server`."
 
-    def serve_forever_new_thread(self) -> threading.Thread:
-        "Serve forever, but in a new thread."
+    ADDRESS: str = 'localhost'
+    PORT: int = 0  # Chosen by the operating system, so that tests that run in parallel do not collide
+    T: float = 1
+    LENGTH: int = 1024
+    CACHE_SIZE: int = 0
 
-        # [NOTE SO_REUSEADDR]
-        # With SO_REUSEADDR, multiple sockets on Windows can listen on the same
-        # ports and cause undetermined behaviors. Use SO_EXCLUSIVEADDRUSE to
-        # prevent this. See
-        # https://docs.microsoft.com/en-us/windows/win32/winsock/using-so-reuseaddr-and-so-exclusiveaddruse
-        if hasattr(socket, 'SO_EXCLUSIVEADDRUSE'):  # pragma: no cover, Windows-only
-            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_EXCLUSIVEADDRUSE, 1)
-        else:  # pragma: no cover
-            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        thread = threading.Thread(target=self.serve_forever, name='Http server on a new thread', daemon=True)
-        thread.start()
-        return thread
 
+def _http_server_options(request: pytest.FixtureRequest) -> Dict[str, Any]:
+    "Extract options from the ``poorconn_http_server_config`` marker that is closest to the test."
 
-if hasattr(socket, 'SO_EXCLUSIVEADDRUSE'):  # pragma: no cover, Windows-only
-    _HTTPServer.allow_reuse_address = False
-else:  # pragma: no cover
-    _HTTPServer.allow_reuse_address = True
+    config = request.node.get_closest_marker('poorconn_http_server_config')
+    return dict(config.kwargs) if config is not None else {}
 
 
-class _PoorConnHTTPServerDefault:
-    "Default of options for :func:`poorconn_http_server`."
+@contextlib.contextmanager
+def _start_http_server(address: str, port: int, directory: pathlib.Path, t: float, length: int,
+                       cache_size: int) -> Iterator[Server]:
+    "Start an HTTP server that serves ``directory`` on a new thread, slowed down with the given options."
 
-    ADDRESS: str = 'localhost'
-    PORT: int = 8080
-    T: float = 1
-    LENGTH: int = 1024
+    with _HTTPServer((address, port), directory) as httpd:
+        httpd.file_cache = FileCache(cache_size) if cache_size > 0 else None
+        httpd.socket = make_socket_patchable(httpd.socket)
+        controller = delay_before_sending_upon_acceptance(httpd.socket, t=t, length=length)
+        thread = httpd.serve_forever_new_thread()
+        try:
+            yield Server(server=httpd, url=f'http://{httpd.server_address[0]}:{httpd.server_address[1]}',
+                         controller=controller)
+        finally:
+            httpd.shutdown()
+
+    # Wait until httpd has been closed
+    thread.join()
 
 
 @pytest.fixture
 def poorconn_http_server(tmp_path: pathlib.Path, request: pytest.FixtureRequest) -> Iterator[Server]:
-    """A :mod:`pytest` fixture: An :class:`http.server.HTTPServer` object that serves on a new thread. By default, it
-    listens on ``localhost:8080``. It's socket is slowed down with :func:`poorconn.delay_before_sending`. It serves
-    ``tmp_path`` as the root directory.
+    """A :mod:`pytest` fixture: An :class:`http.server.ThreadingHTTPServer` object that serves on a new thread. By
+    default, it listens on ``localhost`` on a port chosen by the operating system, which can be found in the URL of the
+    returned :class:`Server` object, so that tests can run in parallel (e.g., with ``pytest-xdist``) without colliding.
+    It's socket is slowed down with :func:`poorconn.delay_before_sending_upon_acceptance`, whose controller is
+    :attr:`Server.controller`. It serves ``tmp_path`` as the root directory with :class:`poorconn.HTTPRequestHandler`,
+    which supports persistent connections and byte ranges.
 
     The defaults can be modified by applying the ``@pytest.mark.poorconn_http_server_config`` marker. The marker accepts
     the following parameters:
@@ -96,6 +120,8 @@ def poorconn_http_server(tmp_path: pathlib.Path, request: pytest.FixtureRequest)
     - ``port``: The port that the HTTP server listens on.
     - ``t``: Same as ``t`` in :func:`poorconn.delay_before_sending`.
     - ``length``: Same as ``length`` in :func:`poorconn.delay_before_sending`.
+    - ``cache_size``: If positive, files are cached in memory with a :class:`poorconn.FileCache` object of this size,
+      so that many downloads of the same files do not read the disk. 0 by default.
 
     Example:
 
@@ -104,29 +130,136 @@ def poorconn_http_server(tmp_path: pathlib.Path, request: pytest.FixtureRequest)
        @pytest.mark.poorconn_http_server_config(address='127.0.0.1', port=2222, t=2, length=1024)
        def test_http_server(poorconn_http_server, tmp_path):
            "My test..."
+
+    .. versionchanged:: 0.3
+       The port is chosen by the operating system by default instead of 8080. The server speaks HTTP/1.1 and serves
+       connections in parallel. Added the ``cache_size`` parameter.
     """
-    class Handler(SimpleHTTPRequestHandler):
-        def __init__(self, *args: Any, directory: pathlib.Path = tmp_path, **kwargs: Any):
-            # The following type ignore is because of https://github.com/python/mypy/issues/6799
-            super().__init__(*args, directory=directory, **kwargs)  # type: ignore[misc]
 
-    # Extract options from markers
-    config = request.node.get_closest_marker('poorconn_http_server_config')
-    if config is not None:
-        options = config.kwargs
-    else:
-        options = {}
-    port = options.get('port', _PoorConnHTTPServerDefault.PORT)
-    address = options.get('address', _PoorConnHTTPServerDefault.ADDRESS)
-    t = options.get('t', _PoorConnHTTPServerDefault.T)
-    length = options.get('length', _PoorConnHTTPServerDefault.LENGTH)
-
-    with _HTTPServer((address, port), Handler) as httpd:
-        httpd.socket = make_socket_patchable(httpd.socket)
-        delay_before_sending_upon_acceptance(httpd.socket, t=t, length=length)
-        thread = httpd.serve_forever_new_thread()
-        yield Server(server=httpd, url=f'http://{httpd.server_address[0]}:{httpd.server_address[1]}')
-        httpd.shutdown()
+    options = _http_server_options(request)
+    with _start_http_server(address=options.get('address', _PoorConnHTTPServerDefault.ADDRESS),
+                            port=options.get('port', _PoorConnHTTPServerDefault.PORT),
+                            directory=tmp_path,
+                            t=options.get('t', _PoorConnHTTPServerDefault.T),
+                            length=options.get('length', _PoorConnHTTPServerDefault.LENGTH),
+                            cache_size=options.get('cache_size', _PoorConnHTTPServerDefault.CACHE_SIZE)) as server:
+        yield server
 
-    # Wait until httpd has been closed
-    thread.join()
+
+@pytest.fixture(scope='session')
+def _poorconn_shared_http_server(tmp_path_factory: pytest.TempPathFactory) -> Iterator[Server]:
+    "The server of :func:`poorconn_shared_http_server`, which is started once per session (and per ``xdist`` worker)."
+
+    with _start_http_server(address=_PoorConnHTTPServerDefault.ADDRESS, port=_PoorConnHTTPServerDefault.PORT,
+                            directory=tmp_path_factory.mktemp('poorconn_shared_http_server'),
+                            t=_PoorConnHTTPServerDefault.T, length=_PoorConnHTTPServerDefault.LENGTH,
+                            cache_size=_PoorConnHTTPServerDefault.CACHE_SIZE) as server:
+        yield server
+
+
+@pytest.fixture
+def poorconn_shared_http_server(_poorconn_shared_http_server: Server, tmp_path: pathlib.Path,
+                                request: pytest.FixtureRequest) -> Server:
+    """A :mod:`pytest` fixture: Same as :func:`poorconn_http_server`, except that the server is started once per test
+    session and shared by the tests, which saves the time of starting and stopping a server for every test. With
+    ``pytest-xdist``, every worker process starts its own server. Before every test, the server is reset through
+    :attr:`Server.controller` to the options of the ``@pytest.mark.poorconn_http_server_config`` marker (or their
+    defaults), and serves ``tmp_path`` of the test as the root directory. Since the server is already listening, the
+    marker only accepts ``t``, ``length`` and ``cache_size``.
+
+    Example:
+
+    .. code-block:: python
+
+       @pytest.mark.poorconn_http_server_config(t=2, length=1024)
+       def test_http_server(poorconn_shared_http_server, tmp_path):
+           "My test..."
+
+    .. versionadded:: 0.3
+    """
+
+    options = _http_server_options(request)
+    unsupported = set(options) - {'t', 'length', 'cache_size'}
+    if unsupported:
+        raise ValueError(f'The shared HTTP server does not support options {", ".join(sorted(unsupported))}')
+    server = _poorconn_shared_http_server
+    server.server.directory = tmp_path  # type: ignore[attr-defined]
+    cache_size = options.get('cache_size', _PoorConnHTTPServerDefault.CACHE_SIZE)
+    server.server.file_cache = FileCache(cache_size) if cache_size > 0 else None  # type: ignore[attr-defined]
+    server.controller.t = options.get('t', _PoorConnHTTPServerDefault.T)  # type: ignore[union-attr]
+    server.controller.length = options.get('length', _PoorConnHTTPServerDefault.LENGTH)  # type: ignore[union-attr]
+    return server
+
+
+@pytest.fixture
+def poorconn_tcp_server() -> Iterator[Callable[..., Server]]:
+    """A :mod:`pytest` fixture: A function that starts a :class:`socketserver.ThreadingTCPServer` object on a new
+    thread, which handles every connection on its own thread with any handler, and applies a simulation or profile to
+    every connection socket (see :func:`poorconn.simulate_upon_acceptance`). It returns a :class:`Server` object, whose
+    URL is ``tcp://address:port`` and whose :attr:`~Server.controller` is the controller of the simulation. Servers are
+    stopped at the end of the test. The function accepts the following parameters:
+
+    - ``handler``: A :class:`socketserver.BaseRequestHandler` subclass that handles connections.
+    - ``simulation``: Same as ``simulation`` in :func:`poorconn.simulate_upon_acceptance`, or ``None`` for none.
+    - ``address``: The address to bind the server. The default is ``localhost``.
+    - ``port``: The port that the server listens on. The default is 0, i.e., a port chosen by the operating system.
+
+    Example:
+
+    .. code-block:: python
+
+       class EchoHandler(socketserver.StreamRequestHandler):
+           def handle(self):
+               self.wfile.write(self.rfile.readline())
+
+       def test_echo(poorconn_tcp_server):
+           server = poorconn_tcp_server(EchoHandler, simulation='3g')
+           with socket.create_connection(server.server.server_address) as s:
+               ...
+
+    .. versionadded:: 0.3
+    """
+
+    with contextlib.ExitStack() as stack:
+        def start(handler: Type[BaseRequestHandler], simulation: Optional[Simulation] = None,
+                  address: str = _PoorConnHTTPServerDefault.ADDRESS, port: int = 0) -> Server:
+            server = stack.enter_context(_TCPServer((address, port), handler))
+            server.socket = make_socket_patchable(server.socket)
+            controller = None if simulation is None else simulate_upon_acceptance(server.socket, simulation)
+            thread = server.serve_forever_new_thread()
+            # Called in reverse order: Stop the server before closing it, and wait for the thread after that
+            stack.callback(thread.join)
+            stack.callback(server.shutdown)
+            url = 'tcp://{}:{}'.format(*server.socket.getsockname()[:2])
+            return Server(server=server, url=url, controller=controller)
+
+        yield start
+
+
+@pytest.fixture
+def poorconn_proxy() -> Iterator[Callable[..., ProxyController]]:
+    """A :mod:`pytest` fixture: A function that starts a TCP proxy in front of any local service, with the same
+    parameters as :func:`poorconn.start_proxy`, and returns its controller. Proxies are removed at the end of the test.
+
+    Example:
+
+    .. code-block:: python
+
+       def test_slow_database(poorconn_proxy):
+           proxy = poorconn_proxy(('localhost', 5432), simulation='3g')
+           connection = connect(host=proxy.address[0], port=proxy.address[1])
+           ...
+
+    .. versionadded:: 0.3
+    """
+
+    controllers = []
+
+    def start(*args: Any, **kwargs: Any) -> ProxyController:
+        controller = start_proxy(*args, **kwargs)
+        controllers.append(controller)
+        return controller
+
+    yield start
+    for controller in controllers:
+        controller.remove()
@@ -36,7 +36,7 @@ setuptools.setup(
     data_files=[("", ["COPYING", "COPYING.GPL"])],
     python_requires=">=3.7",
     extras_require={
-        'full': ['pytest >= 6.2'],
+        'full': ['pytest >= 6.2', 'tomli >= 1.1; python_version < "3.11"'],
     },
     classifiers=[
         "Framework :: Pytest",
@@ -16,11 +16,16 @@
 
 from http.server import HTTPServer, SimpleHTTPRequestHandler
 import os
+import shutil
 import socket
+import ssl
+import subprocess
 import sys
 
 import pytest
 
+from poorconn import PatchableSocket
+
 
 sys.path.append(os.path.join(os.path.dirname(__file__), 'helpers'))
 
@@ -48,6 +53,15 @@ def http_server() -> HTTPServer:
         httpd.shutdown()
 
 
+@pytest.fixture
+def socks():
+    "A pair of connected sockets, the first of which is patchable."
+
+    a, b = socket.socketpair()
+    with PatchableSocket.create_from(a) as a, b:
+        yield a, b
+
+
 @pytest.fixture
 def http_url(http_server) -> str:
     "The root URL of ``http_server``."
@@ -59,3 +73,22 @@ def http_url(http_server) -> str:
 def timeout() -> int:
     "How many seconds the test should time out for tests that require a timeout parameter."
     return 2
+
+
+@pytest.fixture(scope='session')
+def tls_contexts(tmp_path_factory):
+    """A pair of :class:`ssl.SSLContext` objects for the server and the client, respectively. The server uses a
+    self-signed certificate for ``localhost``, which the client trusts."""
+
+    if shutil.which('openssl') is None:
+        pytest.skip('openssl is not available')
+    cert_dir = tmp_path_factory.mktemp('tls')
+    certfile, keyfile = cert_dir / 'cert.pem', cert_dir / 'key.pem'
+    subprocess.run(('openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1', '-subj', '/CN=localhost',
+                    '-addext', 'subjectAltName=DNS:localhost', '-keyout', str(keyfile), '-out', str(certfile)),
+                   check=True, capture_output=True)
+    server_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    server_context.load_cert_chain(certfile=str(certfile), keyfile=str(keyfile))
+    client_context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    client_context.load_verify_locations(cafile=str(certfile))
+    return server_context, client_context
@@ -46,6 +46,16 @@ def echo_server_socket_new_thread(sock: socket.socket, timeout=None):
     thread.join()
 
 
+@contextmanager
+def function_new_thread(function):
+    "Run ``function`` in a new thread, and wait for it to finish upon exit."
+
+    thread = threading.Thread(target=function, name='Function on a new thread', daemon=True)
+    thread.start()
+    yield thread
+    thread.join()
+
+
 def httpd_serve_new_thread(httpd: HTTPServer) -> threading.Thread:
     "Let an ``HTTPServer`` object start serve on a new thread."
 
@@ -13,12 +13,16 @@
 # You should have received a copy of the GNU Lesser General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
+import select
+import socket as socket_module
 from socket import socket
+import sys
+import time
 
 import pytest
 import requests
 
-from poorconn import close_upon_acceptance, PatchableSocket
+from poorconn import close_upon_acceptance, delay_acceptance, limit_acceptance_rate, limit_backlog, PatchableSocket
 
 import utils
 
@@ -30,7 +34,7 @@ def test_close_upon_acceptance(timeout):
         utils.set_server_socket_options(server_sock)
         server_sock.bind(('localhost', 7999))
         id_accept = id(server_sock.accept)
-        close_upon_acceptance(server_sock)
+        controller = close_upon_acceptance(server_sock)
         assert id_accept != id(server_sock.accept)  # Ensure that the socket object is wrapped
         server_sock.listen()
         with utils.echo_server_socket_new_thread(server_sock):
@@ -39,6 +43,14 @@ def test_close_upon_acceptance(timeout):
                 # EOF should be reached because the other end has closed the socket
                 assert len(client_sock.recv(128)) == 0
 
+        # Connections are no longer closed after the simulation is removed
+        controller.remove()
+        with utils.echo_server_socket_new_thread(server_sock, timeout=timeout):
+            with socket() as client_sock:
+                client_sock.connect(('localhost', 7999))
+                client_sock.sendall(b'poorconn')
+                assert utils.recv_until(client_sock, 8) == b'poorconn'
+
 
 def test_close_upon_acceptance_http_server(http_server, http_url, timeout):
     "Test :func:`poorconn.close_upon_acceptance` with ``HTTPServer``."
@@ -55,3 +67,146 @@ def test_close_upon_acceptance_http_server(http_server, http_url, timeout):
     # We don't assert the content of the exception because, for the client, the error can be anything
     # 'RemoteDisconnected', 'ConnectionResetError', 'ConnectionAbortedError', etc., depending on the progress of the two
     # threads.
+
+
+def test_delay_acceptance(timeout):
+    "Test :func:`poorconn.delay_acceptance`."
+
+    with PatchableSocket() as server_sock:
+        utils.set_server_socket_options(server_sock)
+        server_sock.bind(('localhost', 7999))
+        id_accept = id(server_sock.accept)
+        controller = delay_acceptance(server_sock, t=0.1)
+        assert controller.t == 0.1
+        assert id_accept != id(server_sock.accept)  # Ensure that the socket object is wrapped
+        controller.t = timeout / 2
+        server_sock.listen()
+        with utils.echo_server_socket_new_thread(server_sock, timeout=timeout):
+            with socket() as client_sock:
+                starting_time = time.time()
+                client_sock.connect(('localhost', 7999))
+                client_sock.sendall(b'poorconn')
+                assert utils.recv_until(client_sock, 8) == b'poorconn'
+                ending_time = time.time()
+                assert ending_time - starting_time > timeout / 2
+
+
+def test_delay_acceptance_backlog(timeout):
+    "Test that :func:`poorconn.delay_acceptance` holds connections in the backlog."
+
+    with PatchableSocket() as server_sock:
+        utils.set_server_socket_options(server_sock)
+        server_sock.bind(('localhost', 7999))
+        server_sock.listen()
+        delay_acceptance(server_sock, t=timeout / 2)
+
+        server_sock.settimeout(0)
+        with pytest.raises(BlockingIOError):
+            server_sock.accept()
+        server_sock.settimeout(timeout / 8)
+        starting_time = time.time()
+        with pytest.raises(socket_module.timeout):
+            server_sock.accept()
+        assert time.time() - starting_time < timeout / 4  # Not waiting twice
+
+        server_sock.settimeout(None)
+        with socket() as client_sock:
+            client_sock.connect(('localhost', 7999))
+            with utils.function_new_thread(lambda: server_sock.accept()[0].close()):
+                time.sleep(timeout / 4)
+                assert select.select((server_sock,), (), (), 0)[0]  # Still pending while the acceptance is delayed
+            assert not select.select((server_sock,), (), (), 0)[0]
+
+
+def test_limit_acceptance_rate():
+    "Test :func:`poorconn.limit_acceptance_rate`."
+
+    with PatchableSocket() as server_sock:
+        utils.set_server_socket_options(server_sock)
+        server_sock.bind(('localhost', 7999))
+        id_accept = id(server_sock.accept)
+        controller = limit_acceptance_rate(server_sock, rate=100, burst=1)
+        assert controller.rate == 100
+        assert controller.burst == 1
+        assert id_accept != id(server_sock.accept)  # Ensure that the socket object is wrapped
+        server_sock.listen()
+
+        client_socks = [socket() for _ in range(6)]
+        for client_sock in client_socks:
+            client_sock.connect(('localhost', 7999))
+
+        def time_acceptances(n):
+            starting_time = time.time()
+            for _ in range(n):
+                server_sock.accept()[0].close()
+            return time.time() - starting_time
+
+        time.sleep(0.1)  # Let the bucket fill up
+        controller.rate = 5
+        assert time_acceptances(3) > 2 * 1 / 5 - 0.05  # The first one is covered by the burst
+        time.sleep(3 / 5)  # Let the bucket fill up
+        controller.burst = 3
+        time.sleep(3 / 5)
+        assert time_acceptances(3) < 1 / 5
+
+        for client_sock in client_socks:
+            client_sock.close()
+
+
+def test_limit_backlog():
+    "Test :func:`poorconn.limit_backlog`."
+
+    with PatchableSocket() as server_sock:
+        utils.set_server_socket_options(server_sock)
+        server_sock.bind(('localhost', 7999))
+        server_sock.listen(128)
+        controller = limit_backlog(server_sock, backlog=1)
+        assert controller.backlog == 1
+
+        client_socks = [socket() for _ in range(6)]
+        with pytest.raises(OSError):
+            # The backlog overflows, and connections time out or are refused, depending on the platform.
+            for client_sock in client_socks:
+                client_sock.settimeout(0.5)
+                client_sock.connect(('localhost', 7999))
+        if sys.platform.startswith('linux'):
+            assert controller.queue_depth == 2  # Linux allows one more connection than the backlog
+        for client_sock in client_socks:
+            client_sock.close()
+
+        # Drain the queue and enlarge the backlog
+        server_sock.settimeout(0.1)
+        try:
+            while True:
+                server_sock.accept()[0].close()
+        except OSError:
+            pass
+        controller.backlog = 16
+        client_socks = [socket() for _ in range(6)]
+        for client_sock in client_socks:
+            client_sock.settimeout(0.5)
+            client_sock.connect(('localhost', 7999))
+        if sys.platform.startswith('linux'):
+            assert controller.queue_depth == 6
+        for client_sock in client_socks:
+            client_sock.close()
+
+
+def test_limit_backlog_before_listening():
+    "Test :func:`poorconn.limit_backlog` when the socket is not listening yet."
+
+    with PatchableSocket() as server_sock:
+        utils.set_server_socket_options(server_sock)
+        server_sock.bind(('localhost', 7999))
+        controller = limit_backlog(server_sock, backlog=1)
+        assert controller.queue_depth is None
+        server_sock.listen(128)  # 128 should be ignored
+        if sys.platform.startswith('linux'):
+            assert controller.queue_depth == 0
+        client_socks = [socket() for _ in range(6)]
+        with pytest.raises(OSError):
+            for client_sock in client_socks:
+                client_sock.settimeout(0.5)
+                client_sock.connect(('localhost', 7999))
+        for client_sock in client_socks:
+            client_sock.close()
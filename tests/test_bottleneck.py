@@ -0,0 +1,104 @@
+# Copyright (C) 2021  Hong Xu <hong@topbug.net>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import socket
+import time
+
+import pytest
+
+from poorconn import PatchableSocket, send_through_bottleneck, send_through_bottleneck_upon_acceptance
+
+import utils
+
+
+def test_send_through_bottleneck(socks, timeout):
+    "Test :func:`poorconn.send_through_bottleneck`."
+
+    a, b = socks
+    controller = send_through_bottleneck(a, rate=30000 / (timeout / 4), queue_size=60000)
+    starting_time = time.time()
+    a.sendall(b'a' * 30000)
+    assert time.time() - starting_time < timeout / 8  # Queued
+    assert controller.queue_delay > timeout / 8
+    assert 0 < controller.queued_bytes <= 30000
+    assert utils.recv_until(b, 30000) == b'a' * 30000
+    assert timeout / 4 * 0.9 < time.time() - starting_time < timeout / 2  # Limited by the rate
+    assert controller.drops == 0
+    assert a.send(b'') == 0  # Nothing to queue
+
+    controller.remove()
+    assert 'sendall' not in vars(a)
+
+
+def test_send_through_bottleneck_drop_tail(socks, timeout):
+    "Test the drop-tail queue discipline of :func:`poorconn.send_through_bottleneck`."
+
+    a, b = socks
+    controller = send_through_bottleneck(a, rate=30000 / (timeout / 4), queue_size=15000)
+    with utils.function_new_thread(lambda: utils.recv_until(b, 45000)):
+        starting_time = time.time()
+        a.sendall(b'a' * 45000)
+        assert time.time() - starting_time > timeout / 4 * 0.9  # Blocked until the queue has room
+        assert controller.drops > 0
+        assert controller.queued_bytes <= 15000
+
+
+def test_send_through_bottleneck_codel(socks, timeout):
+    "Test the CoDel queue discipline of :func:`poorconn.send_through_bottleneck`."
+
+    a, b = socks
+    controller = send_through_bottleneck(a, rate=30000 / (timeout / 4), queue_size=60000, discipline='codel',
+                                         drop_penalty=timeout / 8)
+    with utils.function_new_thread(lambda: utils.recv_until(b, 60000)):
+        for _ in range(20):
+            a.sendall(b'a' * 3000)
+            time.sleep(0.01)
+        assert controller.drops > 0
+
+
+def test_send_through_bottleneck_invalid_discipline(socks):
+    "Test :func:`poorconn.send_through_bottleneck` with an unknown queue discipline."
+
+    with pytest.raises(ValueError):
+        send_through_bottleneck(socks[0], rate=1, discipline='red')
+
+
+def test_send_through_bottleneck_upon_acceptance(timeout):
+    "Test that connections accepted after :func:`poorconn.send_through_bottleneck_upon_acceptance` share the link."
+
+    with PatchableSocket() as server_sock:
+        utils.set_server_socket_options(server_sock)
+        server_sock.bind(('localhost', 7999))
+        controller = send_through_bottleneck_upon_acceptance(server_sock, rate=30000 / (timeout / 4),
+                                                             queue_size=60000)
+        server_sock.listen()
+        with socket.create_connection(('localhost', 7999)) as bulk_client, \
+                socket.create_connection(('localhost', 7999)) as rpc_client:
+            bulk_conn, _ = server_sock.accept()
+            rpc_conn, _ = server_sock.accept()
+            with bulk_conn, rpc_conn:
+                bulk_conn.sendall(b'a' * 30000)  # Fills the queue
+                starting_time = time.time()
+                rpc_conn.sendall(b'poorconn')
+                assert utils.recv_until(rpc_client, 8) == b'poorconn'
+                assert time.time() - starting_time > timeout / 4 * 0.9  # Waited behind the bulk data
+                assert utils.recv_until(bulk_client, 30000) == b'a' * 30000
+
+                controller.remove()
+                starting_time = time.time()
+                rpc_conn.sendall(b'poorconn')
+                assert utils.recv_until(rpc_client, 8) == b'poorconn'
+                assert time.time() - starting_time < timeout / 8
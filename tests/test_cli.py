@@ -13,17 +13,26 @@
 # You should have received a copy of the GNU Lesser General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
+from argparse import Namespace
 import itertools
+import json
+import os
 import pathlib
+import signal
+import socket
 import subprocess
 import sys
+import textwrap
 import threading
 import time
 
 import pytest
 import requests
 
-from poorconn._cli import main
+from poorconn._cli import _shared_parameters, main, serve_worker
+from poorconn._workers import Counters
+
+import utils
 
 
 def run_from_cli(argv):
@@ -32,6 +41,28 @@ def run_from_cli(argv):
     return subprocess.run((sys.executable, '-m', 'poorconn') + tuple(argv), capture_output=True, text=True)
 
 
+def main_until_interrupted(argv, check):
+    "Run ``main(argv)`` in the current process, and interrupt it after ``check()``, which runs on a new thread."
+
+    errors = []
+
+    def work():
+        try:
+            time.sleep(2)  # Wait for the servers to startup
+            check()
+        except BaseException as e:
+            errors.append(e)
+        finally:
+            os.kill(os.getpid(), signal.SIGINT)
+
+    thread = threading.Thread(target=work, name='Check thread', daemon=True)
+    thread.start()
+    main(argv)
+    thread.join()
+    if errors:
+        raise errors[0]
+
+
 def test_empty(capsys):
     'Test when no option is passed in (``python -m poorconn``).'
 
@@ -112,3 +143,186 @@ def test_basic_usage():
     response = requests.get('http://localhost:10009/setup.py', timeout=2)
     assert response.status_code == 200
     assert response.content == pathlib.Path('./setup.py').read_bytes()
+
+
+def test_http_slowness(timeout):
+    "Test slowing down responses at the HTTP level without a simulation command."
+
+    thread = threading.Thread(target=lambda: main(['-p', '10010', '-H', 'localhost', '--ttfb', str(timeout),
+                                                   '--chunk-size', '1024', '--cache-size', '1000000']),
+                              name='Command line thread', daemon=True)
+    thread.start()
+
+    time.sleep(2)  # Wait for the HTTP server to startup
+    starting_time = time.time()
+    response = requests.get('http://localhost:10010/setup.py', timeout=timeout * 2)
+    assert time.time() - starting_time > timeout
+    assert response.headers['Transfer-Encoding'] == 'chunked'
+    assert response.content == pathlib.Path('./setup.py').read_bytes()
+
+
+def test_run(http_server, http_url, tmp_path, capfd, timeout):
+    "Test the ``run`` command."
+
+    utils.httpd_serve_new_thread(http_server)
+    script = tmp_path / 'script.py'
+    script.write_text(textwrap.dedent(f'''
+        import sys
+        import time
+        import urllib.request
+
+        starting_time = time.time()
+        with urllib.request.urlopen('{http_url}/setup.py') as response:
+            response.read()
+        sys.exit(0 if time.time() - starting_time > {timeout} else 3)
+        '''))
+    metrics_file = tmp_path / 'metrics.jsonl'
+
+    with pytest.raises(SystemExit) as e:
+        main(['run', '--latency', str(timeout), '--match', 'localhost:8000', '--metrics-file', str(metrics_file), '--',
+              sys.executable, str(script)])
+    assert e.value.code == 0
+    metrics = json.loads(metrics_file.read_text())
+    assert metrics['connections'] == 1
+    assert metrics['bytes_sent'] > 0
+    assert '1 connection(s) shaped' in capfd.readouterr().err
+
+    # Not matched
+    with pytest.raises(SystemExit) as e:
+        main(['run', '--profile', '3g', '--match', ':8001', sys.executable, str(script)])
+    assert e.value.code == 3
+    assert '0 connection(s) shaped' in capfd.readouterr().err
+
+
+def test_run_missing_command(capsys):
+    "Test the ``run`` command without a command to run."
+
+    with pytest.raises(SystemExit) as e:
+        main(['run', '--'])
+    assert e.value.code == 2
+    assert 'the command to run is missing' in capsys.readouterr().err
+
+
+def test_processes(timeout):
+    "Test serving with multiple worker processes, which share parameters updated through the control port."
+
+    process = subprocess.Popen((sys.executable, '-m', 'poorconn', '-p', '10011', '--processes', '2', '--control-port',
+                                '10012'), stderr=subprocess.PIPE, text=True)
+    try:
+        time.sleep(2)  # Wait for the HTTP servers to startup
+        assert requests.get('http://localhost:10011/setup.py', timeout=timeout).ok
+        with socket.create_connection(('localhost', 10012), timeout=timeout) as control:
+            control_file = control.makefile('rw')
+            control_file.write(f'set ttfb={timeout}\n')
+            control_file.flush()
+            assert json.loads(control_file.readline())['ttfb'] == timeout
+            time.sleep(0.5)  # Wait for the worker processes to synchronize
+
+            for _ in range(2):
+                starting_time = time.time()
+                assert requests.get('http://localhost:10011/setup.py', timeout=timeout * 2).ok
+                assert time.time() - starting_time > timeout
+            time.sleep(0.5)  # Wait for the worker processes to update their counters
+
+            control_file.write('stats\n')
+            control_file.flush()
+            stats = json.loads(control_file.readline())
+            assert stats['total'] == {'responses': 3}
+            assert len(stats['workers']) == 2
+            control_file.write('set nonexistent=1\n')
+            control_file.flush()
+            assert 'error' in json.loads(control_file.readline())
+    finally:
+        process.send_signal(signal.SIGINT)
+        _, stderr = process.communicate(timeout=10)
+    assert '3 response(s) served by 2 worker process(es)' in stderr
+
+
+def test_processes_invalid(capsys, monkeypatch):
+    "Test invalid numbers of worker processes."
+
+    with pytest.raises(SystemExit) as e:
+        main(['--processes', '0'])
+    assert e.value.code == 2
+    assert 'the number of processes must be positive' in capsys.readouterr().err
+
+    monkeypatch.delattr(socket, 'SO_REUSEPORT', raising=False)
+    with pytest.raises(SystemExit) as e:
+        main(['--processes', '2'])
+    assert e.value.code == 2
+    assert 'multiple processes require SO_REUSEPORT' in capsys.readouterr().err
+
+
+def test_processes_run_workers(monkeypatch, capfd):
+    "Test that worker processes are run with the shared parameters."
+
+    calls = []
+    monkeypatch.setattr('poorconn._cli.run_workers', lambda processes, target: calls.append((processes, target)))
+    main(['-p', '10016', '--processes', '2', '--ttfb', '1'])
+    (processes, target), = calls
+    assert processes == 2
+    assert target.func is serve_worker
+    assert target.args[1].get()['ttfb'] == 1
+    assert '0 response(s) served by 2 worker process(es)' in capfd.readouterr().err
+
+
+def test_control_port(capfd, timeout):
+    "Test serving in the current process with a control port."
+
+    def check():
+        with socket.create_connection(('localhost', 10018), timeout=timeout) as control:
+            control_file = control.makefile('rw')
+            control_file.write('set t=0.01\n')
+            control_file.flush()
+            assert json.loads(control_file.readline())['t'] == 0.01
+        assert requests.get('http://localhost:10017/setup.py', timeout=timeout).ok
+
+    main_until_interrupted(['-p', '10017', '--control-port', '10018',
+                            'delay_before_sending_upon_acceptance', '--t', '0'], check)
+    assert '1 response(s) served by 1 worker process(es)' in capfd.readouterr().err
+
+
+def test_serve_worker_interrupted(timeout):
+    "Test that a worker process ignores further interrupts after it is interrupted."
+
+    args = Namespace(host='localhost', port=10019, processes=2, cache_size=0, simulation_command=None, ttfb=0.0,
+                     header_delay=0.0, chunk_size=None, chunk_delay=0.0, stall_after=None, stall=0.0)
+    counters = Counters(('responses',), 1)
+    handler = signal.getsignal(signal.SIGINT)
+    threading.Timer(timeout / 2, os.kill, (os.getpid(), signal.SIGINT)).start()
+    try:
+        serve_worker(args, _shared_parameters(args), counters, 0)
+        assert signal.getsignal(signal.SIGINT) == signal.SIG_IGN
+    finally:
+        signal.signal(signal.SIGINT, handler)
+    assert counters.merged() == {'responses': 0}
+
+
+def test_config(tmp_path, capfd, timeout):
+    "Test serving the listeners in a configuration file."
+
+    config = tmp_path / 'listeners.json'
+    config.write_text(json.dumps({'listeners': [
+        {'type': 'http', 'port': 10013, 'directory': '.', 'http': {'ttfb': timeout}},
+        {'type': 'tcp', 'port': 10014, 'simulations': [{'name': 'close_upon_acceptance'}]}]}))
+
+    def check():
+        starting_time = time.time()
+        assert requests.get('http://localhost:10013/setup.py', timeout=timeout * 2).ok
+        assert time.time() - starting_time > timeout
+        with socket.create_connection(('localhost', 10014), timeout=timeout) as s:
+            assert s.recv(1) == b''
+
+    main_until_interrupted(['--config', str(config)], check)
+    assert 'tcp:10014 listening on' in capfd.readouterr().err
+
+    with pytest.raises(SystemExit) as e:
+        main(['--config', str(config), 'delay_before_sending_upon_acceptance', '--t', '1'])
+    assert e.value.code == 2
+    assert 'a simulation command cannot be used with --config' in capfd.readouterr().err
+
+    config.write_text(json.dumps({'listeners': [{'type': 'udp', 'port': 10015}]}))
+    with pytest.raises(SystemExit) as e:
+        main(['--config', str(config)])
+    assert e.value.code == 2
+    assert 'unknown type' in capfd.readouterr().err
@@ -0,0 +1,211 @@
+# Copyright (C) 2021  Hong Xu <hong@topbug.net>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import os
+import socket
+import threading
+import time
+
+import pytest
+
+from poorconn import (Clock,
+                      delay_before_sending,
+                      delay_in_transit,
+                      get_clock,
+                      limit_link_rate,
+                      Pacer,
+                      PatchableSocket,
+                      set_clock,
+                      SpinClock,
+                      TimerfdClock,
+                      use_clock,
+                      VirtualClock)
+
+import utils
+
+
+@pytest.mark.parametrize('clock_class', [
+    Clock,
+    SpinClock,
+    pytest.param(TimerfdClock, marks=pytest.mark.skipif(not hasattr(os, 'timerfd_create'),
+                                                        reason='Timer file descriptors are not available')),
+])
+def test_clock(clock_class):
+    "Test that clocks sleep until deadlines and not before."
+
+    clock = clock_class()
+    for _ in range(20):
+        deadline = clock.monotonic() + 0.001
+        clock.sleep_until(deadline)
+        assert clock.monotonic() >= deadline
+    starting_time = time.monotonic()
+    clock.sleep_until(starting_time - 1)  # A deadline that has passed
+    clock.sleep(0)
+    assert time.monotonic() - starting_time < 0.001
+
+
+@pytest.mark.skipif(not hasattr(os, 'timerfd_create'), reason='Timer file descriptors are not available')
+def test_timerfd_clock_threads():
+    "Test that :class:`poorconn.TimerfdClock` closes the timer file descriptors of all threads."
+
+    clock = TimerfdClock()
+    threads = [threading.Thread(target=clock.sleep, args=(0.001,)) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    fds = list(clock._fds)
+    assert len(fds) == 3
+    del clock
+    for fd in fds:
+        with pytest.raises(OSError):
+            os.fstat(fd)
+
+
+def test_timerfd_clock_unavailable(monkeypatch):
+    "Test :class:`poorconn.TimerfdClock` where timer file descriptors are not available."
+
+    monkeypatch.delattr(os, 'timerfd_create', raising=False)
+    with pytest.raises(RuntimeError):
+        TimerfdClock()
+
+
+def test_spin_clock_precision(timeout):
+    "Test that :class:`poorconn.SpinClock` wakes up precisely."
+
+    clock = SpinClock(spin=0.001)
+    deadline = clock.monotonic() + 0.01
+    clock.sleep_until(deadline)  # Sleeps before spinning
+    assert clock.monotonic() >= deadline
+
+    pacer = Pacer()
+    previous = set_clock(SpinClock(spin=timeout / 100))
+    try:
+        assert isinstance(get_clock(), SpinClock)
+        for _ in range(50):
+            pacer.wait(0.0005)
+    finally:
+        assert set_clock(previous).spin == timeout / 100
+    assert pacer.waits == 50
+    # Spinning is precise, unless other threads, such as those left by other tests, hold the GIL in the meantime
+    assert pacer.mean_overshoot < 0.002
+
+
+def test_pacer_compensation(timeout):
+    "Test that :class:`poorconn.Pacer` compensates oversleeping and work between delays."
+
+    pacer = Pacer()
+    starting_time = time.monotonic()
+    for _ in range(200):
+        pacer.wait(timeout / 2000)
+        work_until = time.monotonic() + timeout / 20000
+        while time.monotonic() < work_until:  # Busy sending
+            pass
+    # Without compensation, the total would be at least 10% longer plus all overshoots
+    assert timeout / 10 <= time.monotonic() - starting_time < timeout / 10 * 1.08
+    assert pacer.waits == 200
+    assert 0 <= pacer.mean_overshoot <= pacer.max_overshoot
+
+
+def test_pacer_idle(timeout):
+    "Test that :class:`poorconn.Pacer` does not catch up after being idle."
+
+    pacer = Pacer(max_lag=timeout / 100)
+    pacer.wait(timeout / 100)
+    time.sleep(timeout / 10)
+    starting_time = time.monotonic()
+    pacer.wait(timeout / 100)
+    assert time.monotonic() - starting_time >= timeout / 100
+
+
+def test_virtual_clock():
+    "Test :class:`poorconn.VirtualClock` and :func:`poorconn.use_clock`."
+
+    previous = get_clock()
+    with use_clock(VirtualClock(start=100)) as clock:
+        assert get_clock() is clock
+        clock.sleep(10)
+        clock.sleep_until(105)  # Has passed
+        clock.advance(5)
+        assert clock.monotonic() == 115
+        assert clock.elapsed == 15
+    assert get_clock() is previous
+
+
+def test_virtual_clock_simulations(timeout):
+    "Test that simulations that block the caller finish instantly and report simulated time with a virtual clock."
+
+    a, b = socket.socketpair()
+    with PatchableSocket.create_from(a) as a, b, use_clock(VirtualClock()) as clock:
+        with utils.function_new_thread(lambda: utils.recv_until(b, 200_000)):
+            starting_time = time.monotonic()
+            controller = delay_before_sending(a, t=1, length=100)
+            a.sendall(b'a' * 100_000)  # 1000 delays of 1 second
+            assert controller.elapsed == clock.elapsed == pytest.approx(1000)
+            controller.remove()
+
+            controller = limit_link_rate(a, rate=1000)
+            a.sendall(b'a' * 100_000)
+            assert controller.elapsed == pytest.approx(100)
+            assert clock.elapsed == pytest.approx(1100)
+            assert time.monotonic() - starting_time < timeout
+
+
+def test_virtual_clock_timelines(timeout):
+    "Test that simulations in parallel advance their own timelines of a virtual clock."
+
+    def run(results):
+        a, b = socket.socketpair()
+        with PatchableSocket.create_from(a) as a, b:
+            controller = delay_before_sending(a, t=1, length=1000)
+            with utils.function_new_thread(lambda: utils.recv_until(b, 100_000)):
+                a.sendall(b'a' * 100_000)
+            results.append(controller)
+
+    results = []
+    with use_clock(VirtualClock()) as clock:
+        threads = [threading.Thread(target=run, args=(results,)) for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout)
+            assert not thread.is_alive()
+        assert [controller.elapsed for controller in results] == [pytest.approx(100)] * 10
+        assert clock.elapsed >= 100
+
+    # The simulation keeps the clock that it was applied with
+    a, b = socket.socketpair()
+    with PatchableSocket.create_from(a) as a, b:
+        with use_clock(VirtualClock()):
+            controller = delay_before_sending(a, t=1, length=100)
+        with utils.function_new_thread(lambda: utils.recv_until(b, 1000)):
+            starting_time = time.monotonic()
+            a.sendall(b'a' * 1000)
+            assert controller.elapsed == pytest.approx(10)
+            assert time.monotonic() - starting_time < timeout
+
+
+def test_virtual_clock_delay_line(timeout):
+    "Test that a delay line releases data without waiting with a virtual clock."
+
+    a, b = socket.socketpair()
+    with PatchableSocket.create_from(a) as a, b, use_clock(VirtualClock()):
+        controller = delay_in_transit(a, t=60)
+        starting_time = time.monotonic()
+        a.sendall(b'poorconn')
+        assert utils.recv_until(b, 8) == b'poorconn'
+        assert time.monotonic() - starting_time < timeout
+        assert controller.elapsed >= 60
+        controller.remove()
@@ -0,0 +1,129 @@
+# Copyright (C) 2021  Hong Xu <hong@topbug.net>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import json
+import socket
+import time
+
+import pytest
+import requests
+
+from poorconn._cli import simulation_commands
+from poorconn._config import ListenerConfig, load_config, start_listener
+
+_SIMULATION_COMMANDS = {c.name: c.params for c in simulation_commands}
+
+
+def test_load_config(tmp_path):
+    "Test loading JSON and TOML configuration files."
+
+    path = tmp_path / 'listeners.toml'
+    path.write_text('''
+        [[listeners]]
+        type = "http"
+        port = 9001
+        profile = "3g"
+        http = {ttfb = 0.5}
+        simulations = [{name = "delay_before_sending", t = 1, length = 1024}]
+
+        [[listeners]]
+        type = "proxy"
+        name = "api"
+        port = 9002
+        target = "localhost:8080"
+
+        [[listeners]]
+        type = "tcp"
+        port = 9003
+        mode = "discard"
+        ''')
+    assert load_config(str(path), _SIMULATION_COMMANDS) == [
+        ListenerConfig(type='http', port=9001, name='http:9001', profile='3g', http={'ttfb': 0.5},
+                       simulations=(('delay_before_sending', {'t': 1.0, 'length': 1024}),)),
+        ListenerConfig(type='proxy', port=9002, name='api', target=('localhost', 8080)),
+        ListenerConfig(type='tcp', port=9003, name='tcp:9003', mode='discard')]
+
+    path = tmp_path / 'listeners.json'
+    path.write_text(json.dumps({'listeners': [{'type': 'tcp', 'host': '127.0.0.1', 'port': 9003},
+                                              {'type': 'http', 'port': 9004, 'http': {'stall_after': None}}]}))
+    assert load_config(str(path), _SIMULATION_COMMANDS) == [
+        ListenerConfig(type='tcp', port=9003, host='127.0.0.1', name='tcp:9003'),
+        ListenerConfig(type='http', port=9004, name='http:9004', http={'stall_after': None})]
+
+
+@pytest.mark.parametrize('listener, message', (
+    (1, 'must be a table'),
+    ({'type': 'udp', 'port': 1}, 'unknown type'),
+    ({'type': 'tcp'}, '"port" must be an integer'),
+    ({'type': 'tcp', 'port': 1, 'target': 'localhost:2'}, 'unknown keys'),
+    ({'type': 'tcp', 'port': 1, 'profile': 'nonexistent'}, 'Unknown profile'),
+    ({'type': 'tcp', 'port': 1, 'mode': 'nonexistent'}, 'unknown mode'),
+    ({'type': 'proxy', 'port': 1}, '"target" is missing'),
+    ({'type': 'proxy', 'port': 1, 'target': 'localhost'}, '"target" must be in the form'),
+    ({'type': 'http', 'port': 1, 'http': {'nonexistent': 1}}, 'unknown keys in "http"'),
+    ({'type': 'http', 'port': 1, 'http': {'ttfb': None, 'chunk_size': None}}, 'must not be null: ttfb$'),
+    ({'type': 'http', 'port': 1, 'simulations': [{'name': 'nonexistent'}]}, 'unknown simulation'),
+    ({'type': 'http', 'port': 1, 'simulations': [{'name': 'delay_before_sending'}]}, 'missing'),
+))
+def test_load_config_invalid(tmp_path, listener, message):
+    "Test loading invalid configuration files."
+
+    path = tmp_path / 'listeners.json'
+    path.write_text(json.dumps({'listeners': [listener]}))
+    with pytest.raises(ValueError, match='listener 0: .*' + message):
+        load_config(str(path), _SIMULATION_COMMANDS)
+
+    path.write_text('{')
+    with pytest.raises(ValueError, match='Failed to read'):
+        load_config(str(path), _SIMULATION_COMMANDS)
+    path.write_text(json.dumps({'listeners': []}))
+    with pytest.raises(ValueError, match='must be a non-empty array'):
+        load_config(str(path), _SIMULATION_COMMANDS)
+
+
+def test_start_listener(tmp_path, timeout):
+    "Test starting listeners of all types."
+
+    (tmp_path / 'index.txt').write_text('poorconn')
+    http = start_listener(ListenerConfig(type='http', port=0, directory=str(tmp_path), cache_size=1024,
+                                         http={'ttfb': timeout}))
+    tcp = start_listener(ListenerConfig(type='tcp', port=0, profile='dsl'))
+    proxy = start_listener(ListenerConfig(type='proxy', port=0, target=tcp.address))
+    closed = start_listener(ListenerConfig(type='tcp', port=0, simulations=(('close_upon_acceptance', {}),)))
+    discard = start_listener(ListenerConfig(type='tcp', port=0, mode='discard'))
+    try:
+        starting_time = time.time()
+        response = requests.get('http://{}:{}/index.txt'.format(*http.address), timeout=timeout * 2)
+        assert time.time() - starting_time > timeout
+        assert response.text == 'poorconn'
+
+        for listener in (tcp, proxy):
+            with socket.create_connection(listener.address, timeout=timeout) as s:
+                s.sendall(b'hello')
+                assert s.recv(5) == b'hello'
+
+        with socket.create_connection(closed.address, timeout=timeout) as s:
+            assert s.recv(1) == b''
+
+        with socket.create_connection(discard.address, timeout=timeout) as s:
+            s.sendall(b'poorconn')
+            s.shutdown(socket.SHUT_WR)
+            assert s.recv(1) == b''  # Closed without a response
+    finally:
+        for listener in (http, proxy, tcp, closed, discard):
+            listener.close()
+
+    with pytest.raises(ValueError, match='"target" is missing'):
+        start_listener(ListenerConfig(type='proxy', port=0, name='proxy'))
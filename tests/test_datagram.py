@@ -0,0 +1,176 @@
+# Copyright (C) 2021  Hong Xu <hong@topbug.net>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import socket
+import time
+
+import pytest
+
+from poorconn import (delay_datagrams, drop_datagrams, duplicate_datagrams, make_socket_patchable, PatchableSocket,
+                      reorder_datagrams)
+
+
+@pytest.fixture
+def udp_socks():
+    "A pair of datagram sockets: A patchable sender that is connected to a receiver on localhost."
+
+    with socket.socket(type=socket.SOCK_DGRAM) as receiver:
+        receiver.bind(('localhost', 0))
+        with PatchableSocket(type=socket.SOCK_DGRAM) as sender:
+            sender.connect(receiver.getsockname())
+            yield sender, receiver
+
+
+def recv_datagrams(s: socket.socket, n: int, timeout: float) -> list:
+    "Receive datagrams from ``s`` until ``n`` datagrams are received or ``timeout`` seconds have passed."
+
+    s.settimeout(timeout)
+    datagrams = []
+    try:
+        while len(datagrams) < n:
+            datagrams.append(s.recv(1024))
+    except socket.timeout:
+        pass
+    return datagrams
+
+
+def test_make_socket_patchable():
+    "Test that :func:`poorconn.make_socket_patchable` makes ``sendto`` patchable."
+
+    with socket.socket(type=socket.SOCK_DGRAM) as s:
+        s = make_socket_patchable(s, (':sending',))
+        assert isinstance(s, PatchableSocket)
+        s.close()
+
+
+def test_non_datagram_socket():
+    "Test that datagram simulations reject stream sockets."
+
+    with PatchableSocket() as s:
+        with pytest.raises(ValueError):
+            delay_datagrams(s, t=1)
+
+
+@pytest.mark.parametrize('meth', ('send', 'sendto'))
+def test_delay_datagrams(udp_socks, timeout, meth):
+    "Test :func:`poorconn.delay_datagrams`."
+
+    sender, receiver = udp_socks
+    controller = delay_datagrams(sender, t=timeout / 4)
+    starting_time = time.time()
+    for i in range(100):
+        if meth == 'send':
+            assert sender.send(bytes((i,))) == 1
+        else:
+            assert sender.sendto(bytearray((i,)), receiver.getsockname()) == 1
+    assert time.time() - starting_time < timeout / 8  # Sending returns immediately
+    assert recv_datagrams(receiver, 100, timeout) == [bytes((i,)) for i in range(100)]
+    assert time.time() - starting_time > timeout / 4
+
+    controller.remove()
+    starting_time = time.time()
+    sender.send(b'a')
+    assert recv_datagrams(receiver, 1, timeout) == [b'a']
+    assert time.time() - starting_time < timeout / 8
+
+
+def test_delay_datagrams_jitter(udp_socks, timeout):
+    "Test :func:`poorconn.delay_datagrams` with jitter, which reorders datagrams."
+
+    sender, receiver = udp_socks
+    delay_datagrams(sender, t=0, jitter=timeout / 4)
+    for i in range(100):
+        sender.send(bytes((i,)))
+    datagrams = recv_datagrams(receiver, 100, timeout)
+    assert sorted(datagrams) == [bytes((i,)) for i in range(100)]
+    assert datagrams != sorted(datagrams)
+
+
+def test_delay_datagrams_closed(udp_socks, timeout):
+    "Test that :func:`poorconn.delay_datagrams` loses the datagrams of a socket that is closed before they are sent."
+
+    sender, receiver = udp_socks
+    delay_datagrams(sender, t=timeout / 8)
+    sender.send(b'a')
+    sender.close()
+    assert recv_datagrams(receiver, 1, timeout / 4) == []
+
+    # Other datagrams are still sent
+    with PatchableSocket(type=socket.SOCK_DGRAM) as sender:
+        sender.connect(receiver.getsockname())
+        delay_datagrams(sender, t=timeout / 8)
+        sender.send(b'b')
+        assert recv_datagrams(receiver, 1, timeout) == [b'b']
+
+
+def test_drop_datagrams(udp_socks, timeout):
+    "Test :func:`poorconn.drop_datagrams`."
+
+    sender, receiver = udp_socks
+    controller = drop_datagrams(sender, probability=0.5)
+    for i in range(100):
+        assert sender.send(bytes((i,))) == 1
+    datagrams = recv_datagrams(receiver, 100, timeout / 4)
+    assert 0 < len(datagrams) < 100
+    assert len(datagrams) + controller.dropped == 100
+    assert datagrams == sorted(datagrams)
+
+
+def test_duplicate_datagrams(udp_socks, timeout):
+    "Test :func:`poorconn.duplicate_datagrams`."
+
+    sender, receiver = udp_socks
+    controller = duplicate_datagrams(sender, probability=0.5)
+    for i in range(100):
+        sender.send(bytes((i,)))
+    datagrams = recv_datagrams(receiver, 200, timeout / 4)
+    assert 0 < controller.duplicated < 100
+    assert len(datagrams) == 100 + controller.duplicated
+    assert set(datagrams) == {bytes((i,)) for i in range(100)}
+
+
+def test_reorder_datagrams(udp_socks, timeout):
+    "Test :func:`poorconn.reorder_datagrams`."
+
+    sender, receiver = udp_socks
+    controller = reorder_datagrams(sender, buffer_size=4, max_hold=timeout / 4)
+    for i in range(100):
+        sender.send(bytes((i,)))
+    datagrams = recv_datagrams(receiver, 96, timeout / 8)
+    assert len(datagrams) == 96  # The buffer holds the rest
+    for index, datagram in enumerate(datagrams):
+        assert datagram[0] <= index + 4  # A datagram is overtaken by at most 4 datagrams sent after it
+    assert datagrams != sorted(datagrams)
+    # The held datagrams are released after max_hold
+    datagrams.extend(recv_datagrams(receiver, 4, timeout))
+    assert sorted(datagrams) == [bytes((i,)) for i in range(100)]
+
+    # Removing the controller sends the held datagrams
+    sender.send(b'a')
+    controller.remove()
+    assert recv_datagrams(receiver, 1, timeout / 8) == [b'a']
+
+
+@pytest.mark.skipif(not hasattr(socket.socket, 'sendmsg'), reason='socket.sendmsg is unavailable')
+def test_delay_datagrams_sendmsg(udp_socks, timeout):
+    "Test :func:`poorconn.delay_datagrams` with ``sendmsg``, which sends a sequence of buffers as one datagram."
+
+    sender, receiver = udp_socks
+    delay_datagrams(sender, t=timeout / 4)
+    buffer = bytearray(b'poor')
+    assert sender.sendmsg([buffer, b'conn']) == 8
+    buffer[:] = b'good'  # The datagram has been copied
+    assert recv_datagrams(receiver, 1, timeout) == [b'poorconn']
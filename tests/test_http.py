@@ -0,0 +1,510 @@
+# Copyright (C) 2021  Hong Xu <hong@topbug.net>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import errno
+import functools
+from http.server import BaseHTTPRequestHandler, HTTPServer, SimpleHTTPRequestHandler, ThreadingHTTPServer
+import os
+import pathlib
+import socket
+import threading
+import time
+
+import pytest
+import requests
+
+from poorconn import FileCache, HTTPRequestHandler, slow_down_http_responses
+from poorconn._http import _parse_range
+
+import utils
+
+
+@pytest.fixture
+def http_1_1_server():
+    "A :class:`ThreadingHTTPServer` object with :class:`HTTPRequestHandler` that serves on localhost:8000."
+
+    with ThreadingHTTPServer(('localhost', 8000), HTTPRequestHandler) as httpd:
+        utils.set_server_socket_options(httpd.socket)
+        yield httpd
+        httpd.shutdown()
+
+
+def _request(url: str, version: str = 'HTTP/1.0'):
+    "Send a GET request with a raw socket, and return the times of the first byte, the end of the header, and the end."
+
+    with socket.create_connection(('localhost', 8000)) as s:
+        starting_time = time.time()
+        s.sendall(f'GET {url} {version}\r\nHost: localhost\r\nConnection: close\r\n\r\n'.encode())
+        content = s.recv(1)
+        first_byte = time.time() - starting_time
+        while b'\r\n\r\n' not in content:
+            content += s.recv(1)
+        header_end = time.time() - starting_time
+        while True:
+            data = s.recv(4096)
+            if not data:
+                break
+            content += data
+        return content, first_byte, header_end, time.time() - starting_time
+
+
+def test_ttfb_and_header_delay(http_server, timeout):
+    "Test delaying the status line and the header lines."
+
+    controller = slow_down_http_responses(http_server, ttfb=timeout, header_delay=0.2)
+    utils.httpd_serve_new_thread(http_server)
+
+    content, first_byte, header_end, _ = _request('/setup.py')
+    header, body = content.split(b'\r\n\r\n', 1)
+    assert first_byte > timeout
+    # The status line, the header lines, and the empty line
+    assert header_end - first_byte > 0.2 * (len(header.split(b'\r\n')) - 1) + 0.2
+    assert body == pathlib.Path('setup.py').read_bytes()
+    assert controller.responses == 1
+
+    # Updating the controller affects later responses
+    controller.ttfb = controller.header_delay = 0
+    _, first_byte, header_end, _ = _request('/setup.py')
+    assert header_end < timeout
+
+
+def test_responses_concurrent(http_1_1_server, timeout):
+    "Test counting the responses of a threading server that handles requests concurrently."
+
+    controller = slow_down_http_responses(http_1_1_server, ttfb=timeout / 4)
+    utils.httpd_serve_new_thread(http_1_1_server)
+    clients = [threading.Thread(target=_request, args=('/setup.py',), name='Client thread', daemon=True)
+               for _ in range(16)]
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join()
+    assert controller.responses == 16
+
+
+def test_chunked_body(http_server, http_url, timeout):
+    "Test sending bodies in paced chunks with the chunked transfer encoding."
+
+    controller = slow_down_http_responses(http_server, chunk_size=512, chunk_delay=timeout / 4)
+    utils.httpd_serve_new_thread(http_server)
+
+    starting_time = time.time()
+    response = requests.get(f'{http_url}/setup.py', timeout=timeout * 2)
+    assert time.time() - starting_time > timeout  # 5 chunks
+    assert response.headers['Transfer-Encoding'] == 'chunked'
+    assert 'Content-Length' not in response.headers
+    assert response.headers['Connection'] == 'close'
+    assert response.content == pathlib.Path('setup.py').read_bytes()
+    assert controller.pacer.waits == 4
+
+    # Chunks are received one by one
+    response = requests.get(f'{http_url}/setup.py', stream=True, timeout=timeout * 2)
+    assert len(next(response.iter_content(chunk_size=None))) == 512
+
+    # Errors are not chunked
+    response = requests.get(f'{http_url}/nonexistent', timeout=timeout)
+    assert response.status_code == 404
+    assert 'Transfer-Encoding' not in response.headers
+
+
+def test_concurrent_chunked_bodies(http_1_1_server, timeout):
+    "Test that bodies sent concurrently are paced on their own schedules."
+
+    controller = slow_down_http_responses(http_1_1_server, chunk_size=100, chunk_delay=timeout / 10)
+    utils.httpd_serve_new_thread(http_1_1_server)
+
+    durations = []
+
+    def get():
+        starting_time = time.time()
+        assert len(requests.get('http://localhost:8000/bytes/1000', timeout=timeout * 3).content) == 1000
+        durations.append(time.time() - starting_time)
+
+    with utils.function_new_thread(get), utils.function_new_thread(get):
+        pass
+    assert len(durations) == 2
+    assert all(timeout * 0.9 <= duration < timeout * 1.5 for duration in durations)  # 9 delays each
+    assert controller.pacer.waits == 18
+
+
+def test_paced_body_http_1_0(http_server, timeout):
+    "Test that bodies are paced without the chunked transfer encoding for HTTP/1.0 requests."
+
+    slow_down_http_responses(http_server, chunk_size=512, chunk_delay=timeout / 4)
+    utils.httpd_serve_new_thread(http_server)
+
+    content, _, header_end, end = _request('/setup.py')
+    header, body = content.split(b'\r\n\r\n', 1)
+    assert header.startswith(b'HTTP/1.0 200')
+    assert b'Transfer-Encoding' not in header
+    assert end - header_end > timeout
+    assert body == pathlib.Path('setup.py').read_bytes()
+
+
+def test_stall(http_server, timeout):
+    "Test stalling in the middle of bodies."
+
+    slow_down_http_responses(http_server, stall_after=100, stall=timeout)
+    utils.httpd_serve_new_thread(http_server)
+
+    with socket.create_connection(('localhost', 8000)) as s:
+        s.sendall(b'GET /setup.py HTTP/1.0\r\n\r\n')
+        s.settimeout(timeout / 2)
+        content = b''
+        while b'\r\n\r\n' not in content or len(content.split(b'\r\n\r\n', 1)[1]) < 100:
+            content += s.recv(4096)
+        assert len(content.split(b'\r\n\r\n', 1)[1]) == 100
+        with pytest.raises(socket.timeout):
+            s.recv(4096)
+        s.settimeout(timeout)
+        assert s.recv(4096)
+
+
+def test_remove(http_server):
+    "Test removing the simulation and invalid servers."
+
+    utils.httpd_serve_new_thread(http_server)
+    controller = slow_down_http_responses(http_server, ttfb=1)
+    assert http_server.RequestHandlerClass is not SimpleHTTPRequestHandler
+    with pytest.raises(ValueError):
+        slow_down_http_responses(http_server)
+    controller.remove()
+    assert http_server.RequestHandlerClass is SimpleHTTPRequestHandler
+
+    with HTTPServer(('localhost', 0), BaseHTTPRequestHandler) as httpd:
+        with pytest.raises(TypeError):
+            slow_down_http_responses(httpd)
+
+
+def _read_response(f):
+    "Read a response with a body of ``Content-Length`` bytes from the file object ``f``."
+
+    status = f.readline()
+    headers = {}
+    while True:
+        line = f.readline()
+        if line == b'\r\n':
+            break
+        name, _, value = line.decode().partition(':')
+        headers[name.lower()] = value.strip()
+    return status, headers, f.read(int(headers['content-length']))
+
+
+def test_keep_alive_and_pipelining(http_1_1_server, timeout):
+    "Test that connections persist across requests, and pipelined requests are answered in order."
+
+    http_server = http_1_1_server
+    slow_down_http_responses(http_server, ttfb=timeout / 4)
+    utils.httpd_serve_new_thread(http_server)
+    content = pathlib.Path('setup.py').read_bytes()
+
+    with socket.create_connection(('localhost', 8000)) as s, s.makefile('rb') as f:
+        s.settimeout(timeout * 2)
+        starting_time = time.time()
+        s.sendall(b'GET /setup.py HTTP/1.1\r\nHost: localhost\r\n\r\n'
+                  b'GET /setup.py HTTP/1.1\r\nHost: localhost\r\nRange: bytes=0-9\r\n\r\n')
+        status, _, body = _read_response(f)
+        assert status.startswith(b'HTTP/1.1 200') and body == content
+        status, _, body = _read_response(f)
+        assert status.startswith(b'HTTP/1.1 206') and body == content[:10]
+        assert time.time() - starting_time > timeout / 2
+
+        # Still open
+        s.sendall(b'HEAD /setup.py HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n')
+        assert f.readline().startswith(b'HTTP/1.1 200')
+        while f.readline() != b'\r\n':
+            pass
+        assert f.read() == b''  # Closed as requested
+
+
+@pytest.mark.parametrize('value, expected', (('bytes=10-19', (10, 19)),
+                                             ('bytes=10-', (10, 99)),
+                                             ('bytes=-5', (95, 99)),
+                                             ('bytes=-500', (0, 99)),
+                                             ('bytes=90-500', (90, 99)),
+                                             (' Bytes = 1 - 2 ', (1, 2)),
+                                             ('bytes=0-1,3-4', None),
+                                             ('bytes=5-4', None),
+                                             ('bytes=-', None),
+                                             ('items=0-1', None),
+                                             ('bytes=a-b', None)))
+def test_parse_range(value, expected):
+    "Test parsing the ``Range`` header."
+
+    assert _parse_range(value, 100) == expected
+
+
+@pytest.mark.parametrize('value', ('bytes=100-', 'bytes=-0'))
+def test_parse_range_unsatisfiable(value):
+    "Test parsing unsatisfiable ranges."
+
+    with pytest.raises(ValueError):
+        _parse_range(value, 100)
+
+
+def test_range(http_1_1_server, timeout):
+    "Test serving byte ranges of files."
+
+    utils.httpd_serve_new_thread(http_1_1_server)
+    content = pathlib.Path('setup.py').read_bytes()
+    http_url = 'http://localhost:8000'
+    url = f'{http_url}/setup.py'
+
+    response = requests.get(url, headers={'Range': 'bytes=10-19'}, timeout=timeout)
+    assert response.status_code == 206
+    assert response.content == content[10:20]
+    assert response.headers['Content-Range'] == f'bytes 10-19/{len(content)}'
+    last_modified = response.headers['Last-Modified']
+
+    response = requests.get(url, headers={'Range': 'bytes=-5'}, timeout=timeout)
+    assert response.status_code == 206
+    assert response.content == content[-5:]
+
+    response = requests.get(url, headers={'Range': f'bytes={len(content)}-'}, timeout=timeout)
+    assert response.status_code == 416
+    assert response.headers['Content-Range'] == f'bytes */{len(content)}'
+
+    # Ignored
+    response = requests.get(url, headers={'Range': 'bytes=0-1,3-4'}, timeout=timeout)
+    assert response.status_code == 200
+    assert response.content == content
+    response = requests.get(url, headers={'Range': 'bytes=0-1', 'If-Range': 'Thu, 01 Jan 1970 00:00:00 GMT'},
+                            timeout=timeout)
+    assert response.status_code == 200
+    assert response.content == content
+
+    response = requests.get(url, headers={'Range': 'bytes=0-1', 'If-Range': last_modified}, timeout=timeout)
+    assert response.status_code == 206
+    assert response.content == content[:2]
+    response = requests.get(f'{http_url}/nonexistent', headers={'Range': 'bytes=0-1'}, timeout=timeout)
+    assert response.status_code == 404
+
+
+def test_resume_under_throttling(http_1_1_server, timeout):
+    "Test resuming a download with a persistent connection under throttling."
+
+    slow_down_http_responses(http_1_1_server, chunk_size=1024, chunk_delay=timeout / 4)
+    utils.httpd_serve_new_thread(http_1_1_server)
+    http_url = 'http://localhost:8000'
+    content = pathlib.Path('setup.py').read_bytes()
+
+    with requests.Session() as session:
+        response = session.get(f'{http_url}/setup.py', stream=True, timeout=timeout)
+        assert response.headers['Transfer-Encoding'] == 'chunked'
+        assert 'Connection' not in response.headers
+        first_chunk = next(response.iter_content(chunk_size=None))
+        response.close()
+        response = session.get(f'{http_url}/setup.py', headers={'Range': f'bytes={len(first_chunk)}-'},
+                               timeout=timeout * 2)
+        assert response.status_code == 206
+        assert first_chunk + response.content == content
+
+
+@pytest.mark.parametrize('length', (0, 1, 300, 5 * 1024 * 1024 + 7))
+def test_bytes(http_1_1_server, length, timeout):
+    "Test endpoint ``/bytes/<n>``."
+
+    utils.httpd_serve_new_thread(http_1_1_server)
+
+    response = requests.get(f'http://localhost:8000/bytes/{length}', timeout=timeout)
+    assert response.status_code == 200
+    assert response.headers['Content-Length'] == str(length)
+    assert response.content == bytes(i % 256 for i in range(length))
+
+
+def _read_all(request: bytes) -> bytes:
+    "Send ``request`` to localhost:8000 and receive until the connection is closed."
+
+    with socket.create_connection(('localhost', 8000)) as s:
+        s.sendall(request)
+        content = b''
+        while True:
+            data = s.recv(65536)
+            if not data:
+                return content
+            content += data
+
+
+def test_stream(http_1_1_server):
+    "Test endpoint ``/stream/<n>``."
+
+    utils.httpd_serve_new_thread(http_1_1_server)
+
+    header, body = _read_all(b'GET /stream/2500?chunk=1000 HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n'
+                             ).split(b'\r\n\r\n', 1)
+    assert b'Transfer-Encoding: chunked' in header
+    chunks = []
+    while True:
+        size, _, body = body.partition(b'\r\n')
+        if int(size, 16) == 0:
+            break
+        chunks.append(body[:int(size, 16)])
+        body = body[int(size, 16) + 2:]
+    assert [len(chunk) for chunk in chunks] == [1000, 1000, 500]
+    assert b''.join(chunks) == bytes(i % 256 for i in range(2500))
+
+    # Not chunked for HTTP/1.0
+    header, body = _read_all(b'GET /stream/2500 HTTP/1.0\r\n\r\n').split(b'\r\n\r\n', 1)
+    assert b'Content-Length: 2500' in header
+    assert body == bytes(i % 256 for i in range(2500))
+
+
+def test_drip(http_1_1_server, timeout):
+    "Test endpoint ``/drip``."
+
+    utils.httpd_serve_new_thread(http_1_1_server)
+
+    content, first_byte, header_end, end = _request(f'/drip?numbytes=4&duration={timeout}&delay={timeout / 2}')
+    header, body = content.split(b'\r\n\r\n', 1)
+    assert first_byte > timeout / 2
+    assert b'Content-Length: 4' in header
+    assert body == bytes((0, 1, 2, 3))
+    assert end - header_end > timeout * 3 / 4
+
+
+@pytest.mark.parametrize('path', ('/bytes/-1', '/bytes/a', '/bytes/1/2', '/stream/10?chunk=0', '/drip/1',
+                                  '/drip?duration=-1', '/drip?numbytes=a'))
+def test_synthetic_endpoints_bad_request(http_1_1_server, path, timeout):
+    "Test invalid requests to synthetic endpoints."
+
+    utils.httpd_serve_new_thread(http_1_1_server)
+
+    assert requests.get(f'http://localhost:8000{path}', timeout=timeout).status_code == 400
+
+
+@pytest.mark.parametrize('path', ('/bytes/3000', '/stream/3000?chunk=700'))
+def test_synthetic_endpoints_slowed_down(http_1_1_server, path, timeout):
+    "Test synthetic endpoints whose responses are slowed down."
+
+    slow_down_http_responses(http_1_1_server, chunk_size=1024, stall_after=2000, stall=timeout / 4)
+    utils.httpd_serve_new_thread(http_1_1_server)
+
+    starting_time = time.time()
+    response = requests.get(f'http://localhost:8000{path}', timeout=timeout)
+    assert time.time() - starting_time > timeout / 4
+    assert response.headers['Transfer-Encoding'] == 'chunked'
+    assert response.content == bytes(i % 256 for i in range(3000))
+
+
+def test_file_cache(tmp_path, monkeypatch):
+    "Test caching files, invalidating changed files, and evicting the least recently used files."
+
+    cache = FileCache(max_size=10)
+    (tmp_path / 'a').write_bytes(b'aaaa')
+    (tmp_path / 'b').write_bytes(b'bbbb')
+    (tmp_path / 'large').write_bytes(b'l' * 11)
+
+    assert cache.get(str(tmp_path / 'a'))[0] == b'aaaa'
+    assert cache.get(str(tmp_path / 'a'))[0] == b'aaaa'
+    assert (cache.hits, cache.misses, cache.size, len(cache)) == (1, 1, 4, 1)
+    assert cache.get(str(tmp_path / 'large')) is None
+    assert len(cache) == 1
+
+    # Changed files are read again
+    (tmp_path / 'a').write_bytes(b'aaaaa')
+    assert cache.get(str(tmp_path / 'a'))[0] == b'aaaaa'
+    assert (cache.size, len(cache)) == (5, 1)
+
+    cache.get(str(tmp_path / 'b'))
+    cache.get(str(tmp_path / 'a'))  # Now b is the least recently used
+    (tmp_path / 'c').write_bytes(b'cc')
+    cache.get(str(tmp_path / 'c'))
+    assert (cache.size, len(cache)) == (7, 2)
+    misses = cache.misses
+    cache.get(str(tmp_path / 'a'))
+    assert cache.misses == misses
+    cache.get(str(tmp_path / 'b'))
+    assert cache.misses == misses + 1
+
+    with pytest.raises(OSError):
+        cache.get(str(tmp_path / 'nonexistent'))
+
+    # Files that are being modified while they are read are not cached
+    fstat = os.fstat
+
+    def growing_fstat(fd):
+        fs = fstat(fd)
+        return os.stat_result(fs[:6] + (fs.st_size + 1,) + fs[7:])
+
+    monkeypatch.setattr(os, 'fstat', growing_fstat)
+    (tmp_path / 'd').write_bytes(b'd')
+    assert cache.get(str(tmp_path / 'd')) is None
+    assert len(cache) == 2
+
+
+def test_file_cache_serving(http_1_1_server, tmp_path, monkeypatch, timeout):
+    "Test serving files from a cache."
+
+    http_1_1_server.RequestHandlerClass = functools.partial(HTTPRequestHandler, directory=str(tmp_path))
+    http_1_1_server.file_cache = FileCache(max_size=1024 * 1024)
+    utils.httpd_serve_new_thread(http_1_1_server)
+    (tmp_path / 'file').write_bytes(b'0123456789')
+    url = 'http://localhost:8000/file'
+
+    with requests.Session() as session:
+        for _ in range(3):
+            response = session.get(url, timeout=timeout)
+            assert response.content == b'0123456789'
+        last_modified = response.headers['Last-Modified']
+        assert (http_1_1_server.file_cache.hits, http_1_1_server.file_cache.misses) == (2, 1)
+
+        response = session.get(url, headers={'Range': 'bytes=2-4'}, timeout=timeout)
+        assert response.status_code == 206
+        assert response.content == b'234'
+        response = session.get(url, headers={'If-Modified-Since': last_modified}, timeout=timeout)
+        assert response.status_code == 304
+        for if_modified_since, status_code in (('Thu, 01 Jan 2970 00:00:00 -0000', 304),  # No time zone
+                                               ('Thu, 01 Jan 2970 00:00:00 +0100', 200),  # Not UTC
+                                               ('poorconn', 200)):
+            response = session.get(url, headers={'If-Modified-Since': if_modified_since}, timeout=timeout)
+            assert response.status_code == status_code
+
+        # Unreadable files are reported as by SimpleHTTPRequestHandler
+        def unreadable_open(path, *args, **kwargs):
+            if str(path).endswith('unreadable'):
+                raise PermissionError(errno.EACCES, 'Permission denied')
+            return open(path, *args, **kwargs)
+
+        (tmp_path / 'unreadable').write_bytes(b'a')
+        monkeypatch.setattr('poorconn._http.open', unreadable_open, raising=False)
+        monkeypatch.setattr('http.server.open', unreadable_open, raising=False)
+        response = session.get('http://localhost:8000/unreadable', timeout=timeout)
+        assert response.status_code == 404
+
+        # Modified
+        (tmp_path / 'file').write_bytes(b'abc')
+        os.utime(tmp_path / 'file', (0, 0))
+        response = session.get(url, timeout=timeout)
+        assert response.content == b'abc'
+        assert response.headers['Last-Modified'] == 'Thu, 01 Jan 1970 00:00:00 GMT'
+
+
+def test_file_head_error(http_1_1_server, tmp_path, monkeypatch, timeout):
+    "Test that the file of a response is closed if sending the header fails."
+
+    bodies = []
+
+    def send_file_head(self, path, body, fs):
+        bodies.append(body)
+        raise ConnectionResetError(errno.ECONNRESET, 'Connection reset by peer')
+
+    monkeypatch.setattr(HTTPRequestHandler, '_send_file_head', send_file_head)
+    http_1_1_server.RequestHandlerClass = functools.partial(HTTPRequestHandler, directory=str(tmp_path))
+    utils.httpd_serve_new_thread(http_1_1_server)
+    (tmp_path / 'file').write_bytes(b'poorconn')
+    with pytest.raises(requests.ConnectionError):
+        requests.get('http://localhost:8000/file', timeout=timeout)
+    assert bodies[0].closed
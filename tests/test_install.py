@@ -0,0 +1,147 @@
+# Copyright (C) 2021  Hong Xu <hong@topbug.net>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import pathlib
+import socket
+import time
+
+import pytest
+import requests
+
+from poorconn import get_profile, install, PatchableSocket, Profile, profiles
+from poorconn._install import _Pattern
+
+import utils
+
+
+def test_get_profile():
+    "Test :func:`poorconn.get_profile`."
+
+    assert get_profile('3g') is profiles['3g']
+    profile = Profile('mine', rate=1024)
+    assert get_profile(profile) is profile
+    with pytest.raises(ValueError, match='Available profiles'):
+        get_profile('nonexistent')
+
+
+def test_profile_apply(timeout):
+    "Test :meth:`poorconn.Profile.apply`."
+
+    a, b = socket.socketpair()
+    with PatchableSocket.create_from(a) as a, b:
+        controller = Profile('mine', rate=4 / (timeout / 4), latency=timeout / 4, mss=4).apply(a)
+        assert len(controller.controllers) == 2
+        starting_time = time.time()
+        a.sendall(b'poorconn')  # Two slices
+        assert timeout / 2 < time.time() - starting_time < timeout * 3 / 4
+        assert utils.recv_until(b, 8) == b'poorconn'  # Latency in transit
+        assert time.time() - starting_time > timeout * 3 / 4
+        controller.remove()
+        assert 'sendall' not in vars(a)
+
+
+@pytest.mark.parametrize('match,matched', (
+    (None, True),
+    ('localhost', True),
+    ('127.0.0.1', True),
+    ('127.0.0.0/8', True),
+    ('10.0.0.0/8', False),
+    (':8000', True),
+    (':8001', False),
+    ('localhost:8000', True),
+    ('127.0.0.1:8001', False),
+    ('[::1]:8000', False),
+    ('::1', False),
+    (('10.0.0.0/8', ':8000'), True),
+    (('10.0.0.0/8', ':8001'), False),
+    (lambda host, port: port == 8000, True),
+))
+def test_install(http_server, http_url, timeout, match, matched):
+    "Test :func:`poorconn.install`."
+
+    utils.httpd_serve_new_thread(http_server)
+    original_socket_class = socket.socket
+    with socket.socket() as existing_sock:
+        controller = install(Profile('mine', latency=timeout), match=match)
+        # Type checks are not affected
+        assert socket.socket is original_socket_class
+        assert isinstance(existing_sock, socket.socket)
+    try:
+        with socket.create_connection(('127.0.0.1', 8000)) as s:
+            assert isinstance(s, socket.socket)
+            assert ('sendall' in vars(s)) == matched
+        starting_time = time.time()
+        content = requests.get(f'{http_url}/setup.py').content
+        ending_time = time.time()
+        assert content == pathlib.Path('setup.py').read_bytes()
+        assert (ending_time - starting_time > timeout) == matched
+        assert controller.connections == (2 if matched else 0)
+        assert (controller.bytes_sent > 0) == matched
+        assert controller.metrics()['bytes_sent'] == controller.bytes_sent
+    finally:
+        controller.remove()
+    with socket.socket() as s:
+        assert type(s) is original_socket_class
+
+
+def test_install_pattern(monkeypatch):
+    "Test the destination patterns of :func:`poorconn.install` with host names."
+
+    pattern = _Pattern('Localhost')
+    assert pattern.match('localhost', 1)  # By name
+    assert pattern.match('127.0.0.1', 1)  # By resolved address
+    assert not pattern.match('example.com', 1)
+
+    def getaddrinfo(*args, **kwargs):
+        raise socket.gaierror('Name or service not known')
+
+    monkeypatch.setattr(socket, 'getaddrinfo', getaddrinfo)
+    pattern = _Pattern('nonexistent.invalid:80')
+    assert pattern.networks == []
+    assert pattern.match('nonexistent.invalid', 80)
+    assert not pattern.match('127.0.0.1', 80)
+
+
+def test_install_multiple(timeout):
+    "Test :func:`poorconn.install` with multiple installations."
+
+    controller_1 = install(Profile('1', latency=timeout), match=':1')
+    controller_2 = install(Profile('2', latency=timeout), match=':2')
+    with socket.socket() as s:
+        s.connect_ex(('127.0.0.1', 1))  # Shaped even though the connection is refused
+        assert controller_1.connections == 1
+    with socket.socket() as s:
+        s._poorconn_decide(('127.0.0.1', 2))
+        s._poorconn_decide(('127.0.0.1', 1))  # Only the first destination is considered
+        assert controller_1.connections == 1
+        assert controller_2.connections == 1
+        assert 'sendall' in vars(s)
+        controller_1.remove()
+        with socket.socket() as new_sock:
+            assert type(new_sock) is not socket.socket
+        controller_2.remove()
+        with socket.socket() as new_sock:
+            assert type(new_sock) is socket.socket
+        assert 'sendall' not in vars(s)  # Shaped sockets are restored
+
+    # Unix sockets are never shaped
+    controller = install(Profile('mine', latency=timeout))
+    try:
+        a, b = socket.socketpair()
+        with a, b:
+            a._poorconn_decide('/path')
+            assert 'sendall' not in vars(a)
+    finally:
+        controller.remove()
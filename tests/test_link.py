@@ -0,0 +1,183 @@
+# Copyright (C) 2021  Hong Xu <hong@topbug.net>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import socket
+import threading
+
+import pytest
+
+from poorconn import (delay_before_sending,
+                      delay_in_transit,
+                      limit_link_rate,
+                      simulated_socketpair,
+                      use_clock,
+                      VirtualClock)
+
+import utils
+
+
+def test_simulated_socketpair():
+    "Test the sockets returned by :func:`poorconn.simulated_socketpair`."
+
+    a, b = simulated_socketpair(buffer_size=8)
+    with a, b:
+        assert a.getpeername() == b.getsockname() == 'simulated-b'
+        assert a.send(b'poorconn!') == 8  # Limited by the buffer
+        assert b.recv(4) == b'poor'
+        assert b.recv(100) == b'conn'
+        assert a.sendmsg([b'po', b'or']) == 4
+        assert utils.recv_until(b, 4) == b'poor'
+
+        # Timeouts
+        b.setblocking(False)
+        with pytest.raises(BlockingIOError):
+            b.recv(1)
+        b.settimeout(0.01)
+        with pytest.raises(socket.timeout):
+            b.recv(1)
+        a.settimeout(0.01)
+        a.sendall(b'a' * 8)
+        with pytest.raises(socket.timeout):
+            a.sendall(b'a')
+        a.settimeout(None)
+        b.settimeout(None)
+        assert b.recv(100) == b'a' * 8
+
+        # File objects keep the connection open after closing
+        f = b.makefile('rwb')
+        b.close()
+        a.sendall(b'poor\nco')
+        assert f.readline() == b'poor\n'
+        f.write(b'poorconn')
+        f.flush()
+        assert utils.recv_until(a, 8) == b'poorconn'
+        f.close()
+        assert a.recv(1) == b''  # EOF
+        with pytest.raises(BrokenPipeError):
+            a.send(b'a')
+        with pytest.raises(OSError):
+            b.recv(1)
+
+
+def test_simulated_socketpair_interface():
+    "Test the less common parts of the interface of the sockets returned by :func:`poorconn.simulated_socketpair`."
+
+    a, b = simulated_socketpair(buffer_size=8)
+    with a, b:
+        assert repr(a) == '<SimulatedSocket simulated-a>'
+        assert a.fileno() == -1
+
+        # Timeouts and blocking
+        with pytest.raises(ValueError):
+            a.settimeout(-1)
+        assert a.getblocking()
+        a.setblocking(False)
+        assert not a.getblocking() and a.gettimeout() == 0
+        a.setblocking(True)
+
+        # Buffer sizes
+        a.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4)
+        assert a.getsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF) == 4
+        assert b.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF) == 4
+        assert a.send(b'poorconn') == 4
+        b.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 8)
+        assert a.send(b'conn') == 4
+        for meth, args in (('getsockopt', ()), ('setsockopt', (1,))):
+            with pytest.raises(OSError):
+                getattr(a, meth)(socket.SOL_SOCKET, socket.SO_KEEPALIVE, *args)
+
+        # Ancillary data and addresses are unsupported
+        with pytest.raises(OSError):
+            a.sendmsg([b'a'], [], 0, 'simulated-b')
+
+        buffer = bytearray(8)
+        assert b.recv_into(buffer, 4) == 4
+        assert buffer[:4] == b'poor'
+        assert b.recv(8) == b'conn'
+
+        # File objects of all modes
+        with pytest.raises(ValueError):
+            a.makefile('rx')
+        with pytest.raises(ValueError):
+            a.makefile('r', buffering=0)
+        with a.makefile('wb', buffering=0) as raw, a.makefile('w') as text:
+            raw.write(b'poor')
+            text.write('co\n')  # Both fit in the buffer
+        with b.makefile('rb') as f:
+            assert f.readline() == b'poorco\n'
+
+        # Shutting down reading
+        b.shutdown(socket.SHUT_RD)
+        assert b.recv(1) == b''
+        with pytest.raises(BrokenPipeError):
+            a.send(b'a')
+    with pytest.raises(OSError):
+        a.getsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF)
+
+
+def test_simulated_socketpair_simulations(timeout):
+    "Test simulations on both directions of simulated connections in parallel with a virtual clock."
+
+    def run(results):
+        a, b = simulated_socketpair()
+        with a, b:
+            controllers = delay_before_sending(a, t=1, length=1000), limit_link_rate(b, rate=1000)
+            with utils.function_new_thread(lambda: utils.recv_until(b, 100_000)):
+                a.sendall(b'a' * 100_000)
+            with utils.function_new_thread(lambda: b.sendall(b'a' * 10_000)):
+                assert utils.recv_until(a, 10_000) == b'a' * 10_000
+            results.append(controllers)
+
+    results = []
+    with use_clock(VirtualClock()) as clock:
+        threads = [threading.Thread(target=run, args=(results,)) for _ in range(100)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout)
+            assert not thread.is_alive()
+    assert len(results) == 100
+    for sending, receiving in results:  # Each connection spends 100 seconds sending and 10 seconds receiving
+        assert sending.elapsed == pytest.approx(100)
+        assert receiving.elapsed == pytest.approx(10)
+    assert clock.elapsed >= 100 + 10
+
+
+def test_simulated_socketpair_kernel_queue(timeout):
+    "Test that pacing the kernel queue and sizing the send buffer are skipped for simulated connections."
+
+    a, b = simulated_socketpair()
+    with a, b, use_clock(VirtualClock()):
+        capacity = a.getsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF)
+        controller = limit_link_rate(a, rate=1000, pace_kernel_queue=True)
+        with utils.function_new_thread(lambda: utils.recv_until(b, 10_000)):
+            a.sendall(b'a' * 10_000)
+        assert controller.elapsed == pytest.approx(10)
+        controller.remove()
+        assert a.getsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF) == capacity
+
+
+def test_simulated_socketpair_delay_line(timeout):
+    "Test a delay line on a simulated connection."
+
+    a, b = simulated_socketpair(buffer_size=4)
+    with a, b:
+        a.setblocking(False)  # Releasing data waits for the buffer to have room anyway
+        controller = delay_in_transit(a, t=timeout / 4)
+        a.sendall(b'poorconn')  # Not blocked by the buffer
+        assert utils.recv_until(b, 8) == b'poorconn'
+        assert controller.elapsed >= timeout / 4
+        controller.remove()
@@ -0,0 +1,165 @@
+# Copyright (C) 2021  Hong Xu <hong@topbug.net>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from http.server import ThreadingHTTPServer
+import json
+import socket
+import struct
+import threading
+
+import pytest
+
+from poorconn import HTTPRequestHandler
+from poorconn._cli import main
+from poorconn._loadgen import loadgen
+
+
+class _UploadHTTPRequestHandler(HTTPRequestHandler):
+    "Also accepts uploads with POST."
+
+    def do_GET(self):
+        """Also sends malformed, unterminated and truncated responses, chunked responses with trailers, and resets
+        connections."""
+
+        if self.path == '/reset':
+            self.request.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+            self.request.close()
+            self.close_connection = True
+            return
+        responses = {
+            '/malformed': b'garbage\r\n',
+            '/eof': b'HTTP/1.0 200 OK\r\n\r\nuntil EOF',
+            '/truncated': b'HTTP/1.1 200 OK\r\nContent-Length: 10\r\n\r\nshort',
+        }
+        if self.path == '/trailers':  # The connection is kept alive
+            self.wfile.write(b'HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n'
+                             b'8\r\npoorconn\r\n0\r\nExpires: never\r\nX-Checksum: 1\r\n\r\n')
+            return
+        if self.path not in responses:
+            super().do_GET()
+            return
+        self.wfile.write(responses[self.path])
+        self.close_connection = True
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        self.send_response(201)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+
+class _HTTPServer(ThreadingHTTPServer):
+    "Accepts many concurrent connections."
+
+    request_queue_size = 128
+
+
+@pytest.fixture
+def url():
+    "URL of a running HTTP/1.1 server."
+
+    with _HTTPServer(('localhost', 0), _UploadHTTPRequestHandler) as httpd:
+        thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+        thread.start()
+        yield 'http://localhost:{}'.format(httpd.server_address[1])
+        httpd.shutdown()
+
+
+def test_loadgen(url):
+    "Test making requests from concurrent connections."
+
+    report = loadgen(f'{url}/bytes/1000', connections=20, requests=3)
+    assert report.requests == 60
+    assert report.errors == {}
+    assert report.error_rate == 0
+    assert report.bytes_received > 60 * 1000
+    assert report.throughput > 0
+    assert set(report.latency) == {'min', 'mean', 'max', 'p50', 'p95', 'p99'}
+
+    report = loadgen(url, requests=4, paths=['/stream/1000?chunk=100', '/nonexistent'], headers=['Accept: */*'])
+    assert report.errors == {'HTTP 404': 2}
+    assert report.error_rate == 0.5
+
+    assert loadgen(f'{url}?x=1').errors == {}  # The request target is /?x=1
+
+
+def test_loadgen_shaping(url, timeout):
+    "Test slow uploads, slow reading and latency."
+
+    report = loadgen(url, method='POST', body_size=timeout * 10000, rate=10000)
+    assert report.errors == {}
+    assert report.latency['min'] > timeout * 0.9
+    assert report.bytes_sent > timeout * 10000
+
+    report = loadgen(f'{url}/bytes/{timeout * 50000}', connections=2, read_rate=50000)
+    assert report.errors == {}
+    assert report.latency['min'] > timeout * 0.9
+
+    report = loadgen(f'{url}/bytes/10', profile='dsl', latency=timeout)
+    assert report.latency['min'] > timeout
+
+
+def test_loadgen_responses(url):
+    "Test reading responses that are not terminated by their length, and malformed responses."
+
+    report = loadgen(url, requests=5, paths=['/eof', '/malformed', '/truncated'], think_time=0.01)
+    assert report.errors == {'ValueError': 2, 'IncompleteReadError': 1}
+    assert report.bytes_received > len('until EOF')
+
+    assert loadgen(f'{url}/reset').errors == {'ConnectionResetError': 1}
+
+    # The next request on the connection is not confused by the trailer fields
+    report = loadgen(f'{url}/trailers', requests=3)
+    assert report.errors == {}
+    assert report.requests == 3
+
+    report = loadgen(f'{url}/bytes/1000', requests=2, method='HEAD')
+    assert report.errors == {}
+    assert report.bytes_received < 1000
+
+
+def test_loadgen_errors():
+    "Test failed connections and invalid arguments."
+
+    assert loadgen('http://localhost:7999').errors == {'ConnectionRefusedError': 1}
+    with pytest.raises(ValueError, match='Unsupported URL'):
+        loadgen('ftp://localhost')
+    with pytest.raises(ValueError, match='must be positive'):
+        loadgen('http://localhost', connections=0)
+    with pytest.raises(ValueError, match='must be positive'):
+        loadgen('http://localhost', rate=0)
+
+
+def test_loadgen_cli(url, capsys):
+    "Test the ``loadgen`` command."
+
+    main(['loadgen', '-c', '2', '-n', '2', '--json', f'{url}/bytes/10'])
+    report = json.loads(capsys.readouterr().out)
+    assert report['requests'] == 4
+    assert report['error_rate'] == 0
+
+    main(['loadgen', url])
+    out = capsys.readouterr().out
+    assert '1 request(s) from 1 connection(s)' in out
+    assert 'Latency: min ' in out
+    assert 'Errors: 0.00%\n' in out
+
+    main(['loadgen', '--path', '/nonexistent', url])
+    assert 'Errors: 100.00%, 1 HTTP 404' in capsys.readouterr().out
+
+    with pytest.raises(SystemExit) as e:
+        main(['loadgen', '--rate', '0', url])
+    assert e.value.code == 2
+    assert 'must be positive' in capsys.readouterr().err
@@ -0,0 +1,147 @@
+# Copyright (C) 2021  Hong Xu <hong@topbug.net>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import errno
+import socket
+import threading
+import time
+
+import pytest
+
+from poorconn import (delay_before_sending,
+                      limit_link_rate,
+                      make_socket_patchable,
+                      Profile,
+                      ProfileController,
+                      simulate_upon_acceptance,
+                      start_proxy)
+
+import utils
+
+
+def test_start_proxy(timeout):
+    "Test :func:`poorconn.start_proxy`."
+
+    with socket.socket() as server_sock:
+        utils.set_server_socket_options(server_sock)
+        server_sock.bind(('localhost', 7999))
+        server_sock.listen()
+        with utils.echo_server_socket_new_thread(server_sock, timeout=timeout):
+            controller = start_proxy(('localhost', 7999),
+                                     simulation=lambda s: delay_before_sending(s, t=timeout / 4, length=4),
+                                     upstream_simulation=Profile('slow', latency=timeout / 4))
+            assert controller.address[1] != 0
+            with socket.create_connection(controller.address) as client_sock:
+                starting_time = time.time()
+                client_sock.sendall(b'poorconn')
+                assert utils.recv_until(client_sock, 8) == b'poorconn'
+                # Delayed in transit to the echo server, and twice on the way back
+                assert timeout * 3 / 4 < time.time() - starting_time < timeout
+            assert controller.connections == 1
+            controller.remove()
+
+
+def test_start_proxy_target_down(timeout):
+    "Test that :func:`poorconn.start_proxy` closes connections when the target is down."
+
+    controller = start_proxy(('localhost', 7999), simulation='3g')
+    with socket.create_connection(controller.address, timeout=timeout) as client_sock:
+        assert client_sock.recv(1) == b''
+    controller.remove()
+    assert controller.connections == 1
+
+
+def test_start_proxy_address_in_use():
+    "Test that :func:`poorconn.start_proxy` raises the error of listening on an address that is in use."
+
+    with socket.socket() as server_sock:
+        server_sock.bind(('localhost', 0))
+        server_sock.listen()
+        with pytest.raises(OSError):
+            start_proxy(('localhost', 7999), address=server_sock.getsockname())
+
+
+def test_start_proxy_remove(timeout):
+    "Test removing a proxy while it is connecting, or while its sockets fail to shut down."
+
+    connecting, removed = threading.Event(), threading.Event()
+    sockets = []
+
+    def simulation(s):
+        sockets.append(s)
+        connecting.set()
+        removed.wait(timeout)
+        return delay_before_sending(s, t=0)
+
+    # Connections that are being connected while the proxy is removed are closed
+    with socket.socket() as server_sock:
+        server_sock.bind(('localhost', 0))
+        server_sock.listen()  # Connected to without being accepted
+        controller = start_proxy(server_sock.getsockname(), simulation=simulation)
+        with socket.create_connection(controller.address, timeout=timeout) as client_sock:
+            assert connecting.wait(timeout)
+            controller.remove()
+            removed.set()
+            assert client_sock.recv(1) == b''
+
+    # Sockets that fail to shut down are left to be closed by their peers
+    with socket.socket() as server_sock:
+        utils.set_server_socket_options(server_sock)
+        server_sock.bind(('localhost', 7999))
+        server_sock.listen()
+        controller = start_proxy(('localhost', 7999), simulation=simulation)
+        with utils.echo_server_socket_new_thread(server_sock, timeout=timeout):
+            with socket.create_connection(controller.address, timeout=timeout) as client_sock:
+                client_sock.sendall(b'poorconn')
+                assert utils.recv_until(client_sock, 8) == b'poorconn'
+
+                def shutdown(how):
+                    raise OSError(errno.ENOTCONN, 'Transport endpoint is not connected')
+
+                sockets[-1].shutdown = shutdown
+                controller.remove()
+
+    # The proxy stops serving if its listening socket is closed
+    controller = start_proxy(('localhost', 7999))
+    controller._server_socket.close()
+    controller._thread.join(timeout)
+    assert not controller._thread.is_alive()
+    controller.remove()
+
+
+def test_simulate_upon_acceptance(timeout):
+    "Test :func:`poorconn.simulate_upon_acceptance`."
+
+    with socket.socket() as server_sock:
+        server_sock = make_socket_patchable(server_sock)
+        utils.set_server_socket_options(server_sock)
+        server_sock.bind(('localhost', 7999))
+        server_sock.listen()
+        controller = simulate_upon_acceptance(server_sock, lambda s: limit_link_rate(s, rate=1000 / (timeout / 4)))
+        with socket.create_connection(('localhost', 7999)) as client_sock:
+            conn_sock, _ = server_sock.accept()
+            with conn_sock:
+                starting_time = time.time()
+                conn_sock.sendall(b'a' * 1000)
+                assert timeout / 4 * 0.9 < time.time() - starting_time < timeout / 2
+                assert utils.recv_until(client_sock, 1000) == b'a' * 1000
+        controller.simulation = 'gprs'
+        with socket.create_connection(('localhost', 7999)):
+            conn_sock, _ = server_sock.accept()
+            with conn_sock:
+                assert isinstance(conn_sock._poorconn_simulation, ProfileController)
+                assert conn_sock._poorconn_simulation in controller._children
+        controller.remove()
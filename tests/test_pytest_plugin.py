@@ -13,6 +13,7 @@
 # You should have received a copy of the GNU Lesser General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
+import json
 from textwrap import dedent
 from typing import Any
 
@@ -40,7 +41,9 @@ minimum_test_file = dedent("""
         ending_time = time.time()
         assert content == b't' * 1024
         assert ending_time - starting_time > ((len(content) // {length}) + (len(content) % {length})) * {t}
-        assert poorconn_http_server.server.server_port == {port}
+        assert poorconn_http_server.server.server_port != 0
+        assert poorconn_http_server.server.server_port == ({port} or poorconn_http_server.server.server_port)
+        assert poorconn_http_server.controller.t >= {t}
 
 
     def test_timeout_2(poorconn_http_server, tmp_path):
@@ -89,8 +92,8 @@ def test_poorconn_http_server_config_port(pytester):
     pytester.makepyfile(
         _format_with_default_args(
             minimum_test_file,
-            marks=f'@pytest.mark.poorconn_http_server_config(port={_DEFAULT_PORT + 300})',
-            port=_DEFAULT_PORT + 300))
+            marks='@pytest.mark.poorconn_http_server_config(port=8380)',
+            port=8380))
 
     result = pytester.runpytest()
     result.assert_outcomes(passed=2)
@@ -154,3 +157,187 @@ def test_poorconn_http_server_config_delay_parametrized(pytester):
 
     result = pytester.runpytest()
     result.assert_outcomes(passed=3)
+
+
+def test_poorconn_shared_http_server(pytester):
+    "Test fixture ``poorconn_shared_http_server``."
+
+    pytester.makepyfile(dedent("""
+        pytest_plugins = ("poorconn",)
+
+        import time
+
+        import pytest
+        import requests
+
+        ports = set()
+
+
+        @pytest.mark.parametrize("", [
+             pytest.param(marks=pytest.mark.poorconn_http_server_config(t=0.5, length=512)),
+             pytest.param(),
+        ])
+        def test_shared(poorconn_shared_http_server, tmp_path):
+            (tmp_path / 'my.txt').write_bytes(b't' * 1024)
+            ports.add(poorconn_shared_http_server.server.server_port)
+            controller = poorconn_shared_http_server.controller
+            starting_time = time.time()
+            content = requests.get(f'{poorconn_shared_http_server.url}/my.txt').content
+            assert content == b't' * 1024
+            assert time.time() - starting_time > controller.t * (1024 // controller.length)
+            # Updated by the test only
+            controller.t = 0
+
+
+        def test_reset(poorconn_shared_http_server):
+            assert poorconn_shared_http_server.controller.t == 1
+            assert poorconn_shared_http_server.controller.length == 1024
+            assert len(ports) == 1
+
+
+        @pytest.mark.poorconn_http_server_config(port=8380)
+        def test_unsupported_option(poorconn_shared_http_server):
+            pass
+    """))
+
+    result = pytester.runpytest()
+    result.assert_outcomes(passed=3, errors=1)
+
+
+def test_poorconn_http_server_config_cache_size(pytester):
+    "Test the ``cache_size`` option of fixtures ``poorconn_http_server`` and ``poorconn_shared_http_server``."
+
+    pytester.makepyfile(dedent("""
+        pytest_plugins = ("poorconn",)
+
+        import pytest
+        import requests
+
+
+        @pytest.mark.poorconn_http_server_config(t=0, cache_size=1024)
+        @pytest.mark.parametrize('fixture', ('poorconn_http_server', 'poorconn_shared_http_server'))
+        def test_cache(fixture, request, tmp_path):
+            server = request.getfixturevalue(fixture)
+            (tmp_path / 'file').write_bytes(b'poorconn')
+            for _ in range(2):
+                assert requests.get(f'{server.url}/file').content == b'poorconn'
+            assert (server.server.file_cache.hits, server.server.file_cache.misses) == (1, 1)
+
+
+        def test_no_cache(poorconn_shared_http_server):
+            assert poorconn_shared_http_server.server.file_cache is None
+    """))
+
+    result = pytester.runpytest()
+    result.assert_outcomes(passed=3)
+
+
+def test_poorconn_tcp_server_and_proxy(pytester):
+    "Test fixtures ``poorconn_tcp_server`` and ``poorconn_proxy``."
+
+    pytester.makepyfile(dedent("""
+        pytest_plugins = ("poorconn",)
+
+        import socket
+        import socketserver
+        import time
+
+        from poorconn import delay_before_sending
+
+
+        class EchoHandler(socketserver.StreamRequestHandler):
+            def handle(self):
+                self.wfile.write(self.rfile.readline())
+
+
+        def test_tcp_server_and_proxy(poorconn_tcp_server, poorconn_proxy):
+            server = poorconn_tcp_server(EchoHandler, simulation=lambda s: delay_before_sending(s, t=0.5, length=4))
+            assert server.url.startswith('tcp://')
+            proxy = poorconn_proxy(server.server.server_address, simulation=lambda s: delay_before_sending(s, t=0.5))
+            with socket.create_connection(proxy.address) as s:
+                starting_time = time.time()
+                s.sendall(b'poorconn\\n')
+                assert s.makefile('rb').readline() == b'poorconn\\n'
+                assert time.time() - starting_time > 0.5 * 3 + 0.5
+            assert proxy.connections == 1
+
+
+        def test_plain_tcp_server(poorconn_tcp_server):
+            server = poorconn_tcp_server(EchoHandler)
+            assert server.controller is None
+            with socket.create_connection(server.server.server_address) as s:
+                s.sendall(b'poorconn\\n')
+                assert s.makefile('rb').readline() == b'poorconn\\n'
+    """))
+
+    result = pytester.runpytest()
+    result.assert_outcomes(passed=2)
+
+
+def test_poorconn_benchmark(pytester):
+    "Test fixture ``poorconn_benchmark``."
+
+    pytester.makepyfile(dedent("""
+        pytest_plugins = ("poorconn",)
+
+        import pytest
+        import requests
+
+
+        @pytest.mark.poorconn_http_server_config(t=0.1, length=1024)
+        def test_download(poorconn_benchmark, poorconn_http_server, tmp_path):
+            (tmp_path / 'file').write_bytes(b'a' * 4096)
+            result = poorconn_benchmark(lambda: len(requests.get(f'{poorconn_http_server.url}/file').content),
+                                        controllers=[poorconn_http_server.controller], min_throughput=1)
+            assert len(result.durations) == 3
+            assert result.bytes == 4096 * 3
+            assert result.latency['min'] > 0.1 * 4
+            assert result.throughput < 1024 / 0.1
+            assert result.overshoot['max'] >= result.overshoot['mean'] >= 0
+            assert result.failures == []
+
+
+        @pytest.mark.poorconn_benchmark(rounds=2, max_p95=0.01, min_throughput=1)
+        def test_threshold(poorconn_benchmark):
+            poorconn_benchmark(lambda: __import__('time').sleep(0.05), name='sleep')
+
+
+        def test_unknown_option(poorconn_benchmark):
+            with pytest.raises(TypeError):
+                poorconn_benchmark(lambda: None, max_p90=1)
+    """))
+
+    result = pytester.runpytest('--poorconn-benchmark-json=benchmarks.json')
+    result.assert_outcomes(passed=2, failed=1)
+    result.stdout.fnmatch_lines(['*p95 * exceeds 0.01 s; throughput 0 B/s is below 1 B/s*',
+                                 '*poorconn benchmarks*',
+                                 '*test_download*rounds=3*p95=*throughput=*overshoot*',
+                                 '*test_threshold?sleep?*rounds=2*FAILED'])
+    with open(pytester.path / 'benchmarks.json') as f:
+        benchmarks = json.load(f)['benchmarks']
+    assert [len(benchmark['durations']) for benchmark in benchmarks] == [3, 2]
+    assert benchmarks[1]['failures']
+
+
+def test_poorconn_benchmark_worker(pytester):
+    "Test that worker processes of ``pytest-xdist`` leave the results of ``poorconn_benchmark`` to the controller."
+
+    pytester.makeconftest(dedent("""
+        def pytest_configure(config):
+            config.workerinput = {'workerid': 'gw0'}  # As pytest-xdist sets in worker processes
+    """))
+    pytester.makepyfile(dedent("""
+        pytest_plugins = ("poorconn",)
+
+
+        def test_nothing(poorconn_benchmark):
+            poorconn_benchmark(lambda: None, rounds=1)
+    """))
+
+    result = pytester.runpytest('--poorconn-benchmark-json=benchmarks.json')
+    result.assert_outcomes(passed=1)
+    result.stdout.no_fnmatch_line('*poorconn benchmarks*')
+    assert not (pytester.path / 'benchmarks.json').exists()
+    # The results are sent to the controller with the reports
+    report = result.reprec.getreports('pytest_runtest_logreport')[-1]
+    assert [name for name, _ in report.user_properties] == ['poorconn_benchmark']
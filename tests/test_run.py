@@ -0,0 +1,90 @@
+# Copyright (C) 2021  Hong Xu <hong@topbug.net>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import importlib.util
+import json
+import pathlib
+import sys
+
+from poorconn import Profile
+import poorconn._run
+from poorconn._run import CONFIG_ENV, preload, run
+
+
+def test_preload(tmp_path, monkeypatch):
+    "Test installing the configured profile and dumping its metrics in the current process."
+
+    monkeypatch.delenv(CONFIG_ENV, raising=False)
+    assert preload() is None
+
+    exit_functions = []
+    monkeypatch.setattr(poorconn._run.atexit, 'register', lambda *args: exit_functions.append(args))
+    metrics_file = tmp_path / 'metrics.jsonl'
+    monkeypatch.setenv(CONFIG_ENV, json.dumps({'profile': '3g', 'latency': 0.5, 'match': ['localhost:1'],
+                                               'metrics_file': str(metrics_file)}))
+    controller = preload()
+    try:
+        assert controller.profile == Profile('3g', rate=1_600_000 / 8, latency=0.5)
+        function, *args = exit_functions.pop()
+        function(*args)
+        function(*args)
+    finally:
+        controller.remove()
+    lines = metrics_file.read_text().splitlines()
+    assert len(lines) == 2
+    metrics = json.loads(lines[0])
+    assert metrics['profile'] == '3g'
+    assert metrics['connections'] == 0
+    assert metrics['argv'] == sys.argv
+
+    monkeypatch.setenv(CONFIG_ENV, json.dumps({'rate': 1000}))
+    controller = preload()
+    try:
+        assert controller.profile == Profile('custom', rate=1000)
+        assert not exit_functions  # No metrics file
+    finally:
+        controller.remove()
+
+
+def test_sitecustomize(tmp_path, monkeypatch):
+    "Test that the ``sitecustomize`` module of preloading runs the module that it shadows."
+
+    (tmp_path / 'sitecustomize.py').write_text('shadowed = True\n')
+    preload_dir = pathlib.Path(poorconn._run.__file__).parent / '_preload'
+    monkeypatch.setattr(sys, 'path', [str(preload_dir), str(tmp_path)])
+    monkeypatch.delitem(sys.modules, 'sitecustomize', raising=False)
+    monkeypatch.delenv(CONFIG_ENV, raising=False)
+
+    monkeypatch.delitem(sys.modules, 'poorconn')
+
+    spec = importlib.util.spec_from_file_location('sitecustomize', preload_dir / 'sitecustomize.py')
+    spec.loader.exec_module(importlib.util.module_from_spec(spec))
+    assert sys.path == [str(tmp_path)]  # Not preloaded again by processes that inherit sys.path
+    assert sys.modules['sitecustomize'].shadowed
+    # Poorconn is imported without putting the directory that contains it on sys.path
+    assert sys.modules['poorconn'].__file__ == poorconn.__file__
+
+
+def test_run_python_path(tmp_path, monkeypatch, capfd):
+    "Test that :func:`poorconn._run.run` keeps ``PYTHONPATH`` after the preloading directories."
+
+    monkeypatch.setenv('PYTHONPATH', str(tmp_path))
+    (tmp_path / 'kept.py').write_text('')
+    # The directory that contains Poorconn is not put on sys.path
+    poorconn_parent = str(pathlib.Path(poorconn.__file__).resolve().parent.parent)
+    assert run((sys.executable, '-c', f'import sys, kept; sys.exit(5 if "poorconn" in sys.modules and '
+                                      f'{poorconn_parent!r} not in sys.path else 3)')) == 5
+    assert '0 connection(s) shaped, 0 byte(s) sent, in 1 Python process(es)' in capfd.readouterr().err
@@ -14,7 +14,9 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 import pathlib
-from socket import socket
+import socket as socket_module
+from socket import socket, socketpair
+import sys
 import time
 
 import pytest
@@ -24,7 +26,11 @@ from poorconn import (delay_before_sending,
                       delay_before_sending_once,
                       delay_before_sending_upon_acceptance,
                       delay_before_sending_upon_acceptance_once,
+                      limit_link_rate,
+                      limit_link_rate_upon_acceptance,
                       PatchableSocket)
+from poorconn._send import _kernel_send_queue_length, head_of_buffers
+from poorconn._wrappers import wrap
 
 import utils
 
@@ -246,3 +252,202 @@ def test_delay_before_sending_upon_acceptance_http_server(http_server, http_url,
         assert content == pathlib.Path('COPYING').read_bytes()
         assert ending_time - starting_time > (timeout *
                                               max(1, file_size // chopped_length + (file_size % chopped_length > 0)))
+
+
+def test_remove(timeout):
+    "Test :meth:`poorconn.Controller.remove` on stacked simulations."
+
+    a, b = socketpair()
+    with PatchableSocket.create_from(a) as a, b:
+        assert 'send' not in vars(a) and 'sendall' not in vars(a)
+        once_controller = delay_before_sending_once(a, t=timeout)
+        controller = delay_before_sending(a, t=timeout / 4, length=2)
+
+        # Removing the inner simulation keeps the outer one in effect
+        once_controller.remove()
+        starting_time = time.time()
+        a.sendall(b'poor')
+        assert time.time() - starting_time > timeout / 2
+        assert utils.recv_until(b, 4) == b'poor'
+
+        # Removing the outer simulation restores the original methods
+        controller.remove()
+        assert 'send' not in vars(a) and 'sendall' not in vars(a) and 'sendmsg' not in vars(a)
+        starting_time = time.time()
+        a.sendall(b'poorconn')
+        assert a.send(b'poorconn') == 8
+        assert time.time() - starting_time < timeout / 5
+        assert utils.recv_until(b, 16) == b'poorconn' * 2
+
+        controller.remove()  # No effect
+
+
+def test_remove_upon_acceptance(timeout):
+    "Test :meth:`poorconn.Controller.remove` on upon-acceptance simulations."
+
+    with PatchableSocket() as server_sock:
+        utils.set_server_socket_options(server_sock)
+        server_sock.bind(('localhost', 7999))
+        controller = delay_before_sending_upon_acceptance(server_sock, t=timeout / 4, length=4)
+        server_sock.listen()
+
+        with socket() as client_sock:
+            client_sock.connect(('localhost', 7999))
+            conn_sock, _ = server_sock.accept()
+            with conn_sock:
+                starting_time = time.time()
+                conn_sock.sendall(b'poorconn')
+                assert time.time() - starting_time > timeout / 2
+                assert utils.recv_until(client_sock, 8) == b'poorconn'
+
+                controller.remove()
+                assert 'accept' not in vars(server_sock)
+                starting_time = time.time()
+                conn_sock.sendall(b'poorconn')
+                assert time.time() - starting_time < timeout / 5
+                assert utils.recv_until(client_sock, 8) == b'poorconn'
+
+
+def test_head_of_buffers():
+    "Test :func:`poorconn._send.head_of_buffers`."
+
+    buffers = (b'poor', bytearray(b'co'), memoryview(b'nn'))
+    head = head_of_buffers(buffers, 5)
+    assert [bytes(view) for view in head] == [b'poor', b'c']
+    assert head[1].obj is buffers[1]  # Not copied
+    assert b''.join(head_of_buffers(buffers, 100)) == b'poorconn'
+    assert head_of_buffers(buffers, 0) == []
+
+
+@pytest.mark.skipif(not hasattr(socket, 'sendmsg'), reason='socket.sendmsg is unavailable')
+def test_delay_before_sending_sendmsg(timeout):
+    "Test :func:`poorconn.delay_before_sending` and :func:`poorconn.delay_before_sending_once` with ``sendmsg``."
+
+    a, b = socketpair()
+    with PatchableSocket.create_from(a) as a, b:
+        delay_before_sending_once(a, t=timeout / 2)
+        controller = delay_before_sending(a, t=timeout / 8, length=3)
+
+        starting_time = time.time()
+        assert a.sendmsg([b'po', b'orc', b'onn']) == 3  # Sliced across the boundary of the buffers
+        assert time.time() - starting_time > timeout / 2 + timeout / 8
+        assert utils.recv_until(b, 3) == b'poo'
+
+        starting_time = time.time()
+        assert a.sendmsg([b'rc', bytearray(b'onn')]) == 3
+        assert time.time() - starting_time < timeout / 4  # Delayed only once
+        assert utils.recv_until(b, 3) == b'rco'
+
+        controller.remove()
+        assert a.sendmsg([b'po', b'or']) == 4
+        assert utils.recv_until(b, 4) == b'poor'
+
+
+def test_delay_before_sending_compensation(timeout):
+    "Test that :func:`poorconn.delay_before_sending` does not accumulate oversleeping within ``sendall``."
+
+    a, b = socketpair()
+    with PatchableSocket.create_from(a) as a, b:
+        controller = delay_before_sending(a, t=timeout / 400, length=10)
+        with utils.function_new_thread(lambda: utils.recv_until(b, 2000)):
+            starting_time = time.time()
+            a.sendall(b'a' * 2000)  # 200 delays
+            assert timeout / 2 <= time.time() - starting_time < timeout / 2 * 1.1
+        assert controller.pacer.waits == 200
+        assert controller.pacer.mean_overshoot <= controller.pacer.max_overshoot
+
+
+def test_limit_link_rate(timeout):
+    "Test :func:`poorconn.limit_link_rate`."
+
+    a, b = socketpair()
+    with PatchableSocket.create_from(a) as a, b:
+        writes = []
+        wrap(a, meth='sendall', before=lambda sock, data: writes.append(len(data)))
+        controller = limit_link_rate(a, rate=500_000 / (timeout / 4), timer_resolution=0.01)
+        batch_length = 1448 * 7  # At 1 MB/s, 7 segments take at least 10 ms
+        with utils.function_new_thread(lambda: utils.recv_until(b, 500_000 + batch_length + 1448 + 1000)):
+            starting_time = time.time()
+            a.sendall(b'a' * 500_000)
+            assert timeout / 4 * 0.95 < time.time() - starting_time < timeout / 4 * 1.2
+            # Batched into few writes
+            assert writes == [batch_length] * (500_000 // batch_length) + [500_000 % batch_length]
+
+            assert a.send(b'a' * 500_000) == batch_length
+            controller.timer_resolution = 0
+            assert a.sendmsg([b'a' * 1000, b'a' * 2000]) == 1448  # One segment at a time
+            assert a.send(b'a' * 1000) == 1000
+
+        controller.remove()
+        assert 'sendall' in vars(a)  # The wrapping of the test remains
+
+
+def test_limit_link_rate_upon_acceptance(timeout):
+    "Test :func:`poorconn.limit_link_rate_upon_acceptance`."
+
+    with PatchableSocket() as server_sock:
+        utils.set_server_socket_options(server_sock)
+        server_sock.bind(('localhost', 7999))
+        controller = limit_link_rate_upon_acceptance(server_sock, rate=14480 / (timeout / 4))
+        server_sock.listen()
+        with socket() as client_sock:
+            client_sock.connect(('localhost', 7999))
+            conn_sock, _ = server_sock.accept()
+            with conn_sock:
+                starting_time = time.time()
+                conn_sock.sendall(b'a' * 14480)
+                assert timeout / 4 * 0.95 < time.time() - starting_time < timeout / 2
+                assert utils.recv_until(client_sock, 14480) == b'a' * 14480
+        controller.remove()
+
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'), reason='The send queue can only be queried on Linux')
+def test_limit_link_rate_pace_kernel_queue(timeout):
+    "Test :func:`poorconn.limit_link_rate` with ``pace_kernel_queue``."
+
+    with PatchableSocket() as server_sock:
+        utils.set_server_socket_options(server_sock)
+        server_sock.bind(('localhost', 7999))
+        server_sock.listen()
+        assert _kernel_send_queue_length(server_sock) is None  # A listening socket has no send queue
+        with socket() as client_sock:
+            client_sock.connect(('localhost', 7999))
+            conn_sock, _ = server_sock.accept()
+            with PatchableSocket.create_from(conn_sock) as conn_sock:
+                # Data that the receiver does not read stays in the send queue
+                conn_sock.setblocking(False)
+                with pytest.raises(BlockingIOError):
+                    while True:
+                        conn_sock.send(b'a' * 65536)
+                assert _kernel_send_queue_length(conn_sock) > 0
+                client_sock.settimeout(timeout / 4)
+                with pytest.raises(socket_module.timeout):  # Drain the send queue
+                    while True:
+                        client_sock.recv(65536)
+                client_sock.settimeout(None)
+                conn_sock.setblocking(True)
+                assert _kernel_send_queue_length(conn_sock) == 0
+
+                original_send_buffer = conn_sock.getsockopt(socket_module.SOL_SOCKET, socket_module.SO_SNDBUF)
+                controller = limit_link_rate(conn_sock, rate=14480 / (timeout / 4), pace_kernel_queue=True)
+                assert conn_sock.getsockopt(socket_module.SOL_SOCKET, socket_module.SO_SNDBUF) < original_send_buffer
+
+                starting_time = time.time()
+                conn_sock.sendall(b'a' * 14480)
+                assert timeout / 4 * 0.95 < time.time() - starting_time < timeout / 2
+                assert utils.recv_until(client_sock, 14480) == b'a' * 14480
+
+                controller.remove()
+                assert conn_sock.getsockopt(socket_module.SOL_SOCKET, socket_module.SO_SNDBUF) == original_send_buffer
+
+
+def test_limit_link_rate_wait_for_kernel_queue(socks, monkeypatch, timeout):
+    "Test that :func:`poorconn.limit_link_rate` with ``pace_kernel_queue`` waits for the send queue to drain."
+
+    a, _ = socks
+    controller = limit_link_rate(a, rate=1448 / (timeout / 4), pace_kernel_queue=True)
+    queued = iter((2 * 1448, 0))
+    monkeypatch.setattr('poorconn._send._kernel_send_queue_length', lambda s: next(queued))
+    starting_time = time.time()
+    controller._wait_for_kernel_queue(a, 1448)
+    assert timeout / 4 * 0.95 < time.time() - starting_time < timeout / 2  # The excess leaves at the rate
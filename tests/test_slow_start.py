@@ -0,0 +1,90 @@
+# Copyright (C) 2021  Hong Xu <hong@topbug.net>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import socket
+import time
+
+from poorconn import emulate_slow_start, emulate_slow_start_upon_acceptance, PatchableSocket
+
+import utils
+
+
+def test_emulate_slow_start(timeout):
+    "Test :func:`poorconn.emulate_slow_start`."
+
+    rtt = timeout / 8
+    a, b = socket.socketpair()
+    with PatchableSocket.create_from(a) as a, b:
+        controller = emulate_slow_start(a, rtt=rtt, initial_window=1000, mss=100)
+        with utils.function_new_thread(lambda: utils.recv_until(b, 7000 + 8000 + 2000 + 1000)):
+            starting_time = time.time()
+            a.sendall(b'a' * 7000)  # 1000, 2000 and 4000 bytes in three rounds
+            assert 2 * rtt < time.time() - starting_time < 2.5 * rtt
+            assert controller.cwnd == 4000
+
+            # The window doubles only after it has been used up
+            time.sleep(rtt)
+            assert a.send(b'a' * 9000) == 8000
+            starting_time = time.time()
+            assert a.sendmsg([b'a' * 1000, b'a' * 1000]) == 2000  # Blocked until the next round
+            assert time.time() - starting_time > rtt / 2
+            assert controller.cwnd == 16000
+
+            # Restart from the initial window after an idle period
+            time.sleep(2 * rtt)
+            assert a.send(b'a' * 2000) == 1000
+            assert controller.cwnd == 1000
+            assert a.send(b'') == 0  # Takes nothing from the window
+
+
+def test_emulate_slow_start_rate_and_loss(timeout):
+    "Test the ``rate`` and ``loss`` parameters of :func:`poorconn.emulate_slow_start`."
+
+    rtt = timeout / 16
+    a, b = socket.socketpair()
+    with PatchableSocket.create_from(a) as a, b:
+        controller = emulate_slow_start(a, rtt=rtt, rate=3000 / rtt, initial_window=1000, mss=100)
+        with utils.function_new_thread(lambda: utils.recv_until(b, 12000)):
+            a.sendall(b'a' * 12000)  # 1000, 2000, 3000, 3000, 3000
+            assert controller.cwnd == 3000
+
+        # Every round with a loss halves the window
+        controller.loss = 1
+        with utils.function_new_thread(lambda: utils.recv_until(b, 1500 + 750 + 375)):
+            a.sendall(b'a' * (1500 + 750 + 375))
+            assert controller.cwnd == 375
+            assert controller.ssthresh == 375
+            assert controller.losses == 3
+
+
+def test_emulate_slow_start_upon_acceptance(timeout):
+    "Test :func:`poorconn.emulate_slow_start_upon_acceptance`."
+
+    rtt = timeout / 8
+    with PatchableSocket() as server_sock:
+        utils.set_server_socket_options(server_sock)
+        server_sock.bind(('localhost', 7999))
+        controller = emulate_slow_start_upon_acceptance(server_sock, rtt=rtt, initial_window=1000)
+        server_sock.listen()
+        for _ in range(2):  # Every connection starts slowly
+            with socket.create_connection(('localhost', 7999)) as client_sock:
+                conn_sock, _ = server_sock.accept()
+                with conn_sock:
+                    starting_time = time.time()
+                    conn_sock.sendall(b'a' * 3000)
+                    assert utils.recv_until(client_sock, 3000) == b'a' * 3000
+                    assert rtt < time.time() - starting_time < 1.5 * rtt
+        controller.remove()
@@ -17,6 +17,7 @@ from socket import socket
 from ssl import SSLContext, SSLSocket
 
 from poorconn import make_socket_patchable, PatchableSocket
+from poorconn._socket import is_patchable
 
 
 def test_make_socket_patchable():
@@ -24,6 +25,12 @@ def test_make_socket_patchable():
 
     s = make_socket_patchable(socket())
     assert isinstance(s, PatchableSocket)
+    assert is_patchable(s, 'send')
+    assert not is_patchable(socket(), 'send')
+    assert not is_patchable(s, 'nonexistent')  # Such as sendmsg on Windows
+    send = s.send = s.send  # Shadowing the method of the class
+    assert is_patchable(s, 'send')
+    assert s.send is send
 
     s = make_socket_patchable(SSLContext().wrap_socket(socket()))
     assert isinstance(s, SSLSocket)
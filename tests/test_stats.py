@@ -0,0 +1,51 @@
+# Copyright (C) 2021  Hong Xu <hong@topbug.net>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import pytest
+
+from poorconn import percentile, summarize
+
+
+@pytest.mark.parametrize('q, expected', ((0, 1), (50, 2.5), (100, 4), (25, 1.75), (90, 3.7)))
+def test_percentile(q, expected):
+    "Test percentiles, which are interpolated linearly between ranks."
+
+    assert percentile([4, 1, 3, 2], q) == pytest.approx(expected)
+    assert percentile([5], q) == 5
+
+
+def test_percentile_invalid():
+    "Test percentiles of no samples and out-of-range percentiles."
+
+    with pytest.raises(ValueError):
+        percentile([], 50)
+    with pytest.raises(ValueError):
+        percentile([1], 101)
+    with pytest.raises(ValueError):
+        percentile([1], -1)
+
+
+def test_summarize():
+    "Test summaries of samples."
+
+    summary = summarize(range(1, 101), percentiles=(50, 99.9))
+    assert set(summary) == {'min', 'mean', 'max', 'p50', 'p99.9'}
+    assert (summary['min'], summary['mean'], summary['max']) == (1, 50.5, 100)
+    assert summary['p50'] == pytest.approx(50.5)
+    assert summary['p99.9'] == pytest.approx(99.901)
+    assert set(summarize([1])) == {'min', 'mean', 'max', 'p50', 'p95', 'p99'}
+    with pytest.raises(ValueError):
+        summarize([])
@@ -0,0 +1,207 @@
+# Copyright (C) 2021  Hong Xu <hong@topbug.net>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import socket
+import ssl
+import threading
+import time
+
+import pytest
+
+from poorconn import delay_before_sending, delay_before_sending_upon_acceptance, delay_tls_handshake, install, Profile
+from poorconn._tls import tls_plaintext_length, tls_record_overhead
+
+import utils
+
+
+@pytest.fixture
+def tls_server_sock(tls_contexts):
+    "A listening :class:`ssl.SSLSocket` object on localhost port 7999."
+
+    with socket.socket() as sock:
+        utils.set_server_socket_options(sock)
+        sock.bind(('localhost', 7999))
+        sock.listen()
+        with tls_contexts[0].wrap_socket(sock, server_side=True) as server_sock:
+            yield server_sock
+
+
+@pytest.mark.parametrize('version', (None, ssl.TLSVersion.TLSv1_2))
+def test_tls_plaintext_length(tls_server_sock, tls_contexts, version):
+    "Test :func:`poorconn._tls.tls_plaintext_length`."
+
+    client_context = tls_contexts[1]
+    maximum_version = client_context.maximum_version
+    if version is not None:
+        client_context.maximum_version = version
+    try:
+        with utils.echo_server_socket_new_thread(tls_server_sock, timeout=0.1):
+            with client_context.wrap_socket(socket.create_connection(('localhost', 7999)),
+                                            server_hostname='localhost') as client_sock:
+                assert version is None or client_sock.version() == 'TLSv1.2'
+                overhead = tls_record_overhead(client_sock)
+                assert overhead == (22 if client_sock.version() == 'TLSv1.3' else 29)
+                assert tls_plaintext_length(client_sock, 1024) == 1024 - overhead
+                assert tls_plaintext_length(client_sock, 16384 * 2) == 16384 * 2 - 2 * overhead
+                assert tls_plaintext_length(client_sock, 1) == 1
+    finally:
+        client_context.maximum_version = maximum_version
+
+
+@pytest.mark.parametrize('length', (256, 1000))
+def test_delay_before_sending(tls_server_sock, tls_contexts, timeout, length):
+    "Test :func:`poorconn.delay_before_sending` with :class:`ssl.SSLSocket` objects."
+
+    with utils.echo_server_socket_new_thread(tls_server_sock, timeout=0.1):
+        with tls_contexts[1].wrap_socket(socket.create_connection(('localhost', 7999)),
+                                         server_hostname='localhost') as client_sock:
+            overhead = tls_record_overhead(client_sock)
+            delay_before_sending(client_sock, t=timeout / 8, length=length + overhead)
+            assert 'sendall' not in vars(client_sock)  # SSLSocket.sendall relies on send
+
+            assert client_sock.send(b'a' * 2048) == length
+            assert utils.recv_until(client_sock, length) == b'a' * length
+
+            num_records = 2048 // length + (2048 % length > 0)
+            starting_time = time.time()
+            client_sock.sendall(b'b' * 2048)
+            ending_time = time.time()
+            # Each record is delayed once and only once
+            assert timeout / 8 * num_records < ending_time - starting_time < timeout / 8 * (num_records + 1.5)
+            assert utils.recv_until(client_sock, 2048) == b'b' * 2048
+
+
+def test_delay_before_sending_upon_acceptance(tls_server_sock, tls_contexts, timeout):
+    "Test :func:`poorconn.delay_before_sending_upon_acceptance` with :class:`ssl.SSLSocket` objects."
+
+    delay_before_sending_upon_acceptance(tls_server_sock, t=timeout / 4, length=1024)
+    with utils.echo_server_socket_new_thread(tls_server_sock, timeout=0.1):
+        with tls_contexts[1].wrap_socket(socket.create_connection(('localhost', 7999)),
+                                         server_hostname='localhost') as client_sock:
+            starting_time = time.time()
+            client_sock.sendall(b'a' * 1024)
+            assert utils.recv_until(client_sock, 1024) == b'a' * 1024
+            # 1024 bytes plus the TLS overhead take two records
+            assert time.time() - starting_time > timeout / 2
+
+
+def test_delay_tls_handshake_server(tls_server_sock, tls_contexts, timeout):
+    "Test :func:`poorconn.delay_tls_handshake` on a listening socket."
+
+    controller = delay_tls_handshake(tls_server_sock, t=timeout / 2)
+    assert controller.t == timeout / 2
+    with utils.echo_server_socket_new_thread(tls_server_sock, timeout=0.1):
+        with socket.create_connection(('localhost', 7999)) as sock:
+            starting_time = time.time()
+            with tls_contexts[1].wrap_socket(sock, server_hostname='localhost') as client_sock:
+                assert time.time() - starting_time > timeout / 2
+                client_sock.sendall(b'poorconn')
+                assert utils.recv_until(client_sock, 8) == b'poorconn'
+
+    # The handshakes are no longer delayed after removal
+    controller.remove()
+    assert tls_server_sock.do_handshake_on_connect
+    with utils.echo_server_socket_new_thread(tls_server_sock, timeout=0.1):
+        with socket.create_connection(('localhost', 7999)) as sock:
+            starting_time = time.time()
+            with tls_contexts[1].wrap_socket(sock, server_hostname='localhost'):
+                assert time.time() - starting_time < timeout / 4
+
+
+def test_delay_tls_handshake_server_concurrent(tls_server_sock, tls_contexts, timeout):
+    "Test that :func:`poorconn.delay_tls_handshake` on a listening socket delays concurrent handshakes independently."
+
+    delay_tls_handshake(tls_server_sock, t=timeout / 2)
+    durations = []
+
+    def echo(conn_sock):
+        with conn_sock:
+            conn_sock.sendall(utils.recv_until(conn_sock, 8))
+
+    def serve():
+        for _ in range(2):
+            conn_sock, _ = tls_server_sock.accept()
+            threading.Thread(target=echo, args=(conn_sock,), name='Echo thread', daemon=True).start()
+
+    def connect():
+        with socket.create_connection(('localhost', 7999)) as sock:
+            starting_time = time.time()
+            with tls_contexts[1].wrap_socket(sock, server_hostname='localhost') as client_sock:
+                client_sock.sendall(b'poorconn')
+                assert utils.recv_until(client_sock, 8) == b'poorconn'
+            durations.append(time.time() - starting_time)
+
+    with utils.function_new_thread(serve):
+        clients = [threading.Thread(target=connect, name='Client thread', daemon=True) for _ in range(2)]
+        for client in clients:
+            client.start()
+        for client in clients:
+            client.join()
+    # Not serialized by the accepting thread, which would take twice as long for one of them
+    assert len(durations) == 2
+    assert all(timeout / 2 < duration < timeout * 3 / 4 for duration in durations)
+
+
+def test_delay_tls_handshake_server_manual_handshake(tls_server_sock, tls_contexts, timeout):
+    "Test :func:`poorconn.delay_tls_handshake` on a listening socket that does not do handshakes upon acceptance."
+
+    tls_server_sock.do_handshake_on_connect = False
+    delay_tls_handshake(tls_server_sock, t=timeout / 2)
+
+    def handshake():
+        conn_sock, _ = tls_server_sock.accept()
+        conn_sock.do_handshake()
+        conn_sock.close()
+
+    with socket.create_connection(('localhost', 7999)) as sock:
+        with utils.function_new_thread(handshake):
+            starting_time = time.time()
+            with tls_contexts[1].wrap_socket(sock, server_hostname='localhost'):
+                assert time.time() - starting_time > timeout / 2
+
+
+def test_delay_tls_handshake_client(tls_server_sock, tls_contexts, timeout):
+    "Test :func:`poorconn.delay_tls_handshake` on a client socket."
+
+    with utils.echo_server_socket_new_thread(tls_server_sock, timeout=0.1):
+        with tls_contexts[1].wrap_socket(socket.socket(), server_hostname='localhost') as client_sock:
+            delay_tls_handshake(client_sock, t=timeout / 2)
+            starting_time = time.time()
+            client_sock.connect(('localhost', 7999))
+            assert time.time() - starting_time > timeout / 2
+            client_sock.do_handshake()  # Only the first handshake is delayed
+            assert time.time() - starting_time < timeout
+
+
+def test_install(tls_server_sock, tls_contexts, timeout):
+    "Test :func:`poorconn.install` with :class:`ssl.SSLSocket` objects."
+
+    controller = install(Profile('mine', latency=timeout / 4), match=':7999')
+    try:
+        with utils.echo_server_socket_new_thread(tls_server_sock, timeout=0.1):
+            starting_time = time.time()
+            with tls_contexts[1].wrap_socket(socket.create_connection(('localhost', 7999)),
+                                             server_hostname='localhost') as client_sock:
+                assert time.time() - starting_time > timeout / 4  # The handshake is delayed
+                assert 'send' in vars(client_sock)
+                # Both existing and new TLS sockets are still instances of socket.socket
+                assert isinstance(tls_server_sock, socket.socket) and isinstance(client_sock, socket.socket)
+                client_sock.sendall(b'poorconn')
+                assert utils.recv_until(client_sock, 8) == b'poorconn'
+                assert time.time() - starting_time > timeout / 2  # So is the first send
+                assert controller.bytes_sent == 8
+    finally:
+        controller.remove()
@@ -0,0 +1,207 @@
+# Copyright (C) 2021  Hong Xu <hong@topbug.net>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import socket
+import struct
+import time
+
+import pytest
+
+from poorconn import delay_in_transit, delay_in_transit_upon_acceptance, PatchableSocket
+
+import utils
+
+
+def test_delay_in_transit(socks, timeout):
+    "Test :func:`poorconn.delay_in_transit`."
+
+    a, b = socks
+    controller = delay_in_transit(a, t=timeout / 2)
+    data = bytes(range(256)) * 1024
+    starting_time = time.time()
+    a.sendall(data)
+    assert a.send(b'poor') == 4
+    assert a.sendmsg([b'co', memoryview(b'nn')]) == 4
+    assert time.time() - starting_time < timeout / 4  # The sender is not blocked
+    assert controller.in_flight == len(data) + 8
+    b.settimeout(timeout / 4)
+    with pytest.raises(socket.timeout):
+        b.recv(1)
+    b.settimeout(None)
+    assert utils.recv_until(b, len(data) + 8) == data + b'poorconn'
+    assert timeout / 2 < time.time() - starting_time < timeout  # Delayed once rather than for every chunk
+    controller._drain()  # The receiver may get the last bytes before the pump accounts for them
+    assert controller.in_flight == 0
+
+
+def test_delay_in_transit_non_blocking(socks, timeout):
+    "Test that :func:`poorconn.delay_in_transit` releases all data of non-blocking sockets whose buffers are full."
+
+    a, b = socks
+    a.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+    a.setblocking(False)
+    delay_in_transit(a, t=timeout / 8)
+    data = bytes(range(256)) * 1024
+    a.sendall(data)  # Much more than the send buffer holds
+    assert utils.recv_until(b, len(data)) == data
+
+
+def test_delay_in_transit_window(socks, timeout):
+    "Test the ``window`` parameter of :func:`poorconn.delay_in_transit`."
+
+    a, b = socks
+    controller = delay_in_transit(a, t=timeout / 2, window=4)
+    assert a.send(b'poorconn') == 4
+
+    a.settimeout(0)
+    with pytest.raises(BlockingIOError):
+        a.send(b'conn')
+    a.settimeout(timeout / 8)
+    with pytest.raises(socket.timeout):
+        a.send(b'conn')
+
+    a.settimeout(None)
+    starting_time = time.time()
+    a.sendall(b'conn')  # Blocked until the first 4 bytes are released
+    assert time.time() - starting_time > timeout / 4
+    assert utils.recv_until(b, 8) == b'poorconn'
+
+    controller._drain()  # The receiver may get the last bytes before the pump accounts for them
+    controller.window = 8
+    assert a.send(b'poorconn') == 8
+
+
+def test_delay_in_transit_close(socks, timeout):
+    """Test that closing a socket or shutting it down for writing returns immediately, and the delay line releases the
+    remaining data before closing it or shutting it down."""
+
+    a, b = socks
+    controller = delay_in_transit(a, t=timeout / 4)
+    a.shutdown(socket.SHUT_RD)  # Not deferred
+    assert a.recv(16) == b''
+    a.sendall(b'poor')
+    starting_time = time.time()
+    a.shutdown(socket.SHUT_RDWR)
+    assert time.time() - starting_time < timeout / 8
+    with pytest.raises(BrokenPipeError):
+        a.send(b'conn')
+
+    def fail():
+        raise ConnectionResetError
+
+    controller._after_drain(fail, ConnectionResetError())  # Errors of deferred functions are ignored
+    assert utils.recv_until(b, 4) == b'poor'
+    assert b.recv(16) == b''
+    assert time.time() - starting_time > timeout / 4
+
+
+def test_delay_in_transit_close_not_reading(socks, timeout):
+    "Test that closing a socket returns immediately even if the peer does not read the remaining data."
+
+    a, b = socks
+    a.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+    b.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+    controller = delay_in_transit(a, t=timeout / 8)
+    data = bytes(range(256)) * 1024
+    a.sendall(data)  # Much more than the buffers hold
+    time.sleep(timeout / 4)  # The delay line is blocked by the peer
+    starting_time = time.time()
+    a.close()
+    assert time.time() - starting_time < timeout / 8
+    with pytest.raises(OSError):
+        a.send(b'poorconn')
+    assert a.fileno() != -1  # Closed after the remaining data is released
+    assert utils.recv_until(b, len(data)) == data
+    assert b.recv(16) == b''
+    controller._drain()
+    assert a.fileno() == -1
+
+    # Closed immediately if the delay line is empty
+    a.close()
+
+
+def test_delay_in_transit_remove(socks, timeout):
+    "Test removing :func:`poorconn.delay_in_transit`."
+
+    a, b = socks
+    controller = delay_in_transit(a, t=timeout / 4)
+    a.sendall(b'poor')
+    controller.remove()
+    assert 'sendall' not in vars(a) and 'close' not in vars(a)
+    a.sendall(b'conn')  # Not overtaking the data in the delay line
+    assert utils.recv_until(b, 8) == b'poorconn'
+
+
+@pytest.mark.skipif(not hasattr(socket, 'SCM_RIGHTS'), reason='socket.SCM_RIGHTS is unavailable')
+def test_delay_in_transit_ancillary_data(socks, timeout):
+    "Test that :func:`poorconn.delay_in_transit` sends ancillary data after draining the delay line."
+
+    a, b = socks
+    delay_in_transit(a, t=timeout / 4)
+    a.sendall(b'poor')
+    assert a.sendmsg([b'conn'], [(socket.SOL_SOCKET, socket.SCM_RIGHTS, struct.pack('i', a.fileno()))]) == 4
+    assert utils.recv_until(b, 8) == b'poorconn'  # Not overtaking the data in the delay line
+
+    # Waiting for the delay line to drain is subject to the timeout
+    ancdata = [(socket.SOL_SOCKET, socket.SCM_RIGHTS, struct.pack('i', a.fileno()))]
+    a.sendall(b'poor')
+    a.settimeout(0)
+    with pytest.raises(BlockingIOError):
+        a.sendmsg([b'conn'], ancdata)
+    a.settimeout(timeout / 16)
+    with pytest.raises(socket.timeout):
+        a.sendmsg([b'conn'], ancdata)
+    a.settimeout(None)
+    assert a.sendmsg([b'conn'], ancdata) == 4
+    assert utils.recv_until(b, 8) == b'poorconn'
+
+
+def test_delay_in_transit_error(socks, timeout):
+    "Test that :func:`poorconn.delay_in_transit` raises the error of releasing data upon the next sending."
+
+    a, b = socks
+    delay_in_transit(a, t=timeout / 8)
+    b.close()
+    a.sendall(b'poorconn')
+    time.sleep(timeout / 4)
+    with pytest.raises(OSError):
+        a.send(b'poorconn')
+
+
+def test_delay_in_transit_not_stream():
+    "Test that :func:`poorconn.delay_in_transit` rejects datagram sockets."
+
+    with PatchableSocket(type=socket.SOCK_DGRAM) as s:
+        with pytest.raises(ValueError):
+            delay_in_transit(s, t=1)
+
+
+def test_delay_in_transit_upon_acceptance(timeout):
+    "Test :func:`poorconn.delay_in_transit_upon_acceptance`."
+
+    with PatchableSocket() as server_sock:
+        utils.set_server_socket_options(server_sock)
+        server_sock.bind(('localhost', 7999))
+        controller = delay_in_transit_upon_acceptance(server_sock, t=timeout / 4)
+        server_sock.listen()
+        with utils.echo_server_socket_new_thread(server_sock, timeout=0.1):
+            with socket.create_connection(('localhost', 7999)) as client_sock:
+                for _ in range(2):
+                    starting_time = time.time()
+                    client_sock.sendall(b'poorconn')
+                    assert utils.recv_until(client_sock, 8) == b'poorconn'
+                    assert timeout / 4 < time.time() - starting_time < timeout / 2
+        controller.remove()
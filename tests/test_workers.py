@@ -0,0 +1,131 @@
+# Copyright (C) 2021  Hong Xu <hong@topbug.net>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from http.server import ThreadingHTTPServer
+import json
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+
+import pytest
+
+from poorconn import HTTPRequestHandler, slow_down_http_responses
+from poorconn._workers import ControlServer, Counters, run_workers, SharedParameters, synchronize_controllers
+
+
+def test_shared_parameters():
+    "Test getting and updating shared parameters."
+
+    parameters = SharedParameters({'t': 1.5, 'length': None}, {'t': float, 'length': int})
+    assert parameters.get() == {'t': 1.5, 'length': None}
+    parameters.update({'length': 1024})
+    assert parameters.get() == {'t': 1.5, 'length': 1024}
+    assert parameters.version == 1
+    with pytest.raises(KeyError):
+        parameters.update({'nonexistent': 1})
+    assert parameters.version == 1
+
+
+def test_counters():
+    "Test merging counters of worker processes."
+
+    counters = Counters(('responses', 'errors'), 3)
+    counters.set(0, {'responses': 2})
+    counters.set(2, {'responses': 3, 'errors': 1})
+    assert counters.per_worker()[1] == {'responses': 0, 'errors': 0}
+    assert counters.merged() == {'responses': 5, 'errors': 1}
+
+
+def test_synchronize_controllers():
+    "Test applying shared parameters to controllers."
+
+    server = ThreadingHTTPServer(('localhost', 0), HTTPRequestHandler)
+    controller = slow_down_http_responses(server)
+    parameters = SharedParameters({'ttfb': 0.0, 't': 1.0}, {'ttfb': float, 't': float})
+    counters = Counters(('responses',), 1)
+    stopped = threading.Event()
+    thread = synchronize_controllers(parameters, [controller], counters, 0, lambda: {'responses': 7}, stopped)
+    parameters.update({'ttfb': 2.0})
+    stopped.wait(0.5)
+    stopped.set()
+    thread.join()
+    assert controller.ttfb == 2.0
+    assert not hasattr(controller, 't')
+    assert counters.merged() == {'responses': 7}
+    controller.remove()
+    server.server_close()
+
+
+def test_control_server(timeout):
+    "Test the commands of the control server."
+
+    parameters = SharedParameters({'t': 1.0, 'length': None}, {'t': float, 'length': int})
+    counters = Counters(('responses',), 2)
+    counters.set(1, {'responses': 3})
+    server = ControlServer(('localhost', 0), parameters, counters)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        with socket.create_connection(server.server_address, timeout=timeout) as control:
+            control_file = control.makefile('rw')
+
+            def command(line):
+                control_file.write(line + '\n')
+                control_file.flush()
+                return json.loads(control_file.readline())
+
+            control_file.write('\n')  # Ignored
+            assert command('get') == {'t': 1.0, 'length': None}
+            assert command('set t=2 length=1024') == {'t': 2.0, 'length': 1024}
+            assert command('set length=None') == {'t': 2.0, 'length': None}
+            assert command('stats') == {'total': {'responses': 3}, 'workers': [{'responses': 0}, {'responses': 3}]}
+            assert command('set nonexistent=1') == {'error': "Unknown parameter 'nonexistent'"}
+            assert 'error' in command('set t=fast')
+            assert command('reset') == {'error': "Unknown command 'reset'"}
+        assert parameters.version == 2
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+
+
+def _exit_with_index(i):
+    "Target of worker processes that exits with the index of the worker process."
+    sys.exit(i)
+
+
+def _sleep_until_interrupted(i):
+    "Target of worker processes that exits with 3 when interrupted."
+
+    try:
+        time.sleep(60)
+    except KeyboardInterrupt:
+        sys.exit(3)
+
+
+def test_run_workers(timeout):
+    "Test running and interrupting worker processes."
+
+    assert run_workers(2, _exit_with_index) == [0, 1]
+
+    interrupter = threading.Timer(timeout / 2, os.kill, (os.getpid(), signal.SIGINT))
+    interrupter.start()
+    starting_time = time.monotonic()
+    assert run_workers(2, _sleep_until_interrupted) == [3, 3]
+    assert time.monotonic() - starting_time < timeout * 2
+    interrupter.join()